@@ -1,10 +1,11 @@
 from PyQt6.QtWidgets import QApplication, QMainWindow, QTextEdit, QLineEdit, QVBoxLayout, QPushButton, QWidget, QLabel
 from PyQt6.QtGui import QKeyEvent, QTextCursor, QFont, QAction
 from PyQt6.QtCore import Qt, QThread, pyqtSignal
-import sys, os
+import sys, os, time
+import threading
 import configparser
 
-from bettersearch.src.pipeline import BetterSearchPipeline
+from bettersearch.src.service import QueryClient, ServiceError
 import json
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -18,32 +19,58 @@ option_to_cfg_file = {
 
 class PipelineWorker(QThread):
     """
-    Worker thread to run the pipeline setup without blocking the main UI.
+    Worker thread to run the pipeline setup without blocking the main UI. Emits progress messages while it
+    waits, and the error if the setup fails.
     """
     finished = pyqtSignal()
+    failed = pyqtSignal(str)
+    status_changed = pyqtSignal(str)
     
     def __init__(self, app, parent=None):
         super().__init__(parent)
         self.app = app
     
     def run(self):
-        self.app.get_pipeline()
+        try:
+            self.app.get_pipeline(self.status_changed.emit)
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
         self.finished.emit()
         
 class AnswerWorker(QThread):
     """
-    Worker thread to generate answers without blocking the main UI.
+    Worker thread to generate answers without blocking the main UI. Emits pipeline stages and
+    answer tokens as they are produced, and the complete answer (or the error) at the end.
     """
-    answer_ready = pyqtSignal(str)
+    stage_changed = pyqtSignal(str)
+    token_ready = pyqtSignal(str)
+    answer_ready = pyqtSignal(str, bool)
+    answer_failed = pyqtSignal(str)
 
     def __init__(self, pipeline, question, parent=None):
         super().__init__(parent)
         self.pipeline = pipeline
         self.question = question
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """
+        Stop generation after the current token.
+        """
+        self.cancel_event.set()
 
     def run(self):
-        answer = self.pipeline.answer(user_question=self.question)
-        self.answer_ready.emit(answer)
+        try:
+            for event in self.pipeline.answer_stream(user_question=self.question, cancel_event=self.cancel_event):
+                if event["type"] == "stage":
+                    self.stage_changed.emit(event["stage"])
+                elif event["type"] == "token":
+                    self.token_ready.emit(event["text"])
+                elif event["type"] == "done":
+                    self.answer_ready.emit(event["answer"], event["cancelled"])
+        except Exception as e:
+            self.answer_failed.emit(f"Something went wrong while answering: {e}")
 
 class CustomLineEdit(QLineEdit):
     """
@@ -98,6 +125,14 @@ class BetterSearchApp(QMainWindow):
         self.layout.addWidget(self.send_button)
         self.send_button.clicked.connect(self.send_message)
 
+        # Initialize Cancel button, enabled while an answer is being generated
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.setEnabled(False)
+        self.layout.addWidget(self.cancel_button)
+        self.cancel_button.clicked.connect(self.cancel_answer)
+        self.answer_worker = None
+        self.answer_started = False
+
         # Initialize status label
         self.status_label = QLabel(self)
         self.layout.addWidget(self.status_label)
@@ -113,14 +148,20 @@ class BetterSearchApp(QMainWindow):
         self.start_pipeline_thread()
         
     def start_pipeline_thread(self):
-        if self.pipeline:
-            # Clean up old pipeline if it exists
-            del self.pipeline
-            self.pipeline = None
+        # The pipeline is kept and reconfigured, so switching compute mode only reloads the models that change
+        self.user_input.setEnabled(False)
+        self.send_button.setEnabled(False)
+        if self.answer_worker is not None and self.answer_worker.isRunning():
+            self.answer_worker.cancel()
+            self.answer_worker.wait()
+        if self.pipeline is not None:
+            self.status_label.setText("Switching compute mode...")
         
         # Start pipeline setup in a separate thread
         self.pipeline_worker = PipelineWorker(self)
         self.pipeline_worker.finished.connect(self.pipeline_ready)
+        self.pipeline_worker.failed.connect(self.pipeline_failed)
+        self.pipeline_worker.status_changed.connect(self.status_label.setText)
         self.pipeline_worker.start()
         
     def pipeline_ready(self):
@@ -129,18 +170,62 @@ class BetterSearchApp(QMainWindow):
         """
         self.status_label.setText("Pipeline is ready")
         self.append_message("BetterSearch", "I'm ready to answer your queries. What would you like to know?", "green")
+        if not getattr(self.pipeline, "retrieval_ready", True):
+            # Questions the search index cannot answer wait for the vector database to load
+            self.append_message("BetterSearch", "File contents are still loading, so questions about them may take longer to answer.", "green")
         
         # Re-enable input and send button after processing
         self.user_input.setEnabled(True)
         self.send_button.setEnabled(True)
         self.user_input.setFocus()
+    
+    def pipeline_failed(self, message):
+        """
+        Show why the pipeline could not be set up. Input stays disabled; selecting a compute mode tries again.
+        """
+        self.status_label.setText("Pipeline failed to load")
+        self.append_message("BetterSearch", message, "red")
         
-    def get_pipeline(self):
+    def get_pipeline(self, report_status=None):
         """
-        Load and configure the pipeline based on the selected compute mode.
+        Load and configure the pipeline based on the selected compute mode, or reconfigure the loaded pipeline when the
+        compute mode is switched. If the [Service] section of the settings enables it, connect to a running BetterSearch
+        service instead, which uses its own configuration.
+
+        Args:
+            report_status (Callable[[str], None]): Called with progress messages while waiting for the service.
+
+        Raises:
+            RuntimeError: If the service does not respond within the `connect_timeout` of the [Service] section.
         """
+        if self.default_config.getboolean("Service", "use_service", fallback=False):
+            host = self.default_config.get("Service", "host", fallback="127.0.0.1")
+            port = self.default_config.getint("Service", "port", fallback=8765)
+            timeout = self.default_config.getfloat("Service", "connect_timeout", fallback=300)
+            self.pipeline = QueryClient(host=host, port=port)
+            if report_status:
+                report_status(f"Waiting for the BetterSearch service at {host}:{port}...")
+            # The service starts listening once its pipeline is loaded
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    self.pipeline.health()
+                    return
+                except (OSError, ServiceError) as e:
+                    if time.monotonic() >= deadline:
+                        self.pipeline = None
+                        raise RuntimeError(f"The BetterSearch service at {host}:{port} did not respond within "
+                                           f"{timeout:.0f} seconds ({e}). Start it with 'python -m bettersearch.src.service', "
+                                           f"then select a compute mode to connect again.") from e
+                    time.sleep(2)
         with open(os.path.join(BASE_DIR, option_to_cfg_file.get(self.selected_option)), 'r') as file:
             config = json.load(file)
+        if hasattr(self.pipeline, "reconfigure"):
+            # Keeps the models, file indexer and vector database that the new compute mode does not change
+            self.pipeline.reconfigure(**config)
+            return
+        # Imported here, on the pipeline thread, so the window shows before torch and transformers are loaded
+        from bettersearch.src.pipeline import BetterSearchPipeline
         self.pipeline = BetterSearchPipeline(**config)
     
     def get_default_config(self):
@@ -228,20 +313,98 @@ class BetterSearchApp(QMainWindow):
 
             # Start the answer worker thread
             if self.pipeline:  # Ensure pipeline is not None
+                self.answer_started = False
                 self.answer_worker = AnswerWorker(self.pipeline, user_question)
+                self.answer_worker.stage_changed.connect(self.display_stage)
+                self.answer_worker.token_ready.connect(self.append_answer_token)
                 self.answer_worker.answer_ready.connect(self.display_answer)
+                self.answer_worker.answer_failed.connect(self.display_error)
                 self.status_label.setText("Pipeline is running")
+                self.cancel_button.setEnabled(True)
                 self.answer_worker.start()
             else:
                 self.append_message("BetterSearch", "Pipeline is not ready yet. Please wait.", "red")
 
-    def display_answer(self, answer):
+    def cancel_answer(self):
         """
-        Display the generated answer in the chat display.
+        Cancel the answer that is being generated.
         """
-        self.append_message("BetterSearch", answer, "green")
-        
-        # Re-enable input and send button after processing
+        if self.answer_worker is not None:
+            self.answer_worker.cancel()
+            self.cancel_button.setEnabled(False)
+            self.status_label.setText("Cancelling...")
+
+    def display_stage(self, stage):
+        """
+        Show which step of the pipeline is running.
+        """
+        stage_text = {
+            "fast_path": "Looking up file details...",
+            "sql": "Generating search query...",
+            "retrieval": "Searching your files...",
+            "answer": "Writing answer...",
+        }
+        self.status_label.setText(stage_text.get(stage, "Pipeline is running"))
+
+    def start_answer_message(self):
+        """
+        Start the BetterSearch message that answer tokens are appended to.
+        """
+        if not self.answer_started:
+            cursor = self.chat_display.textCursor()
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            cursor.insertHtml('<b style="color: green;">BetterSearch:</b><br>')
+            self.chat_display.setTextCursor(cursor)
+            self.answer_started = True
+
+    def append_answer_token(self, text):
+        """
+        Append the next piece of the answer to the chat display.
+        """
+        self.start_answer_message()
+        cursor = self.chat_display.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self.chat_display.setTextCursor(cursor)
+        self.chat_display.ensureCursorVisible()
+
+    def display_answer(self, answer, cancelled):
+        """
+        Finish the answer in the chat display. Tokens were already shown as they arrived; if none arrived
+        (e.g. the answer was cancelled early), the answer is shown as a whole.
+        """
+        if not self.answer_started:
+            self.start_answer_message()
+            self.append_answer_token(answer or ("Cancelled." if cancelled else ""))
+        elif cancelled:
+            self.append_answer_token(" [cancelled]")
+        self.end_answer_message()
+        self.answer_finished()
+
+    def display_error(self, message):
+        """
+        Show an error raised while answering, after whatever part of the answer was already shown.
+        """
+        if self.answer_started:
+            self.end_answer_message()
+        self.append_message("BetterSearch", message, "red")
+        self.answer_finished()
+
+    def end_answer_message(self):
+        """
+        Close the BetterSearch message that answer tokens were appended to.
+        """
+        cursor = self.chat_display.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertHtml('<br><br>')
+        self.chat_display.setTextCursor(cursor)
+        self.chat_display.ensureCursorVisible()
+
+    def answer_finished(self):
+        """
+        Re-enable input and send button after processing.
+        """
+        self.cancel_button.setEnabled(False)
         self.user_input.setEnabled(True)
         self.send_button.setEnabled(True)
         self.user_input.setFocus()
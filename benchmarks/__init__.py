@@ -0,0 +1,4 @@
+"""
+Benchmark scripts, run from the repository root with `python -m benchmarks.<script>`.
+Shared helpers: `benchmarks.corpus` (synthetic file corpora) and `benchmarks.stub_embedding` (model-free embeddings).
+"""
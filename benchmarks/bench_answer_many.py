@@ -0,0 +1,73 @@
+"""
+Measure the throughput of answering a list of questions with BetterSearchPipeline.answer_many (batched SQL generation,
+vector database queries and answer generation) against a sequential loop over BetterSearchPipeline.answer.
+
+The fast path is disabled unless --fast-path is given, so every question goes through the LLM.
+
+Usage:
+    python -m benchmarks.bench_answer_many --config normal_gpu_config.json
+    python -m benchmarks.bench_answer_many --config cpu_only.json --questions questions.txt --batch-sizes 2 4 8
+"""
+import json
+import time
+import argparse
+
+from bettersearch.src.pipeline.pipeline import BetterSearchPipeline
+
+QUESTIONS = [
+    "Which PDF files did I modify last week?",
+    "What are the five largest files in my Documents folder?",
+    "Find spreadsheets with budget in the name.",
+    "How many photos did I take in 2023?",
+    "Which files mention the quarterly report?",
+    "What did my lease say about pets?",
+    "Show me music files larger than 10 MB.",
+    "What are the most recently opened Word documents?",
+    "Summarize my notes about the project kickoff.",
+    "Which invoices are from 2022?",
+    "What is error code E1234 in the device manual?",
+    "List videos created before 2020.",
+    "Which documents were written by Jane Doe?",
+    "Find presentations about machine learning.",
+    "What was the total on my last electricity bill?",
+    "Which images are smaller than 100 KB?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="normal_gpu_config.json", help="BetterSearch config file.")
+    parser.add_argument("--questions", help="Text file with one question per line (default: a built-in list).")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8], help="Batch sizes of answer_many to measure.")
+    parser.add_argument("--fast-path", action="store_true", help="Keep the fast path enabled.")
+    args = parser.parse_args()
+
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions, "r", encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config["fast_path"] = args.fast_path
+    pipeline = BetterSearchPipeline(**config)
+    # Warm up
+    pipeline.answer(questions[0])
+
+    start = time.perf_counter()
+    for question in questions:
+        pipeline.answer(question)
+    sequential = time.perf_counter() - start
+    print(f"questions={len(questions)}  model={config['model_name']}")
+    print(f"sequential answer()       {sequential:8.1f} s   {len(questions) / sequential:6.3f} questions/s")
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        pipeline.answer_many(questions, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"answer_many(batch={batch_size:<3})    {elapsed:8.1f} s   {len(questions) / elapsed:6.3f} questions/s   "
+              f"speedup {sequential / elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Compare embedding throughput and parity of the torch, onnx and openvino backends on CPU.
+
+Usage:
+    python -m benchmarks.bench_embedding_backends --backends torch onnx openvino --int8
+"""
+import argparse
+import time
+
+from bettersearch.src.database.embedding_model import EmbeddingModelFunction, check_backend_parity
+from benchmarks.bench_embedding_padding import synthetic_chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-name", default="Alibaba-NLP/gte-base-en-v1.5")
+    parser.add_argument("--cache-dir", default="cache_dir/")
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "openvino"])
+    parser.add_argument("--int8", action="store_true", help="Also benchmark the int8-quantized exports.")
+    parser.add_argument("--num-chunks", type=int, default=1000)
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.num_chunks)
+    variants = [(backend, False) for backend in args.backends]
+    if args.int8:
+        variants += [(backend, True) for backend in args.backends if backend != "torch"]
+
+    for backend, quantize in variants:
+        name = f"{backend}{'-int8' if quantize else ''}"
+        embedding_fn = EmbeddingModelFunction(model_name=args.model_name, cache_dir=args.cache_dir, device="cpu",
+                                              backend=backend, quantize=quantize)
+        if embedding_fn.backend != backend:
+            print(f"{name:>14}: failed to load, skipped")
+            continue
+        # Warm up before timing
+        embedding_fn(chunks[:8])
+        start = time.perf_counter()
+        embedding_fn(chunks)
+        elapsed = time.perf_counter() - start
+
+        parity = ""
+        if backend != "torch":
+            result = check_backend_parity(args.model_name, backend=backend, quantize=quantize, cache_dir=args.cache_dir)
+            parity = f", min cosine vs torch {result['min_cosine']:.4f} ({'ok' if result['passed'] else 'FAILED'})"
+        print(f"{name:>14}: {len(chunks) / elapsed:8.1f} chunks/s{parity}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compare padded-token ratio (and optionally embedding time) of fixed-size batches against length-bucketed batches.
+
+Usage:
+    python -m benchmarks.bench_embedding_padding --num-chunks 2000 --batch-size 250 --run-model
+"""
+import argparse
+import random
+import time
+
+from bettersearch.src.database.embedding_model import EmbeddingModelFunction, length_buckets, padding_stats
+
+
+def synthetic_chunks(num_chunks, seed=0):
+    """
+    Generate chunks with a long-tailed length distribution, similar to the tail ends of split documents.
+    """
+    rng = random.Random(seed)
+    vocab = ["search", "index", "file", "vector", "query", "model", "token", "report", "invoice", "meeting", "draft", "budget"]
+    chunks = []
+    for _ in range(num_chunks):
+        num_words = max(1, min(int(rng.lognormvariate(3.5, 0.9)), 400))
+        chunks.append(" ".join(rng.choice(vocab) for _ in range(num_words)))
+    return chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-name", default="Alibaba-NLP/gte-base-en-v1.5")
+    parser.add_argument("--cache-dir", default="cache_dir/")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--num-chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=250, help="Fixed batch size of the old behaviour (chunk_batch_size).")
+    parser.add_argument("--max-tokens-per-batch", type=int, default=16384)
+    parser.add_argument("--run-model", action="store_true", help="Also time the embedding model on both batchings.")
+    args = parser.parse_args()
+
+    embedding_fn = EmbeddingModelFunction(model_name=args.model_name, cache_dir=args.cache_dir, device=args.device,
+                                          max_tokens_per_batch=args.max_tokens_per_batch)
+    chunks = synthetic_chunks(args.num_chunks)
+    lengths = [len(ids) for ids in embedding_fn._tokenizer(chunks, truncation=True)["input_ids"]]
+
+    fixed = [list(range(i, min(i + args.batch_size, len(chunks)))) for i in range(0, len(chunks), args.batch_size)]
+    bucketed = length_buckets(lengths, args.max_tokens_per_batch)
+    for name, batches in (("fixed", fixed), ("bucketed", bucketed)):
+        stats = padding_stats(lengths, batches)
+        print(f"{name:>8}: {len(batches):4d} batches, {stats['real_tokens']} real tokens, "
+              f"{stats['padded_tokens']} padded tokens, padded ratio {stats['padded_ratio']:.1%}")
+
+    if args.run_model:
+        max_tokens = embedding_fn.max_tokens_per_batch
+
+        # Old behaviour: every fixed-size batch padded to its longest chunk
+        embedding_fn.max_tokens_per_batch = float("inf")
+        start = time.perf_counter()
+        for batch in fixed:
+            # A single bucket per call reproduces padding=True over the whole batch
+            embedding_fn([chunks[i] for i in batch])
+        fixed_time = time.perf_counter() - start
+
+        embedding_fn.max_tokens_per_batch = max_tokens
+        start = time.perf_counter()
+        embedding_fn(chunks)
+        bucketed_time = time.perf_counter() - start
+
+        print(f"   fixed: {fixed_time:.2f}s ({len(chunks) / fixed_time:.1f} chunks/s)")
+        print(f"bucketed: {bucketed_time:.2f}s ({len(chunks) / bucketed_time:.1f} chunks/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Measure how many questions the rule-based fast path answers, whether it recognises them correctly, and how long
+matching and building the query take. With --execute (Windows only) the queries are also run against the Windows
+Search index, and with --compare-llm the same questions are answered through the LLM path for comparison.
+
+The labelled questions are a JSON list of {"question": ..., "intent": ...}, where "intent" is null for questions that
+must go to the LLM, or the intent fields that must match (tuples written as lists).
+
+Usage:
+    python -m benchmarks.bench_fast_path
+    python -m benchmarks.bench_fast_path --questions benchmarks/data/fast_path_questions.json --execute
+    python -m benchmarks.bench_fast_path --execute --compare-llm cpu_only.json
+"""
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+from bettersearch.src.pipeline.fast_path import match_intent, build_query, format_answer
+
+DEFAULT_QUESTIONS = Path(__file__).parent / "data" / "fast_path_questions.json"
+
+
+def is_correct(intent, expected):
+    if expected is None or intent is None:
+        return intent is None and expected is None
+    return all(
+        (list(intent[key]) if isinstance(intent[key], tuple) else intent[key]) == value
+        for key, value in expected.items()
+    )
+
+
+def percentile(timings, q):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(q * len(timings)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", default=str(DEFAULT_QUESTIONS), help="JSON file with labelled questions.")
+    parser.add_argument("--repeats", type=int, default=100, help="Number of passes over the questions for the matching latency.")
+    parser.add_argument("--execute", action="store_true", help="Run the fast path queries against the Windows Search index.")
+    parser.add_argument("--compare-llm", metavar="CONFIG", help="Also answer the fast path questions with the LLM path of this config.")
+    args = parser.parse_args()
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+
+    matched, correct, false_positives, missed, wrong = [], 0, [], [], []
+    for item in questions:
+        intent = match_intent(item["question"])
+        if intent is not None:
+            matched.append((item["question"], intent))
+        if is_correct(intent, item["intent"]):
+            correct += 1
+        elif item["intent"] is None:
+            false_positives.append(item["question"])
+        elif intent is None:
+            missed.append(item["question"])
+        else:
+            wrong.append(item["question"])
+
+    expected_matches = sum(item["intent"] is not None for item in questions)
+    print(f"questions={len(questions)}  fast path expected={expected_matches}  matched={len(matched)}  "
+          f"coverage={len(matched) / len(questions):.0%}  correct={correct}/{len(questions)}")
+    for name, items in (("false positives", false_positives), ("missed", missed), ("wrong intent", wrong)):
+        for question in items:
+            print(f"  {name}: {question}")
+
+    timings = []
+    for _ in range(args.repeats):
+        for item in questions:
+            start = time.perf_counter()
+            intent = match_intent(item["question"])
+            if intent is not None:
+                build_query(intent)
+            timings.append(time.perf_counter() - start)
+    print(f"match + build  median {statistics.median(timings) * 1e6:8.1f} us   p99 {percentile(timings, 0.99) * 1e6:8.1f} us")
+
+    if args.execute:
+        import adodbapi
+        from bettersearch.src.database.constants import WIN_CONN_STRING
+        conn = adodbapi.connect(WIN_CONN_STRING)
+        timings = []
+        for question, intent in matched:
+            start = time.perf_counter()
+            cursor = conn.cursor()
+            cursor.execute(build_query(intent))
+            answer = format_answer(intent, cursor.fetchall(), cursor.get_description())
+            timings.append(time.perf_counter() - start)
+            print(f"  {timings[-1] * 1000:8.1f} ms  {question}  ->  {answer.splitlines()[-1][:80]}")
+        conn.close()
+        if timings:
+            print(f"fast path answer  median {statistics.median(timings) * 1000:8.1f} ms   p95 {percentile(timings, 0.95) * 1000:8.1f} ms")
+
+    if args.compare_llm:
+        from bettersearch.src.pipeline.pipeline import BetterSearchPipeline
+        with open(args.compare_llm, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        config["fast_path"] = False
+        pipeline = BetterSearchPipeline(**config)
+        timings = []
+        for question, _ in matched:
+            start = time.perf_counter()
+            pipeline.answer(question)
+            timings.append(time.perf_counter() - start)
+            print(f"  {timings[-1]:8.2f} s   {question}")
+        if timings:
+            print(f"LLM answer  median {statistics.median(timings):8.2f} s   p95 {percentile(timings, 0.95):8.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Check that importing the BetterSearch packages stays fast and does not load heavy or platform-specific dependencies.
+
+Every module is imported in a fresh interpreter with `python -X importtime`. The import time of a module is the
+cumulative time of everything its import loaded, beyond what the interpreter loads at startup, and the median over
+--repeat runs is compared against the module's budget in DEFAULT_BUDGETS_MS (or --budget-ms). Importing the module must also not load any of the --forbidden
+packages, which are loaded on first use instead. Exits with status 1 if any module is over budget or loads a
+forbidden package, so it can run as a CI check.
+
+Usage:
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --budget-ms 20 --modules bettersearch bettersearch.src.database
+    python -m benchmarks.bench_import_time --output import_time.json --top 15
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+
+# Module -> import time budget in ms. The package entry points only define names; the modules below them load what
+# they need from the standard library (sqlite3, json, asyncio, http.client), but nothing heavier. For scale, torch and
+# chromadb each take a second or more to import.
+DEFAULT_BUDGETS_MS = {
+    "bettersearch": 50,
+    "bettersearch.src": 50,
+    "bettersearch.src.database": 50,
+    "bettersearch.src.pipeline": 50,
+    "bettersearch.src.database.file_indexer": 250,
+    "bettersearch.src.service": 250,
+}
+
+# Loaded on first use only: the embedding model and the LLM (torch, transformers), the vector database (chromadb),
+# the Windows Search connection (adodbapi), the text splitters and the PDF, media and image parsers
+DEFAULT_FORBIDDEN = [
+    "torch", "transformers", "chromadb", "adodbapi", "langchain_text_splitters", "pymupdf", "pymupdf4llm", "fitz",
+    "ffmpeg", "PIL", "numpy", "optimum", "openvino",
+]
+# Budget of modules that are not in DEFAULT_BUDGETS_MS
+DEFAULT_BUDGET_MS = 250
+
+
+def import_times(code):
+    """
+    Run `code` in a fresh interpreter with -X importtime.
+
+    Returns:
+        list: (name, self_us, cumulative_us, depth) of every imported module, in import order.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"'{code}' failed:\n{process.stderr}")
+    entries = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def measure(module, baseline, forbidden):
+    """
+    Import `module` once in a fresh interpreter.
+
+    Args:
+        module (str): Module to import.
+        baseline (set): Modules the interpreter imports at startup, which are not counted.
+        forbidden (list): Packages the import must not load.
+
+    Returns:
+        dict: Import time in ms, number of modules loaded, the forbidden packages that were loaded and the slowest
+            imports by self time.
+    """
+    entries = [entry for entry in import_times(f"import {module}") if entry[0] not in baseline]
+    loaded = [name for name, _, _, _ in entries]
+    return {
+        "ms": sum(cumulative for _, _, cumulative, depth in entries if depth == 0) / 1000,
+        "modules_loaded": len(loaded),
+        "forbidden_loaded": sorted({name.split(".")[0] for name in loaded if name.split(".")[0] in forbidden}),
+        "slowest": [(name, self_us / 1000) for name, self_us, _, _ in sorted(entries, key=lambda entry: -entry[1])],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=list(DEFAULT_BUDGETS_MS))
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="Maximum median import time of every module (default: the budget of each module in DEFAULT_BUDGETS_MS).")
+    parser.add_argument("--forbidden", nargs="*", default=DEFAULT_FORBIDDEN, help="Packages that must not be loaded on import.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of fresh interpreters per module.")
+    parser.add_argument("--top", type=int, default=5, help="Number of slowest imports to show per module.")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    baseline = {name for name, _, _, _ in import_times("pass")}
+    results, failed = [], False
+    for module in args.modules:
+        runs = [measure(module, baseline, set(args.forbidden)) for _ in range(args.repeat)]
+        median_ms = statistics.median(run["ms"] for run in runs)
+        budget_ms = args.budget_ms if args.budget_ms is not None else DEFAULT_BUDGETS_MS.get(module, DEFAULT_BUDGET_MS)
+        last = runs[-1]
+        ok = median_ms <= budget_ms and not last["forbidden_loaded"]
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<42} {median_ms:8.1f} ms (budget {budget_ms:.0f} ms, "
+              f"min {min(run['ms'] for run in runs):.1f} ms)  {last['modules_loaded']} modules loaded")
+        if last["forbidden_loaded"]:
+            print(f"       loads {', '.join(last['forbidden_loaded'])}")
+        for name, self_ms in last["slowest"][:args.top]:
+            print(f"       {self_ms:8.2f} ms  {name}")
+        results.append({
+            "module": module,
+            "median_ms": median_ms,
+            "budget_ms": budget_ms,
+            "runs_ms": [run["ms"] for run in runs],
+            "modules_loaded": last["modules_loaded"],
+            "forbidden_loaded": last["forbidden_loaded"],
+            "slowest": last["slowest"][:args.top],
+            "ok": ok,
+        })
+
+    if args.output:
+        # Imported here: bench_ingest loads numpy and chromadb, which this check should not need
+        from benchmarks.bench_ingest import git_commit
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({
+                "benchmark": "import_time",
+                "commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "args": vars(args),
+                "results": results,
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
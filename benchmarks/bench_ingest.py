@@ -0,0 +1,258 @@
+"""
+Measure ingest throughput end to end on a synthetic corpus (see benchmarks.corpus): files/s, chunks/s, MB/s,
+peak RSS and the time spent in each ingest stage. Unless --embedding model is given, the embedding model is replaced
+by a deterministic stub, so runs are reproducible and need no model download.
+
+Modes:
+    vector  VectorDB.update_collection on every file of the corpus.
+    linux   LinuxFileIndexer.index_folders crawling the corpus, with VectorDB.update_collection registered as a
+            callback, so the crawl, the SQLite index and the vector database are all included.
+
+Every mode runs in a fresh process, so peak RSS is per mode (parse worker processes are not included). With parse
+workers, parsing and chunking happen in the worker processes and are not broken down; "ingest.parse_wait" is the time
+the embedding side waited on them.
+
+Usage:
+    python -m benchmarks.bench_ingest --num-files 2000 --output ingest_before.json
+    python -m benchmarks.bench_ingest --num-files 2000 --config cpu_only.json --compare ingest_before.json
+    python -m benchmarks.bench_ingest --num-files 500 --embedding model --config cpu_only.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.corpus import DEFAULT_MIX, generate_corpus, parse_mix, describe
+from benchmarks.stub_embedding import STUB_EMBEDDINGS
+
+# Pipeline config keys that are named differently in VectorDB
+CONFIG_TO_VECTOR_DB = {
+    "embd_model_device": "device",
+    "embd_model_backend": "embedding_backend",
+    "embd_model_int8": "embedding_quantize",
+}
+
+
+def vector_db_kwargs(config, args, vector_db_path):
+    """
+    VectorDB arguments from a pipeline config file, with the embedding stub and command line overrides applied.
+    """
+    kwargs = {CONFIG_TO_VECTOR_DB.get(key, key): value for key, value in config.items()}
+    kwargs["vector_db_path"] = vector_db_path
+    if args.embedding != "model":
+        kwargs["embedding_function"] = STUB_EMBEDDINGS[args.embedding](dim=args.dim, seconds_per_chunk=args.stub_seconds_per_chunk)
+    for key in ("num_parse_workers", "chunk_batch_size", "embedding_cache_size"):
+        if getattr(args, key) is not None:
+            kwargs[key] = getattr(args, key)
+    return kwargs
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process in MiB, or None where the resource module is not available (Windows).
+    Parse workers are not included: forked children report the pages they share with their parent as their own.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024) / 2**20
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_times(summary, elapsed):
+    """
+    Total time, count and latency percentiles of each recorded stage. "share" is the stage's total time over the run's
+    wall time; stages that overlap (e.g. parse workers and embedding) can add up to more than 1.
+    """
+    return {
+        name: {
+            "count": stats["count"],
+            "total_s": stats["total_ms"] / 1000,
+            "share": stats["total_ms"] / 1000 / elapsed,
+            "p50_ms": stats["duration_ms"]["p50"],
+            "p95_ms": stats["duration_ms"]["p95"],
+        }
+        for name, stats in sorted(summary.items())
+    }
+
+
+def run_mode(mode, records, corpus_root, config, args):
+    """
+    Ingest the corpus into a fresh vector database (and SQLite index in "linux" mode). Runs in its own process.
+    """
+    from bettersearch.src import tracing
+    from bettersearch.src.database.file_indexer import VectorDB, LinuxFileIndexer
+
+    tracing.enable()
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        vector_db = VectorDB(**vector_db_kwargs(config, args, os.path.join(workdir, "vector_db")))
+        rss_after_init = peak_rss_mb()
+
+        def update_collection(changes):
+            with tracing.span("vector_db.update_collection", files=len(changes)):
+                vector_db.update_collection(changes)
+
+        indexer = None
+        tracing.reset()
+        start = time.perf_counter()
+        if mode == "vector":
+            update_collection([
+                {"ChangeType": "Added", "path": record['path'], "date_modified": record['date_modified']} for record in records
+            ])
+        else:
+            config_file = os.path.join(workdir, "config.json")
+            with open(config_file, "w", encoding="utf-8") as f:
+                json.dump({"index_folders": corpus_root}, f)
+            indexer = LinuxFileIndexer(db_name=os.path.join(workdir, "index.db"), config_file=config_file,
+                                       log_file=os.path.join(workdir, "indexer.log"))
+
+            def update_index(changes):
+                with tracing.span("linux_index.update_index", files=len(changes)):
+                    indexer.update_index(changes)
+
+            indexer.callbacks = [update_index, update_collection]
+            with tracing.span("linux_index.index_folders"):
+                indexer.index_folders(full=True)
+        elapsed = time.perf_counter() - start
+
+        num_chunks = vector_db.collection.count()
+        summary = tracing.summary()
+        if indexer is not None:
+            indexer.close()
+        for store in (vector_db.lexical_index, vector_db.manifest, vector_db.embedding_cache):
+            if store is not None:
+                store.close()
+
+    num_bytes = sum(record['file_size'] for record in records)
+    return {
+        "mode": mode,
+        "files": len(records),
+        "chunks": num_chunks,
+        "bytes": num_bytes,
+        "seconds": elapsed,
+        "files_per_s": len(records) / elapsed,
+        "chunks_per_s": num_chunks / elapsed,
+        "mb_per_s": num_bytes / 1e6 / elapsed,
+        "peak_rss_after_init_mb": rss_after_init,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": stage_times(summary, elapsed),
+    }
+
+
+def run_isolated(*args):
+    # spawn, so every mode starts from an empty process and peak RSS is its own
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_mode, *args).result()
+
+
+def print_run(run):
+    rss = f"{run['peak_rss_mb']:.0f} MiB ({run['peak_rss_after_init_mb']:.0f} MiB after init)" if run["peak_rss_mb"] else "n/a"
+    print(f"{run['mode']:>7}: {run['files']} files, {run['chunks']} chunks in {run['seconds']:.1f}s  "
+          f"{run['files_per_s']:8.1f} files/s {run['chunks_per_s']:9.1f} chunks/s {run['mb_per_s']:7.2f} MB/s  peak RSS {rss}")
+    for name, stage in run["stages"].items():
+        print(f"         {name:<32} {stage['total_s']:8.2f}s ({stage['share']:6.1%})  n={stage['count']:<7} "
+              f"p50 {stage['p50_ms']:8.2f} ms  p95 {stage['p95_ms']:8.2f} ms")
+
+
+def compare(previous, result):
+    """
+    Print the change of every throughput number and stage time against an earlier result.
+    """
+    print(f"\nCompared to {previous.get('commit')} ({previous.get('timestamp')}):")
+    if previous.get("corpus", {}).get("files") != result["corpus"]["files"] or previous.get("args", {}).get("seed") != result["args"]["seed"]:
+        print("  Warning: the corpora differ, numbers are not directly comparable")
+    previous_runs = {run["mode"]: run for run in previous.get("runs", [])}
+    for run in result["runs"]:
+        old = previous_runs.get(run["mode"])
+        if old is None:
+            continue
+        for key in ("files_per_s", "chunks_per_s", "mb_per_s"):
+            print(f"{run['mode']:>7}: {key:<32} {old[key]:10.2f} -> {run[key]:10.2f} ({run[key] / old[key] - 1:+.1%})")
+        if old.get("peak_rss_mb") and run.get("peak_rss_mb"):
+            print(f"{run['mode']:>7}: {'peak_rss_mb':<32} {old['peak_rss_mb']:10.0f} -> {run['peak_rss_mb']:10.0f} "
+                  f"({run['peak_rss_mb'] / old['peak_rss_mb'] - 1:+.1%})")
+        for name, stage in run["stages"].items():
+            if name in old["stages"] and old["stages"][name]["total_s"] > 0:
+                before, after = old["stages"][name]["total_s"], stage["total_s"]
+                print(f"{run['mode']:>7}: {name:<32} {before:9.2f}s -> {after:9.2f}s ({after / before - 1:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--num-files", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", nargs="+", default=[f"{ext}={share}" for ext, share in DEFAULT_MIX.items()],
+                        help="Share of each file type, as .ext=share.")
+    parser.add_argument("--corpus-dir", default=None, help="Keep the corpus here and reuse it across runs (default: a temporary directory).")
+    parser.add_argument("--workdir", default=None, help="Directory for the temporary databases.")
+    parser.add_argument("--modes", nargs="+", choices=["vector", "linux"], default=["vector", "linux"])
+    parser.add_argument("--config", default=None, help="BetterSearch config file with the VectorDB settings (default: VectorDB defaults).")
+    parser.add_argument("--embedding", choices=list(STUB_EMBEDDINGS) + ["model"], default="hash",
+                        help="Embedding stub, or 'model' for the embedding model of the config.")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensions of the embedding stub.")
+    parser.add_argument("--stub-seconds-per-chunk", type=float, default=0.0, help="Simulated embedding cost of the stub.")
+    parser.add_argument("--num-parse-workers", type=int, default=None)
+    parser.add_argument("--chunk-batch-size", type=int, default=None)
+    parser.add_argument("--embedding-cache-size", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", default=None, help="Earlier results (JSON) to compare against.")
+    args = parser.parse_args()
+
+    config = {}
+    if args.config:
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = json.load(f)
+
+    with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+        corpus_root = os.path.abspath(args.corpus_dir or os.path.join(tmp, "corpus"))
+        start = time.perf_counter()
+        records = generate_corpus(corpus_root, args.num_files, seed=args.seed, mix=parse_mix(args.mix))
+        corpus = describe(records)
+        print(f"Corpus: {corpus['files']} files, {corpus['bytes'] / 1e6:.1f} MB in {corpus_root} "
+              f"({time.perf_counter() - start:.1f}s) " + ", ".join(f"{ext}: {stats['files']}" for ext, stats in corpus["by_type"].items()))
+
+        runs = []
+        for mode in args.modes:
+            run = run_isolated(mode, records, corpus_root, config, args)
+            print_run(run)
+            runs.append(run)
+
+    result = {
+        "benchmark": "ingest",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "config": config,
+        "corpus": corpus,
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Measure files/s of the LinuxFileIndexer batch write path (add_files / update_files / delete_files) on synthetic files.
+Contents are passed in directly, so only SQLite is measured, not parsing.
+
+The baseline writes one file per transaction in rollback-journal mode, like the indexer used to.
+
+Usage:
+    python -m benchmarks.bench_linux_ingest --sizes 10000 100000 1000000 --baseline 5000
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+from bettersearch.src.database import constants
+from bettersearch.src.database.file_indexer import LinuxFileIndexer
+
+
+def synthetic_files(num_files, seed=0):
+    """
+    Generate stat records (as produced by DirectoryCrawler) and text contents for files that do not exist on disk.
+    """
+    rng = random.Random(seed)
+    words = ["search", "index", "file", "vector", "query", "report", "invoice", "meeting", "draft", "budget"]
+    now = time.time()
+    records, contents = [], []
+    for i in range(num_files):
+        name = f"file_{i}.txt"
+        mtime = now - rng.uniform(0, 365 * 24 * 3600)
+        records.append({
+            'path': f"/synthetic/dir_{i // 1000}/{name}",
+            'file_name': name,
+            'file_size': rng.randint(100, 100000),
+            'date_created': mtime,
+            'date_modified': mtime,
+            'date_accessed': now,
+        })
+        contents.append(" ".join(rng.choice(words) for _ in range(rng.randint(20, 200))))
+    return records, contents
+
+
+def baseline_per_file(db_path, records, contents):
+    """
+    One transaction and commit per file with the default rollback journal, as LinuxFileIndexer.add_file used to do.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA foreign_keys = 1")
+    conn.executescript(f"{constants.file_metadata_create}; {constants.content_index_create};")
+    start = time.perf_counter()
+    for record, content in zip(records, contents):
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT OR IGNORE INTO file_metadata(file_path, file_name, file_size, date_created, date_modified, date_accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (record['path'], record['file_name'], record['file_size'], record['date_created'], record['date_modified'], record['date_accessed'])
+            )
+            cursor.execute("INSERT OR REPLACE INTO content_index(file_id, content) VALUES (?, ?)", (cursor.lastrowid, content))
+            conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def run_batched(workdir, records, contents, batch_size):
+    """
+    Time add_files, update_files and delete_files on a fresh index.
+    """
+    config_file = os.path.join(workdir, "config.json")
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump({'index_folders': workdir}, f)
+    indexer = LinuxFileIndexer(db_name=os.path.join(workdir, "index.db"), config_file=config_file,
+                               log_file=os.path.join(workdir, "indexer.log"), ingest_batch_size=batch_size)
+    timings = {}
+    try:
+        start = time.perf_counter()
+        indexer.add_files(records, contents=contents)
+        timings['add'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexer.update_files(records, contents=contents)
+        timings['update'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        indexer.delete_files([record['path'] for record in records])
+        timings['delete'] = time.perf_counter() - start
+    finally:
+        indexer.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--baseline", type=int, default=5000, help="Number of files for the per-file baseline, 0 to skip.")
+    args = parser.parse_args()
+
+    if args.baseline:
+        records, contents = synthetic_files(args.baseline)
+        with tempfile.TemporaryDirectory() as workdir:
+            elapsed = baseline_per_file(os.path.join(workdir, "baseline.db"), records, contents)
+        print(f"baseline  files={args.baseline:>8}  add {args.baseline / elapsed:>10.0f} files/s")
+
+    for size in args.sizes:
+        records, contents = synthetic_files(size)
+        with tempfile.TemporaryDirectory() as workdir:
+            timings = run_batched(workdir, records, contents, args.batch_size)
+        print(f"batched   files={size:>8}  " + "  ".join(f"{stage} {size / elapsed:>10.0f} files/s" for stage, elapsed in timings.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Measure how retrieval latency, throughput, memory and recall change as the `file-content` collection grows.
+
+Embeddings (synthetic, or precomputed with --embeddings) are bulk-loaded into a fresh VectorDB, growing it scale by
+scale. At every scale:
+    ann               Chroma's HNSW query with the query embeddings: p50/p99 latency for each --top-k, and recall@k
+                      against exact brute-force search.
+    dense/lexical/hybrid
+                      VectorDB.query_collection end to end in each retrieval mode: p50/p99 latency for each --top-k.
+    qps               Queries per second with --concurrency threads querying at once, for ann and every mode.
+    memory            RSS of the process and size of the database on disk.
+Every --hnsw setting gets its own database in a fresh process. The results (--output) give a scaling curve that can be
+compared against an earlier run (--compare), e.g. from the previous release.
+
+Synthetic embeddings are unit vectors scattered around fixed cluster centres, and the text of every chunk contains
+topic words of its cluster, so dense and keyword retrieval find the same chunks. Queries are noisy copies of chunks.
+
+Usage:
+    python -m benchmarks.bench_retrieval --scales 10000 100000 --output retrieval.json
+    python -m benchmarks.bench_retrieval --scales 10000 100000 1000000 --hnsw default M=32,construction_ef=200,search_ef=100
+    python -m benchmarks.bench_retrieval --embeddings chunks.npy --queries queries.npy --scales 50000 --compare retrieval.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction, Documents, Embeddings
+
+from benchmarks.corpus import TextGenerator, COMMON_WORDS
+from benchmarks.bench_ingest import git_commit
+
+BLOCK_SIZE = 10000
+# Chunks per collection.add call, below Chroma's maximum batch size
+LOAD_BATCH_SIZE = 5000
+MODES = ["dense", "lexical", "hybrid"]
+
+
+def normalize(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+class SyntheticEmbeddings:
+    def __init__(self, dim: int = 768, num_clusters: int = 1000, spread: float = 0.8, seed: int = 0):
+        """
+        Chunks scattered around `num_clusters` random unit vectors. Chunk `i` is the same for every scale and run.
+
+        Args:
+            dim (int): Number of dimensions.
+            num_clusters (int): Number of clusters (topics).
+            spread (float): Norm of the noise added to the cluster centre, before normalizing.
+            seed (int): Random seed.
+        """
+        self.dim = dim
+        self.spread = spread
+        self.seed = seed
+        rng = np.random.default_rng([seed, 0])
+        self.centres = normalize(rng.standard_normal((num_clusters, dim))).astype(np.float32)
+        self.text_generator = TextGenerator()
+        topic_words = self.text_generator.vocabulary[len(COMMON_WORDS):]
+        self.topics = [[topic_words[j] for j in rng.choice(len(topic_words), 3, replace=False)] for _ in range(num_clusters)]
+
+    def block(self, index):
+        """
+        Embeddings and texts of chunks [index * BLOCK_SIZE, (index + 1) * BLOCK_SIZE).
+        """
+        rng = np.random.default_rng([self.seed, 1, index])
+        clusters = rng.integers(0, len(self.centres), size=BLOCK_SIZE)
+        noise = rng.standard_normal((BLOCK_SIZE, self.dim)).astype(np.float32) * (self.spread / np.sqrt(self.dim))
+        vectors = normalize(self.centres[clusters] + noise).astype(np.float32)
+        text_rng = random.Random(f"{self.seed}:{index}")
+        texts = [" ".join(self.topics[cluster] + self.text_generator.words(text_rng, 20)) for cluster in clusters]
+        return vectors, texts
+
+    def queries(self, num_queries, max_index, noise=0.5):
+        """
+        Noisy copies of random chunks below `max_index`, with the topic words of the chunk and a few other words.
+        """
+        rng = np.random.default_rng([self.seed, 2])
+        sources = rng.integers(0, max_index, size=num_queries)
+        vectors, texts = [], []
+        text_rng = random.Random(f"{self.seed}:queries")
+        for source in sources:
+            block_vectors, block_texts = self.block(source // BLOCK_SIZE)
+            vector = block_vectors[source % BLOCK_SIZE] + rng.standard_normal(self.dim).astype(np.float32) * (noise / np.sqrt(self.dim))
+            vectors.append(vector / np.linalg.norm(vector))
+            texts.append(" ".join(block_texts[source % BLOCK_SIZE].split()[:3] + self.text_generator.words(text_rng, 2)))
+        return np.stack(vectors).astype(np.float32), texts
+
+
+class PrecomputedEmbeddings:
+    def __init__(self, embeddings_path: str, queries_path: str = None, seed: int = 0):
+        """
+        Chunk embeddings from a .npy file (memory-mapped, so it may be larger than RAM), with random chunk texts.
+
+        Args:
+            embeddings_path (str): (num_chunks, dim) array of chunk embeddings.
+            queries_path (str): (num_queries, dim) array of query embeddings. Noisy copies of chunks if None.
+            seed (int): Random seed of the texts and of the sampled queries.
+        """
+        self.embeddings = np.load(embeddings_path, mmap_mode="r")
+        self.query_embeddings = np.load(queries_path) if queries_path else None
+        self.dim = self.embeddings.shape[1]
+        self.seed = seed
+        self.text_generator = TextGenerator()
+
+    def block(self, index):
+        vectors = np.asarray(self.embeddings[index * BLOCK_SIZE:(index + 1) * BLOCK_SIZE], dtype=np.float32)
+        text_rng = random.Random(f"{self.seed}:{index}")
+        return vectors, [" ".join(self.text_generator.words(text_rng, 23)) for _ in range(len(vectors))]
+
+    def queries(self, num_queries, max_index, noise=0.5):
+        text_rng = random.Random(f"{self.seed}:queries")
+        if self.query_embeddings is not None:
+            vectors = self.query_embeddings[:num_queries].astype(np.float32)
+        else:
+            rng = np.random.default_rng([self.seed, 2])
+            sources = np.asarray(self.embeddings[np.sort(rng.integers(0, max_index, size=num_queries))], dtype=np.float32)
+            scale = np.linalg.norm(sources, axis=1, keepdims=True) * (noise / np.sqrt(self.dim))
+            vectors = sources + rng.standard_normal(sources.shape).astype(np.float32) * scale
+        return vectors, [" ".join(self.text_generator.words(text_rng, 5)) for _ in range(len(vectors))]
+
+
+class QueryEmbeddingFunction(EmbeddingFunction[Documents]):
+    def __init__(self, texts, vectors):
+        """
+        Embed the benchmark queries with their precomputed vectors, so `query_collection` can be timed end to end
+        without an embedding model.
+        """
+        self.vectors = {text: vector for text, vector in zip(texts, vectors.tolist())}
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return [self.vectors[text] for text in input]
+
+
+class ExactSearch:
+    def __init__(self, queries, k, space="l2"):
+        """
+        Exact top-k search by brute force, updated incrementally as chunks are added.
+
+        Args:
+            queries (np.ndarray): (num_queries, dim) query embeddings.
+            k (int): Number of neighbours to keep.
+            space (str): Distance of the collection ('l2', 'ip' or 'cosine'), as in Chroma's "hnsw:space".
+        """
+        self.queries = queries
+        self.k = k
+        self.space = space
+        self.ids = np.zeros((len(queries), 0), dtype=np.int64)
+        self.distances = np.zeros((len(queries), 0), dtype=np.float32)
+
+    def add(self, vectors, start):
+        scores = vectors @ self.queries.T
+        if self.space == "l2":
+            # Same order as the squared distance, the query norm is the same for every chunk
+            distances = (np.einsum("ij,ij->i", vectors, vectors)[:, None] - 2 * scores).T
+        elif self.space == "cosine":
+            distances = -(scores / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)[:, None]).T
+        else:
+            distances = -scores.T
+        ids = np.broadcast_to(np.arange(start, start + len(vectors)), distances.shape)
+        distances = np.concatenate([self.distances, distances], axis=1)
+        ids = np.concatenate([self.ids, ids], axis=1)
+        k = min(self.k, distances.shape[1])
+        best = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        self.distances = np.take_along_axis(distances, best, axis=1)
+        self.ids = np.take_along_axis(ids, best, axis=1)
+        order = np.argsort(self.distances, axis=1)
+        self.distances = np.take_along_axis(self.distances, order, axis=1)
+        self.ids = np.take_along_axis(self.ids, order, axis=1)
+
+    def recall(self, results, k):
+        """
+        Mean recall@k of approximate results (one list of chunk indices per query).
+        """
+        return float(np.mean([len(set(result[:k]) & set(exact[:k].tolist())) / min(k, len(exact)) for result, exact in zip(results, self.ids)]))
+
+
+def parse_hnsw(spec):
+    """
+    Parse an HNSW setting such as "M=32,construction_ef=200,search_ef=100" ("default" for Chroma's defaults).
+    """
+    if spec == "default":
+        return {}
+    config = {}
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        config[key.strip()] = int(value) if value.strip().isdigit() else value.strip()
+    return config
+
+
+def current_rss_mb():
+    """
+    Current resident set size of this process in MiB. Falls back to the peak RSS where /proc is not available,
+    and to None on Windows.
+    """
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024) / 2**20
+
+
+def disk_size_mb(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names) / 2**20
+
+
+def latency_stats(latencies):
+    latencies = sorted(latencies)
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return {"p50_ms": percentile(0.50), "p99_ms": percentile(0.99), "mean_ms": sum(latencies) / len(latencies) * 1000}
+
+
+def timed(fn, items):
+    latencies, results = [], []
+    for item in items:
+        start = time.perf_counter()
+        results.append(fn(item))
+        latencies.append(time.perf_counter() - start)
+    return latencies, results
+
+
+def measure_qps(fn, items, concurrency):
+    """
+    Run `fn` on every item from `concurrency` threads.
+
+    Returns:
+        dict: Queries per second and latency percentiles under that load.
+    """
+    def run(item):
+        start = time.perf_counter()
+        fn(item)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(run, items))
+        elapsed = time.perf_counter() - start
+    return {"qps": len(items) / elapsed, **latency_stats(latencies)}
+
+
+def run_config(hnsw_spec, args):
+    """
+    Build a database with one HNSW setting, growing it through every scale. Runs in its own process.
+    """
+    from bettersearch.src.database.file_indexer import VectorDB
+
+    if args.embeddings:
+        source = PrecomputedEmbeddings(args.embeddings, args.queries, seed=args.seed)
+    else:
+        source = SyntheticEmbeddings(dim=args.dim, num_clusters=args.num_clusters, spread=args.spread, seed=args.seed)
+    scales = sorted(args.scales)
+    query_vectors, query_texts = source.queries(args.num_queries, scales[0])
+    query_ids = list(range(len(query_texts)))
+    hnsw_config = parse_hnsw(hnsw_spec)
+    exact = ExactSearch(query_vectors, max(args.top_k), space=hnsw_config.get("space", "l2"))
+
+    results = []
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        vector_db_path = os.path.join(workdir, "vector_db")
+        vector_db = VectorDB(vector_db_path=vector_db_path, embedding_function=QueryEmbeddingFunction(query_texts, query_vectors),
+                             embedding_cache_size=0, hnsw_config=hnsw_config, hybrid_num_candidates=args.hybrid_num_candidates)
+        collection = vector_db.collection
+        batch_size = LOAD_BATCH_SIZE
+        loaded = 0
+        for scale in scales:
+            # Grow the collection to `scale` chunks
+            load_times = {"dense_s": 0.0, "lexical_s": 0.0}
+            for block_index in range(loaded // BLOCK_SIZE, (scale + BLOCK_SIZE - 1) // BLOCK_SIZE):
+                vectors, texts = source.block(block_index)
+                block_start = block_index * BLOCK_SIZE
+                begin, end = max(loaded - block_start, 0), min(scale - block_start, len(vectors))
+                if end <= begin:
+                    continue
+                vectors, texts = vectors[begin:end], texts[begin:end]
+                start = block_start + begin
+                exact.add(vectors, start)
+                for i in range(0, len(vectors), batch_size):
+                    indices = range(start + i, start + min(i + batch_size, len(vectors)))
+                    ids = [f"chunk_{j}" for j in indices]
+                    paths = [f"/synthetic/doc_{j // 20}.txt" for j in indices]
+                    metadatas = [{"path": path, "chunk_index": j % 20} for j, path in zip(indices, paths)]
+                    embeddings = vectors[i:i+batch_size].tolist()
+                    load_start = time.perf_counter()
+                    collection.add(ids=ids, embeddings=embeddings, documents=texts[i:i+batch_size], metadatas=metadatas)
+                    load_times["dense_s"] += time.perf_counter() - load_start
+                    load_start = time.perf_counter()
+                    vector_db.lexical_index.upsert_many(ids, texts[i:i+batch_size], paths)
+                    load_times["lexical_s"] += time.perf_counter() - load_start
+            num_added = scale - loaded
+            loaded = scale
+            if collection.count() != scale:
+                print(f"Warning: the collection has {collection.count()} chunks, expected {scale}")
+
+            result = {
+                "hnsw": hnsw_spec,
+                "scale": scale,
+                "load": {**load_times, "chunks_per_s": num_added / max(load_times["dense_s"] + load_times["lexical_s"], 1e-9)},
+                "memory": {"rss_mb": current_rss_mb(), "disk_mb": disk_size_mb(vector_db_path)},
+                "ann": {},
+                "modes": {mode: {} for mode in args.modes},
+                "qps": {},
+            }
+
+            def ann_query(i, k):
+                return collection.query(query_embeddings=[query_vectors[i].tolist()], n_results=k, include=["distances"])
+
+            # Warm up, the first queries after loading also load the index files
+            for i in query_ids[:10]:
+                ann_query(i, max(args.top_k))
+            for k in args.top_k:
+                latencies, answers = timed(lambda i: ann_query(i, k), query_ids)
+                found = [[int(id.rsplit("_", 1)[1]) for id in answer["ids"][0]] for answer in answers]
+                result["ann"][k] = {**latency_stats(latencies), "recall": exact.recall(found, k)}
+
+            for mode in args.modes:
+                vector_db.retrieval_mode = mode
+                for k in args.top_k:
+                    vector_db.top_k = k
+                    latencies, _ = timed(lambda i: vector_db.query_collection(query_texts[i]), query_ids)
+                    result["modes"][mode][k] = latency_stats(latencies)
+
+            # Throughput at the default top_k of VectorDB
+            vector_db.top_k = args.qps_top_k
+            for concurrency in args.concurrency:
+                items = (query_ids * (args.qps_queries // len(query_ids) + 1))[:args.qps_queries]
+                result["qps"].setdefault("ann", {})[concurrency] = measure_qps(lambda i: ann_query(i, args.qps_top_k), items, concurrency)
+                for mode in args.modes:
+                    vector_db.retrieval_mode = mode
+                    result["qps"].setdefault(mode, {})[concurrency] = measure_qps(
+                        lambda i: vector_db.query_collection(query_texts[i]), items, concurrency
+                    )
+            print_result(result)
+            results.append(result)
+
+        vector_db.lexical_index.close()
+        vector_db.manifest.close()
+    return results
+
+
+def run_isolated(*args):
+    # spawn, so the memory of one database does not count towards the next one
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_config, *args).result()
+
+
+def print_result(result):
+    memory = result["memory"]
+    rss = f"{memory['rss_mb']:.0f} MiB" if memory["rss_mb"] is not None else "n/a"
+    print(f"[{result['hnsw']}] {result['scale']} chunks: loaded at {result['load']['chunks_per_s']:.0f} chunks/s, "
+          f"RSS {rss}, {memory['disk_mb']:.0f} MiB on disk")
+    for k, stats in result["ann"].items():
+        print(f"    ann      top_k={k:<3} p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms  recall@{k} {stats['recall']:.3f}")
+    for mode, by_k in result["modes"].items():
+        for k, stats in by_k.items():
+            print(f"    {mode:<8} top_k={k:<3} p50 {stats['p50_ms']:7.2f} ms  p99 {stats['p99_ms']:7.2f} ms")
+    for mode, by_concurrency in result["qps"].items():
+        print(f"    {mode:<8} QPS " + "  ".join(f"x{concurrency}: {stats['qps']:8.1f}" for concurrency, stats in by_concurrency.items()))
+
+
+def print_curve(results, top_k):
+    """
+    Print one line per scale and HNSW setting: the scaling curve.
+    """
+    width = max(len(result["hnsw"]) for result in results)
+    print(f"\nScaling curve (top_k={top_k}):")
+    print(f"{'hnsw':<{width}} {'chunks':>9} {'ann p50':>9} {'ann p99':>9} {'recall':>7} " + " ".join(f"{mode + ' p99':>12}" for mode in results[0]["modes"]))
+    for result in results:
+        ann = result["ann"][top_k]
+        print(f"{result['hnsw']:<{width}} {result['scale']:>9} {ann['p50_ms']:>9.2f} {ann['p99_ms']:>9.2f} {ann['recall']:>7.3f} "
+              + " ".join(f"{by_k[top_k]['p99_ms']:>12.2f}" for by_k in result["modes"].values()))
+
+
+def compare(previous, results, top_k):
+    """
+    Print the change of latency, recall and QPS against an earlier result, for every scale and HNSW setting in both.
+    """
+    print(f"\nCompared to {previous.get('commit')} ({previous.get('timestamp')}):")
+    # JSON turns the top_k and concurrency keys into strings
+    old_results = {(result["hnsw"], result["scale"]): result for result in previous.get("results", [])}
+    for result in results:
+        old = old_results.get((result["hnsw"], result["scale"]))
+        if old is None:
+            continue
+        label = f"[{result['hnsw']}] {result['scale']:>9}"
+        new_ann, old_ann = result["ann"].get(top_k), old["ann"].get(str(top_k))
+        if new_ann and old_ann:
+            print(f"{label} ann      p99 {old_ann['p99_ms']:8.2f} -> {new_ann['p99_ms']:8.2f} ms ({new_ann['p99_ms'] / old_ann['p99_ms'] - 1:+.1%})"
+                  f"  recall {old_ann['recall']:.3f} -> {new_ann['recall']:.3f}")
+        for mode, by_k in result["modes"].items():
+            new_stats, old_stats = by_k.get(top_k), old["modes"].get(mode, {}).get(str(top_k))
+            if new_stats and old_stats:
+                print(f"{label} {mode:<8} p99 {old_stats['p99_ms']:8.2f} -> {new_stats['p99_ms']:8.2f} ms ({new_stats['p99_ms'] / old_stats['p99_ms'] - 1:+.1%})")
+        for mode, by_concurrency in result["qps"].items():
+            for concurrency, stats in by_concurrency.items():
+                old_stats = old["qps"].get(mode, {}).get(str(concurrency))
+                if old_stats:
+                    print(f"{label} {mode:<8} QPS x{concurrency} {old_stats['qps']:8.1f} -> {stats['qps']:8.1f} ({stats['qps'] / old_stats['qps'] - 1:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", type=int, nargs="+", default=[10000, 100000], help="Collection sizes, in chunks.")
+    parser.add_argument("--hnsw", nargs="+", default=["default"],
+                        help="HNSW settings to compare, e.g. M=32,construction_ef=200,search_ef=100 ('default': Chroma's defaults).")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES, help="Retrieval modes timed end to end.")
+    parser.add_argument("--num-queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--qps-top-k", type=int, default=5, help="top_k of the throughput runs.")
+    parser.add_argument("--qps-queries", type=int, default=400, help="Number of queries of every throughput run.")
+    parser.add_argument("--hybrid-num-candidates", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=768, help="Dimensions of the synthetic embeddings.")
+    parser.add_argument("--num-clusters", type=int, default=1000, help="Number of topics of the synthetic embeddings.")
+    parser.add_argument("--spread", type=float, default=0.8, help="Spread of the synthetic embeddings around their topic.")
+    parser.add_argument("--embeddings", default=None, help="Precomputed (num_chunks, dim) chunk embeddings (.npy) instead of synthetic ones.")
+    parser.add_argument("--queries", default=None, help="Precomputed (num_queries, dim) query embeddings (.npy), used with --embeddings.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Directory for the temporary databases.")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file.")
+    parser.add_argument("--compare", default=None, help="Earlier results (JSON) to compare against.")
+    args = parser.parse_args()
+
+    if args.embeddings:
+        num_chunks = np.load(args.embeddings, mmap_mode="r").shape[0]
+        if max(args.scales) > num_chunks:
+            parser.error(f"{args.embeddings} only has {num_chunks} embeddings")
+    report_k = args.qps_top_k if args.qps_top_k in args.top_k else args.top_k[0]
+
+    results = []
+    for hnsw_spec in args.hnsw:
+        results += run_isolated(hnsw_spec, args)
+    print_curve(results, report_k)
+
+    output = {
+        "benchmark": "retrieval",
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results, report_k)
+
+
+if __name__ == "__main__":
+    main()
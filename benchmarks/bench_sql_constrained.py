@@ -0,0 +1,139 @@
+"""
+Compare SQL generation with beam search against greedy decoding constrained to the Windows Search SQL grammar
+(SqlGrammarLogitsProcessor), on the rate of valid queries and on latency. Unconstrained greedy decoding is included
+as a baseline.
+
+A query is valid if, after the pipeline's usual cleanup, it is a complete statement of the grammar (or "I do not know").
+With --execute (Windows only) a valid query must also run against the Windows Search index.
+
+Usage:
+    python -m benchmarks.bench_sql_constrained --config cpu_only.json
+    python -m benchmarks.bench_sql_constrained --config normal_gpu_config.json --beams 4 --execute
+"""
+import json
+import time
+import datetime
+import argparse
+import statistics
+from pathlib import Path
+
+from transformers import LogitsProcessorList
+
+from bettersearch.src.database.constants import WIN_SYSTEMINDEX_TABLE_METADATA
+from bettersearch.src.pipeline.pipeline import BASE_DIR
+from bettersearch.src.pipeline.prefix_cache import PromptPrefixCache, split_prompt_format
+from bettersearch.src.pipeline.sql_grammar import SqlGrammar, SqlGrammarLogitsProcessor
+from bettersearch.src.pipeline.util import (
+    clean_sqlcoder_output, extract_columns_from_metadata, get_model_and_tokenizer, get_prompt_format, validate_correct_sql_query
+)
+
+TABLE_NAME = "SystemIndex"
+QUESTIONS = [
+    "Which PDF files did I modify last week?",
+    "What are the five largest files in my Documents folder?",
+    "Find spreadsheets with budget in the name.",
+    "How many photos did I take in 2023?",
+    "Which files did Jane Doe author?",
+    "Show me music files larger than 10 MB sorted by size.",
+    "What are the most recently opened Word documents?",
+    "List videos created before 2020.",
+    "Which files mention the quarterly report?",
+    "Find text files in C:\\Users\\me\\Notes that were changed today.",
+    "What is the path of my resume?",
+    "Which images are smaller than 100 KB?",
+]
+
+
+def generate_sql(model, tokenizer, prefix_cache, suffix, num_beams, grammar=None):
+    logits_processor = LogitsProcessorList([SqlGrammarLogitsProcessor(tokenizer, grammar)]) if grammar is not None else None
+    inputs = prefix_cache.generate_inputs(suffix, num_copies=num_beams)
+    start = time.perf_counter()
+    output_ids = model.generate(
+        **inputs,
+        num_return_sequences=1,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        max_new_tokens=400,
+        do_sample=False,
+        num_beams=num_beams,
+        logits_processor=logits_processor,
+    )
+    elapsed = time.perf_counter() - start
+    new_ids = output_ids[0, inputs["input_ids"].shape[-1]:]
+    return tokenizer.decode(new_ids, skip_special_tokens=True), elapsed, len(new_ids)
+
+
+def clean(sql):
+    try:
+        return validate_correct_sql_query(clean_sqlcoder_output(sql, WIN_SYSTEMINDEX_TABLE_METADATA, TABLE_NAME))
+    except Exception:
+        # Cleanup fails on empty or unparsable output
+        return sql.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="cpu_only.json", help="BetterSearch config file with the model to load.")
+    parser.add_argument("--beams", type=int, default=None, help="Number of beams of the beam search baseline (default: the config's num_beams).")
+    parser.add_argument("--execute", action="store_true", help="Also run the queries against the Windows Search index.")
+    parser.add_argument("--verbose", action="store_true", help="Print every generated query.")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    num_beams = args.beams or config.get("num_beams", 4)
+    model, tokenizer = get_model_and_tokenizer(config["model_name"], config.get("cache_dir"), None, config.get("kv_cache_flag", True))
+
+    prompt_format = get_prompt_format(Path(BASE_DIR, "sqlcoder_prompt.md"))
+    prefix, suffix_format = split_prompt_format(prompt_format, ("user_question", "date_time"), table_metadata_string=WIN_SYSTEMINDEX_TABLE_METADATA)
+    prefix_cache = PromptPrefixCache(model, tokenizer, prefix, enabled=config.get("kv_cache_flag", True))
+    grammar = SqlGrammar(extract_columns_from_metadata(WIN_SYSTEMINDEX_TABLE_METADATA), TABLE_NAME)
+
+    cursor = None
+    if args.execute:
+        import adodbapi
+        from bettersearch.src.database.constants import WIN_CONN_STRING
+        cursor = adodbapi.connect(WIN_CONN_STRING).cursor()
+
+    modes = {
+        f"beam search ({num_beams})": (num_beams, None),
+        "greedy": (1, None),
+        "greedy + grammar": (1, grammar),
+    }
+    date_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Warm up
+    generate_sql(model, tokenizer, prefix_cache, suffix_format.format(user_question=QUESTIONS[0], date_time=date_time), 1)
+
+    print(f"model={config['model_name']}  questions={len(QUESTIONS)}")
+    for name, (beams, mode_grammar) in modes.items():
+        timings, num_tokens, valid, executed, unknown = [], [], 0, 0, 0
+        for question in QUESTIONS:
+            sql, elapsed, length = generate_sql(
+                model, tokenizer, prefix_cache, suffix_format.format(user_question=question, date_time=date_time), beams, mode_grammar
+            )
+            timings.append(elapsed)
+            num_tokens.append(length)
+            sql = clean(sql)
+            is_unknown = "i do not know" in sql.lower()
+            unknown += is_unknown
+            is_valid = grammar.is_valid(sql)
+            valid += is_valid
+            if cursor is not None and is_valid and not is_unknown:
+                try:
+                    cursor.execute(sql)
+                    cursor.fetchall()
+                    executed += 1
+                except Exception:
+                    pass
+            if args.verbose:
+                print(f"  [{'ok' if is_valid else '--'}] {question}\n       {sql}")
+        line = (f"{name:<18} valid {valid}/{len(QUESTIONS)}  'I do not know' {unknown}  "
+                f"latency median {statistics.median(timings):6.2f} s  mean {statistics.mean(timings):6.2f} s  "
+                f"tokens/query {statistics.mean(num_tokens):5.1f}")
+        if cursor is not None:
+            line += f"  executed {executed}/{len(QUESTIONS) - unknown}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Measure time-to-first-token of the SQL generation step, with the full prompt prefilled on every question
+versus the prompt prefix prefilled once (PromptPrefixCache).
+
+Time-to-first-token is measured as a `generate` call with max_new_tokens=1, with the pipeline's number of beams.
+Run it once per model, e.g. with the OpenVINO model of the CPU-only config and the Hugging Face model of a GPU config.
+
+Usage:
+    python -m benchmarks.bench_sql_prefix_cache --config cpu_only.json
+    python -m benchmarks.bench_sql_prefix_cache --config normal_gpu_config.json --repeats 10
+"""
+import json
+import time
+import datetime
+import argparse
+import statistics
+from pathlib import Path
+
+from bettersearch.src.database.constants import WIN_SYSTEMINDEX_TABLE_METADATA
+from bettersearch.src.pipeline.pipeline import BASE_DIR
+from bettersearch.src.pipeline.prefix_cache import PromptPrefixCache, split_prompt_format
+from bettersearch.src.pipeline.util import get_model_and_tokenizer, get_prompt_format
+
+QUESTIONS = [
+    "Which PDF files did I modify last week?",
+    "What are the five largest files in my Documents folder?",
+    "Find spreadsheets with budget in the name.",
+    "How many photos did I take in 2023?",
+]
+
+
+def time_first_token(model, tokenizer, inputs, num_beams):
+    start = time.perf_counter()
+    model.generate(
+        **inputs,
+        max_new_tokens=1,
+        do_sample=False,
+        num_beams=num_beams,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="cpu_only.json", help="BetterSearch config file with the model to load.")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of passes over the questions.")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    num_beams = config.get("num_beams", 4)
+    # bnb_config is only used for 4/8-bit Hugging Face models, which are loaded unquantized here
+    model, tokenizer = get_model_and_tokenizer(config["model_name"], config.get("cache_dir"), None, config.get("kv_cache_flag", True))
+
+    prompt_format = get_prompt_format(Path(BASE_DIR, "sqlcoder_prompt.md"))
+    prefix, suffix_format = split_prompt_format(prompt_format, ("user_question", "date_time"), table_metadata_string=WIN_SYSTEMINDEX_TABLE_METADATA)
+
+    start = time.perf_counter()
+    prefix_cache = PromptPrefixCache(model, tokenizer, prefix, enabled=config.get("kv_cache_flag", True))
+    setup_time = time.perf_counter() - start
+    print(f"model={config['model_name']}  num_beams={num_beams}  prefix_tokens={prefix_cache.prefix_ids.shape[-1]}  "
+          f"kv_cache={'yes' if prefix_cache.key_values is not None else 'no'}  prefill_once={setup_time:.2f}s")
+
+    date_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Warm up both paths
+    time_first_token(model, tokenizer, tokenizer(prefix + suffix_format.format(user_question=QUESTIONS[0], date_time=date_time), return_tensors="pt").to(model.device), num_beams)
+    time_first_token(model, tokenizer, prefix_cache.generate_inputs(suffix_format.format(user_question=QUESTIONS[0], date_time=date_time), num_beams), num_beams)
+
+    full, cached = [], []
+    for _ in range(args.repeats):
+        for question in QUESTIONS:
+            suffix = suffix_format.format(user_question=question, date_time=date_time)
+            full.append(time_first_token(model, tokenizer, tokenizer(prefix + suffix, return_tensors="pt").to(model.device), num_beams))
+            cached.append(time_first_token(model, tokenizer, prefix_cache.generate_inputs(suffix, num_beams), num_beams))
+
+    for name, timings in (("full prompt", full), ("cached prefix", cached)):
+        print(f"{name:<14} TTFT median {statistics.median(timings) * 1000:8.1f} ms   mean {statistics.mean(timings) * 1000:8.1f} ms")
+    print(f"speedup {statistics.median(full) / statistics.median(cached):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Generate a reproducible synthetic corpus of text, markdown and PDF files for the ingest and retrieval benchmarks.
+
+File sizes follow log-normal distributions (many small files, a long tail of large ones) and words follow a Zipf
+distribution over a fixed vocabulary, so chunk lengths and keyword statistics look like real documents. Every file is
+generated from its own seed, so the same seed always produces the same contents and modified times, and a corpus of
+1000 files is the first 1000 files of a corpus of 10000.
+
+Usage:
+    python -m benchmarks.corpus --root /tmp/bettersearch_corpus --num-files 1000 --mix .txt=0.5 .md=0.3 .pdf=0.2
+"""
+import os
+import json
+import math
+import random
+import argparse
+import itertools
+
+# File type -> share of the corpus
+DEFAULT_MIX = {".txt": 0.5, ".md": 0.3, ".pdf": 0.2}
+
+# File type -> (median, sigma of the log, min, max) of the number of characters of text. PDFs are larger on disk.
+SIZE_DISTRIBUTIONS = {
+    ".txt": (4000, 1.2, 200, 2000000),
+    ".md": (6000, 1.0, 300, 500000),
+    ".pdf": (12000, 0.9, 1000, 400000),
+}
+
+VOCABULARY_SIZE = 20000
+ZIPF_EXPONENT = 1.1
+FILES_PER_DIRECTORY = 50
+DIRECTORIES_PER_DIRECTORY = 20
+PDF_PAGE_CHARS = 2500
+# Modified times are spread over the year before 2024-01-01 UTC, so they do not depend on when the corpus was generated
+REFERENCE_TIME = 1704067200
+
+# Written to the corpus root, so an existing corpus with the same parameters is reused instead of regenerated
+MANIFEST_NAME = ".corpus.json"
+
+COMMON_WORDS = [
+    "the", "of", "and", "to", "in", "a", "is", "for", "on", "that", "with", "as", "by", "this", "be", "are", "from",
+    "at", "or", "it", "report", "file", "meeting", "budget", "invoice", "project", "draft", "search", "index",
+    "notes", "team", "review", "plan", "data", "customer", "order", "schedule", "summary", "version", "update",
+]
+SYLLABLES = [
+    "ka", "lo", "mi", "ne", "ra", "ti", "su", "ve", "do", "pa", "shi", "gor", "lan", "tre", "bel", "mon", "dex",
+    "quo", "fi", "ru", "zan", "pel", "cor", "vin", "tas", "mur", "hol", "ben", "sid", "xo",
+]
+
+
+class TextGenerator:
+    def __init__(self, vocabulary_size: int = VOCABULARY_SIZE, zipf_exponent: float = ZIPF_EXPONENT):
+        """
+        Generator of random prose and markdown. Word ranks follow a Zipf distribution, the most common words
+        being English words and the rest made-up words built from syllables.
+
+        Args:
+            vocabulary_size (int): Number of distinct words.
+            zipf_exponent (float): Exponent of the Zipf distribution, higher makes common words more common.
+        """
+        words = list(COMMON_WORDS)
+        seen = set(words)
+        # All two and three syllable words in a fixed order, so the vocabulary never depends on a random state
+        for length in (2, 3, 4):
+            for parts in itertools.product(SYLLABLES, repeat=length):
+                if len(words) >= vocabulary_size:
+                    break
+                word = "".join(parts)
+                if word not in seen:
+                    seen.add(word)
+                    words.append(word)
+        self.vocabulary = words[:vocabulary_size]
+        self._cum_weights = list(itertools.accumulate(1 / (rank ** zipf_exponent) for rank in range(1, len(self.vocabulary) + 1)))
+
+    def words(self, rng: random.Random, num_words: int):
+        return rng.choices(self.vocabulary, cum_weights=self._cum_weights, k=num_words)
+
+    def sentence(self, rng: random.Random):
+        words = self.words(rng, rng.randint(5, 25))
+        return " ".join(words).capitalize() + "."
+
+    def paragraph(self, rng: random.Random, max_chars: int = 1200):
+        sentences, length = [], 0
+        target = rng.randint(min(200, max_chars), max_chars)
+        while length < target:
+            sentence = self.sentence(rng)
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        return " ".join(sentences)
+
+    def text(self, rng: random.Random, num_chars: int):
+        """
+        Plain text of about `num_chars` characters, in paragraphs separated by blank lines.
+        """
+        paragraphs, length = [], 0
+        while length < num_chars:
+            paragraph = self.paragraph(rng, max_chars=max(50, min(1200, num_chars - length)))
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        return "\n\n".join(paragraphs)
+
+    def markdown(self, rng: random.Random, num_chars: int):
+        """
+        Markdown of about `num_chars` characters: a title, then sections with paragraphs, bullet lists and code blocks.
+        """
+        blocks = [f"# {' '.join(self.words(rng, rng.randint(2, 6))).title()}"]
+        length = len(blocks[0])
+        while length < num_chars:
+            kind = rng.random()
+            if kind < 0.15:
+                block = f"## {' '.join(self.words(rng, rng.randint(2, 5))).title()}"
+            elif kind < 0.30:
+                block = "\n".join(f"- {' '.join(self.words(rng, rng.randint(3, 12)))}" for _ in range(rng.randint(2, 8)))
+            elif kind < 0.35:
+                block = "```\n" + "\n".join(f"{word} = {rng.randint(0, 1000)}" for word in self.words(rng, rng.randint(2, 10))) + "\n```"
+            else:
+                block = self.paragraph(rng, max_chars=max(50, min(1200, num_chars - length)))
+            blocks.append(block)
+            length += len(block) + 2
+        return "\n\n".join(blocks)
+
+
+def parse_mix(values):
+    """
+    Parse file type shares given as ".ext=share" strings, e.g. [".txt=0.5", ".md=0.3", ".pdf=0.2"].
+    """
+    mix = {}
+    for value in values:
+        ext, _, share = value.partition("=")
+        ext = ext if ext.startswith(".") else f".{ext}"
+        if ext not in SIZE_DISTRIBUTIONS:
+            raise ValueError(f"Unknown file type '{ext}', expected one of {list(SIZE_DISTRIBUTIONS)}")
+        mix[ext] = float(share)
+    return mix
+
+
+def file_path(root: str, index: int, ext: str):
+    """
+    Path of the `index`-th file of a corpus, FILES_PER_DIRECTORY files per directory in a two level tree.
+    """
+    directory = index // FILES_PER_DIRECTORY
+    return os.path.join(root, f"dir_{directory // DIRECTORIES_PER_DIRECTORY:04d}", f"sub_{directory % DIRECTORIES_PER_DIRECTORY:02d}", f"doc_{index:07d}{ext}")
+
+
+def write_pdf(path: str, paragraphs):
+    """
+    Write paragraphs to a PDF with PyMuPDF, starting a new page every PDF_PAGE_CHARS characters or so.
+    """
+    import pymupdf as fitz
+
+    pages, page, length = [], [], 0
+    for paragraph in paragraphs:
+        if page and length + len(paragraph) > PDF_PAGE_CHARS:
+            pages.append(page)
+            page, length = [], 0
+        page.append(paragraph)
+        length += len(paragraph) + 2
+    pages.append(page)
+
+    doc = fitz.open()
+    for page_paragraphs in pages:
+        page = doc.new_page()
+        page.insert_textbox(page.rect + (72, 72, -72, -72), "\n\n".join(page_paragraphs), fontsize=10)
+    doc.save(path, garbage=3, deflate=True)
+    doc.close()
+
+
+def generate_file(generator: TextGenerator, root: str, index: int, seed: int = 0, mix: dict = DEFAULT_MIX):
+    """
+    Generate the `index`-th file of a corpus.
+
+    Returns:
+        str: Path of the file.
+    """
+    rng = random.Random(f"{seed}:{index}")
+    ext = rng.choices(list(mix), weights=list(mix.values()))[0]
+    median, sigma, min_chars, max_chars = SIZE_DISTRIBUTIONS[ext]
+    num_chars = int(min(max(rng.lognormvariate(math.log(median), sigma), min_chars), max_chars))
+
+    path = file_path(root, index, ext)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if ext == ".pdf":
+        write_pdf(path, generator.text(rng, num_chars).split("\n\n"))
+    else:
+        content = generator.markdown(rng, num_chars) if ext == ".md" else generator.text(rng, num_chars)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+    mtime = REFERENCE_TIME - rng.uniform(0, 365 * 24 * 3600)
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def generate_corpus(root: str, num_files: int, seed: int = 0, mix: dict = DEFAULT_MIX):
+    """
+    Generate a corpus under `root`, or reuse the one already there if it was generated with the same parameters.
+
+    Args:
+        root (str): Directory to write the files to.
+        num_files (int): Number of files.
+        seed (int): Random seed.
+        mix (dict): File type -> share of the corpus, see DEFAULT_MIX.
+
+    Returns:
+        list: Stat records of the files, with the same keys as the records of `DirectoryCrawler`.
+    """
+    params = {"num_files": num_files, "seed": seed, "mix": mix}
+    manifest_path = os.path.join(root, MANIFEST_NAME)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("params") == params and all(os.path.isfile(os.path.join(root, path)) for path in manifest["paths"]):
+            return stat_records([os.path.join(root, path) for path in manifest["paths"]])
+
+    generator = TextGenerator()
+    os.makedirs(root, exist_ok=True)
+    paths = [generate_file(generator, root, i, seed=seed, mix=mix) for i in range(num_files)]
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "paths": [os.path.relpath(path, root) for path in paths]}, f)
+    return stat_records(paths)
+
+
+def stat_records(paths):
+    records = []
+    for path in paths:
+        stat = os.stat(path)
+        records.append({
+            'path': path,
+            'file_name': os.path.basename(path),
+            'file_size': stat.st_size,
+            'date_created': stat.st_ctime,
+            'date_modified': stat.st_mtime,
+            'date_accessed': stat.st_atime,
+        })
+    return records
+
+
+def describe(records):
+    """
+    Number of files and bytes of a corpus, in total and per file type.
+    """
+    by_type = {}
+    for record in records:
+        stats = by_type.setdefault(os.path.splitext(record['path'])[1], {"files": 0, "bytes": 0})
+        stats["files"] += 1
+        stats["bytes"] += record['file_size']
+    return {
+        "files": len(records),
+        "bytes": sum(record['file_size'] for record in records),
+        "by_type": by_type,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--root", required=True, help="Directory to write the corpus to.")
+    parser.add_argument("--num-files", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", nargs="+", default=[f"{ext}={share}" for ext, share in DEFAULT_MIX.items()],
+                        help="Share of each file type, as .ext=share.")
+    args = parser.parse_args()
+
+    records = generate_corpus(args.root, args.num_files, seed=args.seed, mix=parse_mix(args.mix))
+    print(json.dumps(describe(records), indent=2))
+
+
+if __name__ == "__main__":
+    main()
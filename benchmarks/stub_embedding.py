@@ -0,0 +1,66 @@
+"""
+Deterministic embedding functions that need no model download, for benchmarking ingest and retrieval without the
+embedding model. Pass one to `VectorDB(embedding_function=...)`.
+"""
+import re
+import time
+import zlib
+
+import numpy as np
+from chromadb.api.types import EmbeddingFunction, Documents, Embeddings
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashEmbeddingFunction(EmbeddingFunction[Documents]):
+    def __init__(self, dim: int = 768, seconds_per_chunk: float = 0.0):
+        """
+        Embed documents by hashing their words into a fixed number of dimensions (the "hashing trick"). The result only
+        depends on the text, so runs are reproducible across processes and machines, and documents that share words
+        are close, so retrieval results are not random.
+
+        Args:
+            dim (int): Number of dimensions. 768 matches the default embedding model.
+            seconds_per_chunk (float): Sleep this long per document, to stand in for the cost of a real model.
+        """
+        self.dim = dim
+        self.seconds_per_chunk = seconds_per_chunk
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = np.zeros((len(input), self.dim), dtype=np.float32)
+        for i, document in enumerate(input):
+            for token in TOKEN_PATTERN.findall(document.lower()):
+                # crc32 instead of hash(), which is salted per process
+                h = zlib.crc32(token.encode("utf-8"))
+                vectors[i, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms > 0, norms, 1.0)
+        if self.seconds_per_chunk:
+            time.sleep(self.seconds_per_chunk * len(input))
+        return vectors.tolist()
+
+
+class RandomEmbeddingFunction(EmbeddingFunction[Documents]):
+    def __init__(self, dim: int = 768, seconds_per_chunk: float = 0.0):
+        """
+        Embed each document as a random unit vector seeded by its text. Unrelated documents are as close as related
+        ones, so only use it where retrieval quality does not matter.
+
+        Args:
+            dim (int): Number of dimensions.
+            seconds_per_chunk (float): Sleep this long per document, to stand in for the cost of a real model.
+        """
+        self.dim = dim
+        self.seconds_per_chunk = seconds_per_chunk
+
+    def __call__(self, input: Documents) -> Embeddings:
+        vectors = []
+        for document in input:
+            vector = np.random.default_rng(zlib.crc32(document.encode("utf-8"))).standard_normal(self.dim)
+            vectors.append((vector / np.linalg.norm(vector)).tolist())
+        if self.seconds_per_chunk:
+            time.sleep(self.seconds_per_chunk * len(input))
+        return vectors
+
+
+STUB_EMBEDDINGS = {"hash": HashEmbeddingFunction, "random": RandomEmbeddingFunction}
@@ -1,2 +1,22 @@
-from .database  import WindowsFileIndexer, LinuxFileIndexer
-from .pipeline import BetterSearchPipeline
\ No newline at end of file
+import importlib
+
+# Resolved on first access, so importing the package only loads what is actually used
+_LAZY_ATTRS = {
+    "WindowsFileIndexer": ".database",
+    "LinuxFileIndexer": ".database",
+    "BetterSearchPipeline": ".pipeline",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
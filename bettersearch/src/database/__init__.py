@@ -1 +1,23 @@
-from .file_indexer import WindowsFileIndexer, LinuxFileIndexer
\ No newline at end of file
+import importlib
+
+# Public name -> submodule defining it. Resolved on first access, so `import bettersearch.src.database` does not load
+# chromadb, torch or the Windows-only adodbapi.
+_LAZY_ATTRS = {
+    "WindowsFileIndexer": ".file_indexer",
+    "LinuxFileIndexer": ".file_indexer",
+    "VectorDB": ".file_indexer",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,274 @@
+import time
+import logging
+import threading
+
+from .. import tracing
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkAccumulator:
+    def __init__(self, collection, batch_size: int = 500, flush_interval: float = 5.0, embed_fn=None, lexical_index=None):
+        """
+        Accumulate chunks from many files into full batches for the embedding model and Chroma.
+
+        Args:
+            collection (chromadb.Collection): Collection to write to.
+            batch_size (int): Number of chunks per embedding batch / `upsert` call.
+            flush_interval (float): Maximum time (in seconds) a chunk may wait in the buffer before a flush is forced.
+            embed_fn (Callable[[List[str]], List[List[float]]]): Function used to embed documents before writing.
+                If None, the collection's embedding function is used.
+            lexical_index (LexicalIndex): Keyword index kept in sync with the collection. A write only succeeds
+                if both are updated.
+        """
+        self.collection = collection
+        self.embed_fn = embed_fn
+        self.lexical_index = lexical_index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._lock = threading.RLock()
+        self._documents, self._metadatas, self._ids, self._owners = [], [], [], []
+        self._deleted_paths = []
+        self._deleted_ids = []          # (path, id)
+        self._metadata_updates = []     # (path, id, metadata)
+        self._first_pending = None
+        self.failed_paths = set()
+
+    @property
+    def pending(self):
+        """
+        Get the number of buffered chunks and deletions.
+
+        Returns:
+            int: Number of pending operations.
+        """
+        return len(self._ids) + len(self._deleted_paths) + len(self._deleted_ids) + len(self._metadata_updates)
+
+    def has_pending(self, file_path):
+        """
+        Check whether any buffered operation belongs to a file.
+
+        Args:
+            file_path (str): Path of the file.
+
+        Returns:
+            bool: True if the file has buffered chunks, deletions or metadata updates.
+        """
+        with self._lock:
+            return (
+                file_path in self._owners
+                or file_path in self._deleted_paths
+                or any(path == file_path for path, _ in self._deleted_ids)
+                or any(path == file_path for path, _, _ in self._metadata_updates)
+            )
+
+    def add(self, file_path, data):
+        """
+        Buffer the chunks of a file for upserting. Flushes when the buffer holds a full batch or the flush interval has passed.
+
+        Args:
+            file_path (str): Path of the file the chunks belong to.
+            data (dict): Documents, metadata, and IDs of the file.
+
+        Returns:
+            set: Paths of files that failed to be written, if a flush happened.
+        """
+        with self._lock:
+            self._documents.extend(data.get("documents"))
+            self._metadatas.extend(data.get("metadatas"))
+            self._ids.extend(data.get("ids"))
+            self._owners.extend([file_path] * len(data.get("ids")))
+            self._mark_pending()
+            return self.flush_if_due()
+
+    def delete(self, file_path):
+        """
+        Buffer the deletion of all chunks of a file. Operations of the file that are still buffered are dropped.
+
+        Args:
+            file_path (str): Path of the file.
+
+        Returns:
+            set: Paths of files that failed to be written, if a flush happened.
+        """
+        with self._lock:
+            keep = [i for i, owner in enumerate(self._owners) if owner != file_path]
+            if len(keep) != len(self._owners):
+                self._documents = [self._documents[i] for i in keep]
+                self._metadatas = [self._metadatas[i] for i in keep]
+                self._ids = [self._ids[i] for i in keep]
+                self._owners = [self._owners[i] for i in keep]
+            self._deleted_ids = [item for item in self._deleted_ids if item[0] != file_path]
+            self._metadata_updates = [item for item in self._metadata_updates if item[0] != file_path]
+            self._deleted_paths.append(file_path)
+            self._mark_pending()
+            return self.flush_if_due()
+
+    def delete_ids(self, file_path, ids):
+        """
+        Buffer the deletion of individual chunks of a file.
+
+        Args:
+            file_path (str): Path of the file the chunks belong to.
+            ids (list): IDs of the chunks to delete.
+
+        Returns:
+            set: Paths of files that failed to be written, if a flush happened.
+        """
+        with self._lock:
+            self._deleted_ids.extend((file_path, id) for id in ids)
+            self._mark_pending()
+            return self.flush_if_due()
+
+    def update_metadatas(self, file_path, ids, metadatas):
+        """
+        Buffer metadata-only updates of chunks of a file. The chunks are not embedded again.
+
+        Args:
+            file_path (str): Path of the file the chunks belong to.
+            ids (list): IDs of the chunks to update.
+            metadatas (list): New metadata of each chunk.
+
+        Returns:
+            set: Paths of files that failed to be written, if a flush happened.
+        """
+        with self._lock:
+            self._metadata_updates.extend((file_path, id, metadata) for id, metadata in zip(ids, metadatas))
+            self._mark_pending()
+            return self.flush_if_due()
+
+    def flush_if_due(self):
+        """
+        Flush the buffer if it holds a full batch or its oldest entry is older than the flush interval.
+
+        Returns:
+            set: Paths of files that failed to be written.
+        """
+        with self._lock:
+            if self._first_pending is not None and time.monotonic() - self._first_pending >= self.flush_interval:
+                return self.flush()
+            if self.pending >= self.batch_size:
+                return self.flush(full_batches_only=True)
+            return set()
+
+    def flush(self, full_batches_only: bool = False):
+        """
+        Write buffered deletions, metadata updates and chunks to the collection, in that order and in bulk calls.
+        If a bulk call fails, the files in it are retried one by one so the failure is attributed to the right file.
+        Failed paths are also collected in `failed_paths` until the caller clears it.
+
+        Args:
+            full_batches_only (bool): Keep a trailing partial batch of chunks buffered instead of writing it.
+
+        Returns:
+            set: Paths of files that failed to be written.
+        """
+        with self._lock:
+            num_chunks = len(self._ids)
+            if full_batches_only:
+                num_chunks -= num_chunks % self.batch_size
+            documents, metadatas, ids, owners = (
+                buffer[:num_chunks] for buffer in (self._documents, self._metadatas, self._ids, self._owners)
+            )
+            self._documents, self._metadatas, self._ids, self._owners = (
+                buffer[num_chunks:] for buffer in (self._documents, self._metadatas, self._ids, self._owners)
+            )
+            deleted_paths = list(dict.fromkeys(self._deleted_paths))
+            deleted_ids, metadata_updates = self._deleted_ids, self._metadata_updates
+            self._deleted_paths, self._deleted_ids, self._metadata_updates = [], [], []
+            self._first_pending = time.monotonic() if self._ids else None
+
+            failed = set()
+            for i in range(0, len(deleted_paths), self.batch_size):
+                paths = deleted_paths[i:i+self.batch_size]
+                failed.update(self._write_batch(
+                    paths,
+                    lambda idx: self._delete_paths([paths[j] for j in idx]),
+                ))
+
+            for i in range(0, len(deleted_ids), self.batch_size):
+                batch = deleted_ids[i:i+self.batch_size]
+                failed.update(self._write_batch(
+                    [path for path, _ in batch],
+                    lambda idx: self._delete_ids([batch[j][1] for j in idx]),
+                ))
+
+            for i in range(0, len(metadata_updates), self.batch_size):
+                batch = metadata_updates[i:i+self.batch_size]
+                failed.update(self._write_batch(
+                    [path for path, _, _ in batch],
+                    lambda idx: self.collection.update(ids=[batch[j][1] for j in idx], metadatas=[batch[j][2] for j in idx]),
+                ))
+
+            for i in range(0, len(ids), self.batch_size):
+                failed.update(self._write_batch(
+                    owners[i:i+self.batch_size],
+                    lambda idx: self._upsert(
+                        [documents[i + j] for j in idx], [metadatas[i + j] for j in idx], [ids[i + j] for j in idx]
+                    ),
+                ))
+            self.failed_paths.update(failed)
+            return failed
+
+    def _upsert(self, documents, metadatas, ids):
+        """
+        Embed and upsert a batch of chunks.
+
+        Args:
+            documents (list): Chunk texts.
+            metadatas (list): Chunk metadata.
+            ids (list): Chunk IDs.
+        """
+        if self.embed_fn is None:
+            with tracing.span("ingest.write", chunks=len(ids)):
+                self.collection.upsert(documents=documents, metadatas=metadatas, ids=ids)
+        else:
+            embeddings = self.embed_fn(documents)
+            with tracing.span("ingest.write", chunks=len(ids)):
+                self.collection.upsert(documents=documents, metadatas=metadatas, ids=ids, embeddings=embeddings)
+        if self.lexical_index is not None:
+            with tracing.span("ingest.lexical", chunks=len(ids)):
+                self.lexical_index.upsert_many(ids, documents, [metadata.get("path") for metadata in metadatas])
+
+    def _delete_paths(self, paths):
+        self.collection.delete(where={"path": {"$in": paths}})
+        if self.lexical_index is not None:
+            self.lexical_index.delete_paths(paths)
+
+    def _delete_ids(self, ids):
+        self.collection.delete(ids=ids)
+        if self.lexical_index is not None:
+            self.lexical_index.delete_ids(ids)
+
+    def _write_batch(self, owners, write_fn):
+        """
+        Write a batch in one call. If the bulk call fails, retry one file at a time so the failure
+        is attributed to the right file.
+
+        Args:
+            owners (list): Path of the file each item of the batch belongs to.
+            write_fn (Callable[[List[int]], None]): Function that writes the items at the given positions of the batch.
+
+        Returns:
+            set: Paths of files that failed to be written.
+        """
+        try:
+            write_fn(list(range(len(owners))))
+            return set()
+        except Exception:
+            pass
+        
+        failed = set()
+        for path in dict.fromkeys(owners):
+            try:
+                write_fn([j for j, owner in enumerate(owners) if owner == path])
+            except Exception as e:
+                logger.error(f"File failed: {path}")
+                logger.exception(e)
+                failed.add(path)
+        return failed
+
+    def _mark_pending(self):
+        if self._first_pending is None:
+            self._first_pending = time.monotonic()
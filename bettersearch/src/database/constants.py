@@ -70,10 +70,13 @@ parsable_exts = {
         ".rb",".sass",".scss",".html",
         ".etx",".sgml",".sh",".spc",
         ".tcl",".tex",".uil",".uu",
-        ".vcs",".vcf"    
+        ".vcs",".vcf",".md",".markdown"
     ]
 }
 
+# Text files that are split on markdown structure, like the markdown that pymupdf4llm produces for 'mupdf' files
+markdown_exts = ['.md', '.markdown']
+
 ##############################################################################################################################################################################
 ##########################                                     Linux SQL File Index constants, yet to be tested.                      ########################################
 ##############################################################################################################################################################################
@@ -170,6 +173,39 @@ CREATE TABLE IF NOT EXISTS index_maintenance (
             FOREIGN KEY (file_id) REFERENCES file_metadata(file_id) 
             ON DELETE CASCADE
         )'''
+
+# Full-text index over content_index. External content, so the text is not stored twice; the triggers keep it
+# in sync, including rows removed by the ON DELETE CASCADE from file_metadata.
+content_fts_create = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(
+            content,
+            content='content_index',
+            content_rowid='file_id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )'''
+
+content_fts_triggers_create = '''
+CREATE TRIGGER IF NOT EXISTS content_index_fts_insert AFTER INSERT ON content_index BEGIN
+    INSERT INTO content_fts(rowid, content) VALUES (new.file_id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS content_index_fts_delete AFTER DELETE ON content_index BEGIN
+    INSERT INTO content_fts(content_fts, rowid, content) VALUES ('delete', old.file_id, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS content_index_fts_update AFTER UPDATE ON content_index BEGIN
+    INSERT INTO content_fts(content_fts, rowid, content) VALUES ('delete', old.file_id, old.content);
+    INSERT INTO content_fts(rowid, content) VALUES (new.file_id, new.content);
+END'''
+
+# Child tables are looked up by file_id on every update and cascading delete
+file_id_indexes_create = '''
+CREATE INDEX IF NOT EXISTS content_index_file_id ON content_index(file_id);
+CREATE INDEX IF NOT EXISTS image_metadata_file_id ON image_metadata(file_id);
+CREATE INDEX IF NOT EXISTS music_metadata_file_id ON music_metadata(file_id);
+CREATE INDEX IF NOT EXISTS video_metadata_file_id ON video_metadata(file_id);
+CREATE INDEX IF NOT EXISTS email_metadata_file_id ON email_metadata(file_id);
+CREATE INDEX IF NOT EXISTS application_metadata_file_id ON application_metadata(file_id);
+CREATE INDEX IF NOT EXISTS index_maintenance_file_id ON index_maintenance(file_id)'''
         
 
 ##############################################################################################################################################################################
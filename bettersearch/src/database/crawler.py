@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .util import PARSABLE_EXTS
+
+logger = logging.getLogger(__name__)
+
+
+class DirectoryCrawler:
+    def __init__(self, folders: Iterable[str], exts: Optional[Iterable[str]] = PARSABLE_EXTS, exclude: Optional[Iterable[str]] = None,
+                 state_path: Optional[str] = None, max_workers: int = 8, batch_size: int = 1000):
+        """
+        Crawl folders with `os.scandir`, listing directories in parallel on a thread pool.
+
+        The modified time of every directory is kept, optionally persisted to `state_path`. A directory's modified time
+        only changes when entries are added, removed or renamed in it, so on a re-crawl unchanged directories are not listed
+        again; only their known subdirectories are visited. Files modified in place in an unchanged directory are left
+        to the change feed (or to a crawl with `full=True`).
+
+        Args:
+            folders (Iterable[str]): Folders to crawl recursively.
+            exts (Optional[Iterable[str]]): File extensions to report, including the leading period. All files if None.
+            exclude (Optional[Iterable[str]]): Folders that are not crawled.
+            state_path (Optional[str]): JSON file the directory state is loaded from and saved to.
+            max_workers (int): Number of threads listing directories.
+            batch_size (int): Number of stat records per yielded batch.
+        """
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.exts = frozenset(exts) if exts is not None else None
+        self.exclude = tuple(os.path.abspath(folder) for folder in (exclude or []))
+        self.state_path = state_path
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+        self.state = self._load_state()     # directory -> [mtime_ns, [subdirectories]]
+        self.scanned_dirs = set()
+        self.removed_dirs = set()
+        self._new_state = None
+
+    def _load_state(self):
+        if self.state_path is None or not os.path.isfile(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load crawl state, crawling everything: {self.state_path}")
+            logger.exception(e)
+            return {}
+
+    def save_state(self):
+        """
+        Keep the directory state of the last completed crawl, and write it to `state_path`.
+        Call this only once the crawled records have been ingested, otherwise files in directories
+        that were listed but not ingested would be skipped on the next crawl.
+        """
+        if self._new_state is not None:
+            self.state, self._new_state = self._new_state, None
+        if self.state_path is not None:
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.state_path)
+
+    def crawl(self, full: bool = False) -> Iterator[List[Dict]]:
+        """
+        Crawl the folders and yield batches of stat records for the files in directories that were listed.
+        After the generator is exhausted, `scanned_dirs` holds the directories that were listed and
+        `removed_dirs` the known directories that no longer exist.
+
+        Args:
+            full (bool): List every directory, ignoring the saved directory state.
+
+        Yields:
+            List[Dict]: Records with 'path', 'file_name', 'file_size', 'date_created', 'date_modified' and 'date_accessed' keys.
+        """
+        new_state = {}
+        self.scanned_dirs, self.removed_dirs = set(), set()
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {pool.submit(self._visit, folder, full) for folder in self.folders if not self._is_excluded(folder)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory, mtime, subdirs, records, scanned = future.result()
+                    if mtime is None:
+                        continue
+                    new_state[directory] = [mtime, subdirs]
+                    if scanned:
+                        self.scanned_dirs.add(directory)
+                    pending.update(pool.submit(self._visit, subdir, full) for subdir in subdirs if not self._is_excluded(subdir))
+                    batch.extend(records)
+                    while len(batch) >= self.batch_size:
+                        yield batch[:self.batch_size]
+                        batch = batch[self.batch_size:]
+        if batch:
+            yield batch
+
+        self.removed_dirs = set(self.state) - set(new_state)
+        self._new_state = new_state
+
+    def _visit(self, directory, full):
+        """
+        List a directory, unless its modified time matches the saved state.
+
+        Args:
+            directory (str): Directory to visit.
+            full (bool): List the directory regardless of the saved state.
+
+        Returns:
+            tuple: The directory, its modified time (None if it could not be read), its subdirectories,
+                the stat records of its files, and whether it was listed.
+        """
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return directory, None, [], [], False
+
+        known = self.state.get(directory)
+        if not full and known is not None and known[0] == mtime:
+            return directory, mtime, known[1], [], False
+
+        subdirs, records = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False) and (self.exts is None or os.path.splitext(entry.name)[1] in self.exts):
+                            stat = entry.stat(follow_symlinks=False)
+                            records.append({
+                                'path': entry.path,
+                                'file_name': entry.name,
+                                'file_size': stat.st_size,
+                                'date_created': stat.st_ctime,
+                                'date_modified': stat.st_mtime,
+                                'date_accessed': stat.st_atime,
+                            })
+                    except OSError:
+                        continue
+        except OSError as e:
+            logger.error(f"Directory failed: {directory}")
+            logger.exception(e)
+            # Keep what is known about the directory, so its indexed files are not reported as removed
+            if known is not None:
+                return directory, known[0], known[1], [], False
+            return directory, None, [], [], False
+        return directory, mtime, subdirs, records, True
+
+    def _is_excluded(self, path):
+        return any(path == folder or path.startswith(folder + os.sep) for folder in self.exclude)
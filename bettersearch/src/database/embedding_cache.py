@@ -0,0 +1,124 @@
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model_name: str, max_entries: int = 100000):
+        """
+        On-disk cache of chunk embeddings, keyed by a hash of the chunk text and the embedding model name.
+        The cache is cleared when it is opened with a different model name, and the least recently used
+        entries are evicted once it holds more than `max_entries` embeddings.
+
+        Args:
+            path (str): Path of the SQLite database file.
+            model_name (str): Name identifying the embedding model (and backend) that produced the embeddings.
+            max_entries (int): Maximum number of embeddings kept in the cache.
+        """
+        self.path = path
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits, self.misses = 0, 0
+
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache_info (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    chunk_hash BLOB PRIMARY KEY,
+                    vector BLOB,
+                    last_used REAL
+                );
+                CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used);
+            """)
+            row = self.conn.execute("SELECT value FROM cache_info WHERE key = 'model_name'").fetchone()
+            if row is None or row[0] != model_name:
+                if row is not None:
+                    logger.info(f"Embedding model changed from {row[0]} to {model_name}, clearing embedding cache")
+                self.conn.execute("DELETE FROM embeddings")
+                self.conn.execute("INSERT OR REPLACE INTO cache_info(key, value) VALUES ('model_name', ?)", (model_name,))
+        self._count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def chunk_hash(self, text: str) -> bytes:
+        """
+        Hash a chunk of text together with the model name.
+
+        Args:
+            text (str): Chunk text.
+
+        Returns:
+            bytes: SHA-256 digest used as the cache key.
+        """
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up the embeddings of several chunks.
+
+        Args:
+            texts (List[str]): Chunk texts.
+
+        Returns:
+            List[Optional[List[float]]]: Embedding of each chunk, or None for cache misses.
+        """
+        keys = [self.chunk_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound parameter limit
+            for i in range(0, len(keys), 500):
+                batch = list(set(keys[i:i+500]))
+                rows = self.conn.execute(
+                    f"SELECT chunk_hash, vector FROM embeddings WHERE chunk_hash IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                with self.conn:
+                    self.conn.executemany("UPDATE embeddings SET last_used = ? WHERE chunk_hash = ?", [(now, key) for key in found])
+
+        vectors = [array("f", found[key]).tolist() if key in found else None for key in keys]
+        num_hits = sum(vector is not None for vector in vectors)
+        self.hits += num_hits
+        self.misses += len(vectors) - num_hits
+        return vectors
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        """
+        Store the embeddings of several chunks, evicting the least recently used entries if the cache is full.
+
+        Args:
+            texts (List[str]): Chunk texts.
+            vectors (List[List[float]]): Embedding of each chunk.
+        """
+        now = time.time()
+        rows = {self.chunk_hash(text): array("f", vector).tobytes() for text, vector in zip(texts, vectors)}
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings(chunk_hash, vector, last_used) VALUES (?, ?, ?)",
+                [(key, blob, now) for key, blob in rows.items()]
+            )
+            self._count = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._count > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE chunk_hash IN (SELECT chunk_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (self._count - self.max_entries,)
+                )
+                self._count = self.max_entries
+
+    def close(self):
+        self.conn.close()
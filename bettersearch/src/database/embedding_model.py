@@ -2,52 +2,235 @@ import numpy as np
 import numpy.typing as npt
 from chromadb.api.types import EmbeddingFunction, Documents, Embeddings, Document
 from typing import Optional, List
+import os
+import shutil
 import logging
 import torch
 
 logger = logging.getLogger(__name__)
 
+# Written into an export directory once every file of the export is saved
+EXPORT_COMPLETE_MARKER = ".export_complete"
+
+
+def length_buckets(lengths: List[int], max_tokens_per_batch: int) -> List[List[int]]:
+    """
+    Group sequences of similar length into micro-batches whose padded size stays under a token budget.
+
+    Args:
+        lengths (List[int]): Token length of each sequence.
+        max_tokens_per_batch (int): Maximum number of tokens (including padding) in a micro-batch.
+
+    Returns:
+        List[List[int]]: Indices of the sequences in each micro-batch, shortest sequences first.
+    """
+    batches, batch = [], []
+    for i in sorted(range(len(lengths)), key=lengths.__getitem__):
+        # Lengths are sorted, so the current sequence sets the padded length of the batch
+        if batch and (len(batch) + 1) * lengths[i] > max_tokens_per_batch:
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def padding_stats(lengths: List[int], batches: List[List[int]]) -> dict:
+    """
+    Count real and padded tokens for a given batching of sequences.
+
+    Args:
+        lengths (List[int]): Token length of each sequence.
+        batches (List[List[int]]): Indices of the sequences in each batch.
+
+    Returns:
+        dict: Real tokens, padded tokens, and the ratio of padding to total tokens.
+    """
+    real = sum(lengths)
+    total = sum(len(batch) * max(lengths[i] for i in batch) for batch in batches if batch)
+    return {"real_tokens": real, "padded_tokens": total - real, "padded_ratio": (total - real) / total if total else 0.0}
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "openvino")
+
+
 class EmbeddingModelFunction(EmbeddingFunction[Documents]):
-    def __init__(self, model_name: str = "Alibaba-NLP/gte-base-en-v1.5", cache_dir: Optional[str] = None, device: str = "cpu"):
+    def __init__(self, model_name: str = "Alibaba-NLP/gte-base-en-v1.5", cache_dir: Optional[str] = None, device: str = "cpu",
+                 max_tokens_per_batch: int = 16384, backend: str = "torch", quantize: bool = False):
         """
         Initialize the EmbeddingModelFunction with the given parameters.
 
         Args:
             model_name (str): Name of the pre-trained model to use.
             cache_dir (Optional[str]): Directory to cache the model.
-            device (str): Device to run the model on (e.g., "cpu", "cuda").
+            device (str): Device to run the model on (e.g., "cpu", "cuda"). Ignored by the "onnx" and "openvino" backends, which run on CPU.
+            max_tokens_per_batch (int): Maximum number of tokens (including padding) per forward pass.
+            backend (str): Inference backend, one of "torch", "onnx" or "openvino".
+            quantize (bool): Quantize the exported model to int8 (only for the "onnx" and "openvino" backends).
         """
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+        
+        self.model_name = model_name
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.backend = backend
+        self.quantize = quantize
         try:
-            from transformers import AutoModel, AutoTokenizer
-            self._device = torch.device(device)
-            self._model = AutoModel.from_pretrained(
-                pretrained_model_name_or_path=model_name, 
-                cache_dir=cache_dir, 
-                trust_remote_code=True,
-                unpad_inputs=True, 
-                use_memory_efficient_attention=True if self._device == "cuda" else False, #xformers-enable (do not enable on Windows, attn_bias device issue)
-            ).to(self._device)
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+            
+            if backend != "torch":
+                try:
+                    self._device = torch.device("cpu")
+                    self._model = self._load_exported_model(model_name, cache_dir, backend, quantize)
+                    return
+                except Exception as e:
+                    logger.error(f"Failed to load the {backend} embedding backend, falling back to torch")
+                    logger.exception(e)
+                    self.backend = "torch"
             
-            self._tokenizer = AutoTokenizer.from_pretrained(model_name)
+            self._device = torch.device(device)
+            self._model = self._load_torch_model(model_name, cache_dir, self._device)
         except ImportError:
             logger.error("The transformers package is not installed. Please install it with "
             "'pip install transformers'")
+    
+    @staticmethod
+    def _load_torch_model(model_name: str, cache_dir: Optional[str], device: torch.device):
+        """
+        Load the embedding model in eager PyTorch.
+
+        Args:
+            model_name (str): Name of the pre-trained model to use.
+            cache_dir (Optional[str]): Directory to cache the model.
+            device (torch.device): Device to load the model on.
+
+        Returns:
+            PreTrainedModel: The loaded model.
+        """
+        from transformers import AutoModel
+        return AutoModel.from_pretrained(
+            pretrained_model_name_or_path=model_name, 
+            cache_dir=cache_dir, 
+            trust_remote_code=True,
+            unpad_inputs=True, 
+            use_memory_efficient_attention=True if device.type == "cuda" else False, #xformers-enable (do not enable on Windows, attn_bias device issue)
+        ).to(device)
+    
+    @staticmethod
+    def exported_model_dir(model_name: str, cache_dir: Optional[str], backend: str, quantize: bool) -> str:
+        """
+        Get the directory where the exported model for a backend is cached.
+
+        Args:
+            model_name (str): Name of the pre-trained model.
+            cache_dir (Optional[str]): Directory to cache the model.
+            backend (str): Either "onnx" or "openvino".
+            quantize (bool): Whether the exported model is int8-quantized.
+
+        Returns:
+            str: Path of the exported model directory.
+        """
+        return os.path.join(cache_dir or ".", backend, model_name.replace("/", "--") + ("-int8" if quantize else ""))
+    
+    def _load_exported_model(self, model_name: str, cache_dir: Optional[str], backend: str, quantize: bool):
+        """
+        Load the embedding model through ONNX Runtime or OpenVINO. The model is exported (and optionally
+        quantized) on first use and loaded from `cache_dir` afterwards.
+
+        Args:
+            model_name (str): Name of the pre-trained model to use.
+            cache_dir (Optional[str]): Directory to cache the model.
+            backend (str): Either "onnx" or "openvino".
+            quantize (bool): Quantize the exported model to int8.
+
+        Returns:
+            OptimizedModel: The loaded model, with the same call signature as the PyTorch model.
+        """
+        export_dir = self.exported_model_dir(model_name, cache_dir, backend, quantize)
+        # config.json is saved before quantization runs, so only the marker tells a complete export from an interrupted one
+        if not os.path.isfile(os.path.join(export_dir, EXPORT_COMPLETE_MARKER)):
+            try:
+                self._export_model(model_name, cache_dir, backend, quantize, export_dir)
+            except BaseException:
+                # Drop the partial export, so the next start exports again instead of loading missing files
+                shutil.rmtree(export_dir, ignore_errors=True)
+                raise
+        
+        if backend == "onnx":
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            file_name = "model_quantized.onnx" if quantize else "model.onnx"
+            return ORTModelForFeatureExtraction.from_pretrained(export_dir, file_name=file_name)
+        else:
+            from optimum.intel import OVModelForFeatureExtraction
+            return OVModelForFeatureExtraction.from_pretrained(export_dir)
+    
+    def _export_model(self, model_name: str, cache_dir: Optional[str], backend: str, quantize: bool, export_dir: str):
+        """
+        Export (and optionally quantize) the embedding model to `export_dir`, writing the completion marker last.
+
+        Args:
+            model_name (str): Name of the pre-trained model to export.
+            cache_dir (Optional[str]): Directory to cache the model.
+            backend (str): Either "onnx" or "openvino".
+            quantize (bool): Quantize the exported model to int8.
+            export_dir (str): Directory to save the exported model to.
+        """
+        if backend == "onnx":
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            logger.info(f"Exporting {model_name} to ONNX in {export_dir}")
+            ort_model = ORTModelForFeatureExtraction.from_pretrained(
+                model_name, export=True, cache_dir=cache_dir, trust_remote_code=True
+            )
+            ort_model.save_pretrained(export_dir)
+            if quantize:
+                from optimum.onnxruntime import ORTQuantizer
+                from optimum.onnxruntime.configuration import AutoQuantizationConfig
+                quantizer = ORTQuantizer.from_pretrained(ort_model)
+                quantizer.quantize(
+                    save_dir=export_dir,
+                    quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False),
+                )
+        else:
+            from optimum.intel import OVModelForFeatureExtraction
+            logger.info(f"Exporting {model_name} to OpenVINO IR in {export_dir}")
+            ov_model = OVModelForFeatureExtraction.from_pretrained(
+                model_name, export=True, load_in_8bit=quantize, cache_dir=cache_dir, trust_remote_code=True
+            )
+            ov_model.save_pretrained(export_dir)
+        self._tokenizer.save_pretrained(export_dir)
+        with open(os.path.join(export_dir, EXPORT_COMPLETE_MARKER), "w", encoding="utf-8"):
+            pass
         
     @staticmethod
     def _normalize(vector: npt.NDArray) -> npt.NDArray:
         """
-        Normalize the given vector to unit length.
+        Normalize the given vectors to unit length, row by row.
 
         Args:
-            vector (npt.NDArray): Input vector to be normalized.
+            vector (npt.NDArray): Input vectors to be normalized.
 
         Returns:
-            npt.NDArray: Normalized vector.
+            npt.NDArray: Normalized vectors.
         """
-        norm = np.linalg.norm(vector)
-        if norm == 0:
-            return vector
-        return vector / norm
+        norm = np.linalg.norm(vector, axis=-1, keepdims=True)
+        return vector / np.where(norm == 0, 1, norm)
+    
+    @staticmethod
+    def _mean_pool(last_hidden_state: torch.Tensor, attention_mask: torch.Tensor) -> torch.Tensor:
+        """
+        Average the token embeddings of each sequence, ignoring padding positions.
+
+        Args:
+            last_hidden_state (torch.Tensor): Token embeddings of shape (batch, seq_len, hidden).
+            attention_mask (torch.Tensor): Attention mask of shape (batch, seq_len).
+
+        Returns:
+            torch.Tensor: Sequence embeddings of shape (batch, hidden).
+        """
+        mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+        return (last_hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
     
     def __call__(self, input: List[Document]) -> Embeddings:
         """
@@ -59,15 +242,59 @@ class EmbeddingModelFunction(EmbeddingFunction[Documents]):
         Returns:
             Embeddings: List of embeddings for the input documents.
         """
-        # Tokenize the input documents
-        inputs = self._tokenizer(input, padding=True, truncation=True, return_tensors="pt").to(self._device)
+        # Tokenize without padding, then pad each length bucket only to its own longest sequence
+        encodings = self._tokenizer(input, truncation=True)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
         
-        # Generate embeddings using the model
-        with torch.autocast(device_type=self._device.type, dtype=torch.float16):
-            with torch.inference_mode():
-                outputs = self._model(**inputs)
-        
-        embeddings = outputs.last_hidden_state.mean(dim=1).cpu()
+        embeddings = [None] * len(input)
+        for batch in length_buckets(lengths, self.max_tokens_per_batch):
+            inputs = self._tokenizer.pad(
+                {key: [values[i] for i in batch] for key, values in encodings.items()},
+                return_tensors="pt"
+            ).to(self._device)
             
-        # Normalize and return the embeddings
-        return [e.tolist() for e in self._normalize(embeddings)]
\ No newline at end of file
+            # Generate embeddings using the model (float16 autocast only pays off on GPU)
+            with torch.autocast(device_type=self._device.type, dtype=torch.float16, enabled=self.backend == "torch" and self._device.type == "cuda"):
+                with torch.inference_mode():
+                    outputs = self._model(**inputs)
+            
+            pooled = self._mean_pool(outputs.last_hidden_state, inputs["attention_mask"]).float().cpu().numpy()
+            
+            # Normalize and restore the original order
+            for i, e in zip(batch, self._normalize(pooled)):
+                embeddings[i] = e.tolist()
+        
+        return embeddings
+
+
+def check_backend_parity(model_name: str = "Alibaba-NLP/gte-base-en-v1.5", backend: str = "onnx", quantize: bool = False,
+                         cache_dir: Optional[str] = None, texts: Optional[List[str]] = None, min_cosine: float = 0.99) -> dict:
+    """
+    Compare the embeddings of an exported backend against the PyTorch model on CPU.
+
+    Args:
+        model_name (str): Name of the pre-trained model.
+        backend (str): Backend to check, either "onnx" or "openvino".
+        quantize (bool): Whether to check the int8-quantized export.
+        cache_dir (Optional[str]): Directory to cache the model.
+        texts (Optional[List[str]]): Texts to embed. A small built-in sample is used if not given.
+        min_cosine (float): Minimum cosine similarity per text for the check to pass.
+
+    Returns:
+        dict: Minimum and mean cosine similarity between the two backends, and whether the check passed.
+    """
+    texts = texts or [
+        "What is the penalty for not wearing a seatbelt?",
+        "def add_to_collection(self, file_path=None, date_modified=None):",
+        "Quarterly budget report for the marketing team, including travel and equipment costs. " * 8,
+        "README",
+    ]
+    reference = np.array(EmbeddingModelFunction(model_name=model_name, cache_dir=cache_dir, device="cpu")(texts))
+    candidate_fn = EmbeddingModelFunction(model_name=model_name, cache_dir=cache_dir, backend=backend, quantize=quantize)
+    if candidate_fn.backend != backend:
+        raise RuntimeError(f"The {backend} backend could not be loaded")
+    candidate = np.array(candidate_fn(texts))
+    
+    # Both sets of embeddings are unit length, so the row-wise dot product is the cosine similarity
+    cosine = (reference * candidate).sum(axis=-1)
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean()), "passed": bool(cosine.min() >= min_cosine)}
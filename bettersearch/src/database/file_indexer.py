@@ -1,23 +1,34 @@
 
 import os
 from operator import itemgetter
+from itertools import groupby
 import json
 import logging
 import sqlite3
-import pathlib
+import queue
+import time
 from collections import defaultdict
-from typing import Callable, List, Dict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, List, Dict, TYPE_CHECKING
 import threading
-from tqdm import tqdm
 
-import adodbapi as OleDb
-import chromadb
-from langchain_text_splitters import MarkdownTextSplitter, RecursiveCharacterTextSplitter
+# adodbapi (Windows only), chromadb, the embedding model (torch), tqdm and the process pool are imported on first use,
+# so importing the package stays fast and works on every platform
+if TYPE_CHECKING:
+    from chromadb.api.types import EmbeddingFunction
 
 from . import constants
+from .. import tracing
+from ..registry import MODEL_REGISTRY, ModelKey
 from .parse import parse_file_contents
-from .util import create_init_config, is_sql_query, format_sqlrows_to_text, format_sqlrows_to_dict, flatten
-from .embedding_model import EmbeddingModelFunction
+from .ingest import create_chunks, parse_change, chunk_hash
+from .batching import ChunkAccumulator
+from .util import create_init_config, is_sql_query, format_sqlrows_to_text, format_sqlrows_to_dict, PARSABLE_EXTS
+from .watcher import InotifyWatcher
+from .crawler import DirectoryCrawler
+from .embedding_cache import EmbeddingCache
+from .manifest import FileManifest
+from .lexical_index import LexicalIndex, reciprocal_rank_fusion
 
 
 import logging
@@ -36,16 +47,30 @@ class WindowsFileIndexer:
             check_interval (int): Interval (in seconds) to check for file changes.
             device (str): Device to run the vector database operations on (e.g., 'cpu', 'cuda').
             **kwargs: Additional keyword arguments for the VectorDB initialization.
+        
+        The search index can be queried as soon as the indexer is created. The vector database (embedding model and
+        Chroma) loads in the background; `vector_db` waits for it, and `vector_db_ready` tells whether it has loaded.
         """
+        import adodbapi as OleDb
+        
+        start = time.perf_counter()
         self.conn = OleDb.connect(constants.WIN_CONN_STRING)
-        self.vector_db = VectorDB(vector_db_path=os.path.join(BASE_DIR, vector_db_path), device=device, **kwargs)
+        self.load_times = {"search_index": time.perf_counter() - start}
         self.check_interval = check_interval
         self.last_check = None
         
-        self.callbacks = [self.vector_db.update_collection]
+        self.callbacks = [self._update_vector_db]
         self.current_state = {}
         
+        self._vector_db = None
+        self._vector_db_error = None
+        # time.perf_counter() when the vector database finished loading
+        self.vector_db_loaded_at = None
+        self._vector_db_kwargs = dict(vector_db_path=os.path.join(BASE_DIR, vector_db_path), device=device, **kwargs)
+        self._vector_db_ready_event = threading.Event()
         self._db_ready_event = threading.Event()
+        self._closed = False
+        self.monitor_thread = None
         
         self.start_db_thread = threading.Thread(target=self.start_db)
         self.start_db_thread.setDaemon(True)
@@ -60,25 +85,86 @@ class WindowsFileIndexer:
         """
         self.callbacks.append(callback)
         
+    def _load_vector_db(self):
+        """
+        Load the vector database. Runs on the start thread, while the caller loads the LLM.
+        """
+        start = time.perf_counter()
+        try:
+            with tracing.span("load.vector_db"):
+                self._vector_db = VectorDB(**self._vector_db_kwargs)
+            self.vector_db_loaded_at = time.perf_counter()
+            self.load_times["vector_db"] = self.vector_db_loaded_at - start
+            self.load_times.update(self._vector_db.load_times)
+        except Exception as e:
+            logger.error("Failed to load the vector database")
+            logger.exception(e)
+            self._vector_db_error = e
+        finally:
+            self._vector_db_ready_event.set()
+    
+    @property
+    def vector_db(self):
+        """
+        The vector database, waiting for it to finish loading if needed.
+
+        Returns:
+            VectorDB: The vector database.
+        """
+        self._vector_db_ready_event.wait()
+        if self._vector_db_error is not None:
+            raise RuntimeError("The vector database failed to load") from self._vector_db_error
+        return self._vector_db
+    
+    @property
+    def vector_db_ready(self):
+        """
+        Check if the vector database has finished loading.
+
+        Returns:
+            bool: True if the vector database has loaded (or failed to), False otherwise.
+        """
+        return self._vector_db_ready_event.is_set()
+    
+    def wait_for_vector_db(self, timeout: float = None):
+        """
+        Wait for the vector database to finish loading.
+
+        Args:
+            timeout (float): Maximum time to wait, in seconds. Waits indefinitely if None.
+
+        Returns:
+            bool: True if the vector database has finished loading, False on timeout.
+        """
+        return self._vector_db_ready_event.wait(timeout)
+    
+    def _update_vector_db(self, changes):
+        self.vector_db.update_collection(changes)
+    
     def start_db(self):
         """
-        Update vector database during the start of the application.
+        Load the vector database and update it during the start of the application.
         """
-        vector_files = {k['path']: itemgetter("path", "date_modified")(defaultdict(str, k)) for k in self.vector_db.collection.get(include=['metadatas']).get('metadatas')}
+        self._load_vector_db()
+        if self._vector_db_error is not None:
+            return
+        
+        # One row per file from the manifest, instead of the metadata of every chunk
+        vector_files = self.vector_db.file_state()
         
         self.current_state = self.get_current_state(order_type="size")
         
         changes = []
         
-        for path in self.current_state.keys():
+        for path, date_modified in vector_files.items():
             if path not in self.current_state:
-                changes.append({'ChangeType': 'Deleted', **self.current_state[path]})
+                changes.append({'ChangeType': 'Deleted', 'path': path, 'date_modified': date_modified})
         
         # Detect additions and modifications
         for path, item in self.current_state.items():
             if path not in vector_files:
                 changes.append({'ChangeType': 'Added', **item})
-            elif self.current_state[path] != item:
+            elif vector_files[path] != str(item.get('date_modified')):
                 changes.append({'ChangeType': 'Modified', **item})
         
         if changes:
@@ -86,7 +172,8 @@ class WindowsFileIndexer:
                 callback(changes)
         
         self._db_ready_event.set()
-        self.start_monitoring()
+        if not self._closed:
+            self.start_monitoring()
     
     @property 
     def db_ready(self):
@@ -179,6 +266,8 @@ class WindowsFileIndexer:
         """
         Stop monitoring the Search Index for changes.
         """
+        if self.monitor_thread is None:
+            return
         self.stop_event.set()
         self.monitor_thread.join()
         
@@ -186,41 +275,152 @@ class WindowsFileIndexer:
         """
         Close the database connection and stop monitoring.
         """
+        self._closed = True
+        # The start thread uses the connection and starts monitoring unless closed, so it finishes first
+        self.start_db_thread.join()
         self.stop_monitoring()
         self.conn.close()
-        self.start_db_thread.join()
+        if self._vector_db is not None:
+            self._vector_db.close()
+    
+    def reconfigure(self, check_interval: int = None, **kwargs):
+        """
+        Apply new settings without reconnecting to the search index or reloading the vector database. Waits for the
+        vector database to finish loading.
+
+        Args:
+            check_interval (int): Interval (in seconds) to check for file changes.
+            **kwargs: Settings of the vector database, see `VectorDB.reconfigure`.
+
+        Returns:
+            bool: True if the embedding model was swapped.
+        """
+        if check_interval is not None:
+            self.check_interval = check_interval
+        return self.vector_db.reconfigure(**kwargs)
     
-    def query(self, query, user_question):
+    def query(self, query, user_question, vector_context=None):
         """
         Query the databases and return context that can help answer the user's question.
 
         Args:
             query (str): Generated SQL query.
             user_question (str): Question posed by the user.
+            vector_context (concurrent.futures.Future): Vector database results for `user_question`, already running
+                (started while the SQL query was generated). Used instead of a new vector database query if the
+                search index cannot answer.
 
         Returns:
             str: Context for the next generation step - from vector database or search index.
         """
-        answer_preface = ""
-        if any(fail in query.lower() for fail in ["i don't know", "i do not know"]):
-            query_context, answer_preface = self.vector_db.query_collection(query=user_question), "I was able to check file contents for this.\n\n "
-        elif is_sql_query(query):
-            with self.conn:
-                cursor = self.conn.cursor()
-                try: 
-                    cursor.execute(query)
-                    result = cursor.fetchall()
-                    if len(result) < 1:
-                        query_context, answer_preface = self.vector_db.query_collection(query=user_question), "I was unable to query search index, the following answer may be incorrect.\n\n" 
-                    else:
-                        query_context, answer_preface = format_sqlrows_to_text(result, cursor.get_description()), "I was able to query search index.\n\n"
-                except:
-                    query_context, answer_preface = self.vector_db.query_collection(query=user_question), "I was unable to query search index, the following answer may be incorrect.\n\n"
-        else:
-            query_context=""
+        with tracing.span("index.query") as span:
+            query_context, answer_preface = self._query_index(query)
+            span.set(vector_fallback=query_context is None)
+            if query_context is None:
+                with tracing.span("index.vector_fallback", speculative=vector_context is not None):
+                    query_context = self._vector_context(user_question, vector_context)
         
+        if vector_context is not None:
+            # Drop the speculative result if it was not needed; a query that already started simply finishes unused
+            vector_context.cancel()
+        return query_context, answer_preface
+    
+    def query_many(self, queries, user_questions):
+        """
+        Query the databases for several questions. Questions the search index cannot answer are sent to the
+        vector database together, in one batch.
+
+        Args:
+            queries (List[str]): Generated SQL query of each question.
+            user_questions (List[str]): Questions posed by the user.
+
+        Returns:
+            List[tuple]: Context and answer preface of each question, as returned by `query`.
+        """
+        results = [self._query_index(query) for query in queries]
+        fallback = [i for i, (query_context, _) in enumerate(results) if query_context is None]
+        if fallback:
+            vector_contexts = self.vector_db.query_collection_many([user_questions[i] for i in fallback])
+            for i, query_context in zip(fallback, vector_contexts):
+                results[i] = (query_context, results[i][1])
+        return results
+    
+    def _query_index(self, query):
+        """
+        Run a generated query against the search index.
+
+        Args:
+            query (str): Generated SQL query.
+
+        Returns:
+            tuple: Context and answer preface. The context is None if the vector database should answer instead.
+        """
+        answer_preface = ""
+        with tracing.span("index.sql_query") as span:
+            if any(fail in query.lower() for fail in ["i don't know", "i do not know"]):
+                query_context, answer_preface = None, "I was able to check file contents for this.\n\n "
+                span.set(branch="unknown")
+            elif is_sql_query(query):
+                with self.conn:
+                    cursor = self.conn.cursor()
+                    try: 
+                        cursor.execute(query)
+                        result = cursor.fetchall()
+                        span.set(rows=len(result))
+                        if len(result) < 1:
+                            query_context, answer_preface = None, "I was unable to query search index, the following answer may be incorrect.\n\n" 
+                            span.set(branch="no_rows")
+                        else:
+                            query_context, answer_preface = format_sqlrows_to_text(result, cursor.get_description()), "I was able to query search index.\n\n"
+                            span.set(branch="rows")
+                    except:
+                        query_context, answer_preface = None, "I was unable to query search index, the following answer may be incorrect.\n\n"
+                        span.set(branch="sql_error")
+            else:
+                query_context=""
+                span.set(branch="not_sql")
         return query_context, answer_preface
     
+    def execute_sql(self, query):
+        """
+        Run a query against the search index.
+
+        Args:
+            query (str): Windows Search SQL query.
+
+        Returns:
+            tuple: The rows and the cursor description.
+        """
+        with self.conn:
+            cursor = self.conn.cursor()
+            cursor.execute(query)
+            return cursor.fetchall(), cursor.get_description()
+    
+    def _vector_context(self, user_question, vector_context=None):
+        """
+        Get vector database results for the question, from the speculative query if there is one.
+
+        Args:
+            user_question (str): Question posed by the user.
+            vector_context (concurrent.futures.Future): Speculative vector database query, or None.
+
+        Returns:
+            str: Retrieved document chunks.
+        """
+        if vector_context is not None and not vector_context.cancelled():
+            try:
+                with tracing.span("index.speculative_wait"):
+                    return vector_context.result()
+            except Exception as e:
+                logger.error("Speculative vector database query failed, querying again")
+                logger.exception(e)
+        return self.vector_db.query_collection(query=user_question)
+    
+
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+# Reciprocal-rank fusion constant, 60 is the value from the original RRF paper
+RRF_K = 60
+
 
 # Vector Database Class
 class VectorDB:
@@ -229,6 +429,11 @@ class VectorDB:
                  embedding_model_name: str = "Alibaba-NLP/gte-base-en-v1.5", 
                  chunk_size: int = 500, chunk_overlap: int = 200, top_k: int = 5, 
                  chunk_batch_size: int = 500, cache_dir: str = None, device: str = "cpu",
+                 num_parse_workers: int = 0, parse_queue_size: int = 64, flush_interval: float = 5.0,
+                 embedding_max_tokens_per_batch: int = 16384, embedding_backend: str = "torch", embedding_quantize: bool = False,
+                 embedding_cache_size: int = 100000, retrieval_mode: str = "hybrid",
+                 hybrid_dense_weight: float = 1.0, hybrid_lexical_weight: float = 1.0, hybrid_num_candidates: int = 20,
+                 embedding_function: "EmbeddingFunction" = None, hnsw_config: dict = None,
                  **kwargs
                  ):
         """
@@ -240,33 +445,276 @@ class VectorDB:
             chunk_size (int): Size of chunks to split documents into.
             chunk_overlap (int): Overlap between chunks.
             top_k (int): Number of top results to retrieve for queries.
-            batch_size (int): Batch size for adding/updating documents.
+            chunk_batch_size (int): Batch size for embedding and adding/updating documents. Chunks from several files are packed into one batch.
             cache_dir (str): Directory to cache model files.
             device (str): Device to run the model on (e.g., 'cpu', 'cuda').
+            num_parse_workers (int): Number of worker processes used to parse and chunk files. 0 parses serially.
+            parse_queue_size (int): Maximum number of parsed files waiting to be embedded.
+            flush_interval (float): Maximum time (in seconds) chunks are buffered before being written, even if the batch is not full.
+            embedding_max_tokens_per_batch (int): Maximum number of tokens (including padding) per embedding model forward pass.
+            embedding_backend (str): Inference backend for the embedding model ('torch', 'onnx' or 'openvino').
+            embedding_quantize (bool): Quantize the embedding model to int8 (only for the 'onnx' and 'openvino' backends).
+            embedding_cache_size (int): Maximum number of chunk embeddings kept in the on-disk embedding cache. 0 disables the cache.
+            retrieval_mode (str): How chunks are retrieved for a query: 'dense' (embeddings), 'lexical' (BM25 keywords)
+                or 'hybrid' (both, fused with reciprocal-rank fusion).
+            hybrid_dense_weight (float): Weight of the dense ranking in hybrid retrieval.
+            hybrid_lexical_weight (float): Weight of the lexical ranking in hybrid retrieval.
+            hybrid_num_candidates (int): Number of candidates each retriever contributes to the fusion.
+            embedding_function (EmbeddingFunction): Embedding function to use instead of loading `embedding_model_name`,
+                e.g. a deterministic stub for benchmarks. The embedding_* model options are ignored when it is set.
+            hnsw_config (dict): HNSW index settings of the collection, as Chroma "hnsw:" metadata without the prefix,
+                e.g. {"space": "cosine", "M": 16, "construction_ef": 100, "search_ef": 10}. Only applied when the
+                collection is created; to change them, index into a new `vector_db_path`.
             **kwargs: Additional keyword arguments.
         """
+        self.vector_db_path = vector_db_path
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.embedding_model_name = embedding_model_name
         self.cache_dir = cache_dir
-        self.embedding_model_fn = EmbeddingModelFunction(
-            model_name=self.embedding_model_name,
-            cache_dir=self.cache_dir,
-            device=device
-        )
+        # Seconds spent loading each component
+        self.load_times = {}
         
-        self.db = chromadb.PersistentClient(
-            path=vector_db_path, 
-            settings=chromadb.config.Settings(),   
-        )
+        # Imported here, before the loader thread starts, so the two threads never import the same modules at once
+        import chromadb
+        # Registry key of the embedding model, None for a caller-provided embedding function
+        self._embedding_key = None
+        self._embedding_settings = None
+        embedding_loader = None
+        if embedding_function is not None:
+            self.embedding_model_fn = embedding_function
+        else:
+            # Imported before the loader thread starts as well, for the same reason
+            from . import embedding_model
+            
+            # The embedding model and the Chroma client are independent, so they load at the same time
+            embedding_loader = ThreadPoolExecutor(max_workers=1)
+            embedding_model_future = embedding_loader.submit(
+                self._acquire_embedding_model, embedding_model_name, device, embedding_backend, embedding_quantize,
+                embedding_max_tokens_per_batch
+            )
         
-        self.collection = self.db.get_or_create_collection(
-            name="file-content",
-            embedding_function=self.embedding_model_fn,
-        )
+        start = time.perf_counter()
+        with tracing.span("load.vector_store"):
+            self.db = chromadb.PersistentClient(
+                path=vector_db_path, 
+                settings=chromadb.config.Settings(),   
+            )
+        self.load_times["vector_store"] = time.perf_counter() - start
+        
+        if embedding_loader is not None:
+            try:
+                self._embedding_key, self.embedding_model_fn = embedding_model_future.result()
+                self._embedding_settings = (embedding_model_name, device, embedding_backend, embedding_quantize)
+            finally:
+                embedding_loader.shutdown()
+        
+        self.collection = self._get_or_create_collection(hnsw_config)
         
         self._top_k = top_k
         self.batch_size = chunk_batch_size
+        self.num_parse_workers = num_parse_workers
+        self.parse_queue_size = parse_queue_size
+        self.last_ingest_stats = {}
+        
+        self.embedding_cache = None
+        if embedding_cache_size > 0:
+            self.embedding_cache = EmbeddingCache(
+                path=os.path.join(vector_db_path, "embedding_cache.sqlite3"),
+                model_name=self._embedding_cache_key(embedding_quantize),
+                max_entries=embedding_cache_size,
+            )
+        
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}. Choose from {RETRIEVAL_MODES}")
+        self.retrieval_mode = retrieval_mode
+        self.hybrid_weights = {"dense": hybrid_dense_weight, "lexical": hybrid_lexical_weight}
+        self.hybrid_num_candidates = hybrid_num_candidates
+        self.last_query_timings = {}
+        self._query_pool = ThreadPoolExecutor(max_workers=2)
+        
+        # Keyword index over the same chunks, written by the accumulator alongside the collection
+        self.lexical_index = LexicalIndex(os.path.join(vector_db_path, "lexical_index.sqlite3"))
+        if len(self.lexical_index) == 0 and self.collection.count() > 0:
+            self._bootstrap_lexical_index()
+        self.accumulator = ChunkAccumulator(self.collection, batch_size=chunk_batch_size, flush_interval=flush_interval,
+                                            embed_fn=self.embed, lexical_index=self.lexical_index)
+        
+        # One row per file, updated after every flush so reconciliation never has to read chunk metadata
+        self.manifest = FileManifest(os.path.join(vector_db_path, "file_manifest.sqlite3"))
+        self._manifest_pending = {}
+    
+    def _acquire_embedding_model(self, model_name, device, backend, quantize, max_tokens_per_batch):
+        """
+        Get the embedding model from the model registry, loading it if no other vector database uses it.
+
+        Returns:
+            tuple: Registry key and the embedding model. Release the key with `MODEL_REGISTRY.release` when done.
+        """
+        from .embedding_model import EmbeddingModelFunction
+        
+        # The exported backends always run on CPU, and only they can be quantized
+        key = ModelKey("embedding_model", model_name, "int8" if quantize and backend != "torch" else None,
+                       backend if backend != "torch" else device)
+        
+        def load():
+            return EmbeddingModelFunction(model_name=model_name, cache_dir=self.cache_dir, device=device,
+                                          max_tokens_per_batch=max_tokens_per_batch, backend=backend, quantize=quantize)
+        
+        start = time.perf_counter()
+        with tracing.span("load.embedding_model", backend=backend):
+            model_fn = MODEL_REGISTRY.acquire(key, load)
+        self.load_times["embedding_model"] = time.perf_counter() - start
+        model_fn.max_tokens_per_batch = max_tokens_per_batch
+        return key, model_fn
+    
+    def _embedding_cache_key(self, quantize):
+        """
+        Name of the embedding model in the embedding cache. Keyed on the model and backend, since quantized exports
+        produce slightly different embeddings.
+        """
+        if self._embedding_key is None:
+            return f"{self.embedding_model_name}:{type(self.embedding_model_fn).__name__}"
+        return f"{self.embedding_model_name}:{self.embedding_model_fn.backend}{'-int8' if quantize else ''}"
+    
+    def reconfigure(self, embedding_model_name: str = None, device: str = None, embedding_backend: str = None,
+                    embedding_quantize: bool = None, **settings):
+        """
+        Apply new settings to the loaded vector database, taking the same arguments as `__init__`. Settings that are
+        not given are left as they are. The embedding model is only swapped if its name, device, backend or
+        quantization changed; `vector_db_path`, `hnsw_config` and enabling or disabling the embedding cache need a new
+        VectorDB and are ignored here.
+
+        Args:
+            embedding_model_name (str): Name of the embedding model to use.
+            device (str): Device to run the model on.
+            embedding_backend (str): Inference backend for the embedding model.
+            embedding_quantize (bool): Quantize the embedding model to int8.
+            **settings: Other `__init__` arguments: chunk_size, chunk_overlap, top_k, chunk_batch_size,
+                num_parse_workers, parse_queue_size, flush_interval, embedding_max_tokens_per_batch,
+                embedding_cache_size, retrieval_mode and the hybrid_* settings.
+
+        Returns:
+            bool: True if the embedding model was swapped.
+        """
+        retrieval_mode = settings.get("retrieval_mode", self.retrieval_mode)
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}. Choose from {RETRIEVAL_MODES}")
+        self.retrieval_mode = retrieval_mode
+        
+        for name in ("chunk_size", "chunk_overlap", "top_k", "num_parse_workers", "parse_queue_size"):
+            if settings.get(name) is not None:
+                setattr(self, name, settings[name])
+        if settings.get("chunk_batch_size") is not None:
+            self.batch_size = self.accumulator.batch_size = settings["chunk_batch_size"]
+        if settings.get("flush_interval") is not None:
+            self.accumulator.flush_interval = settings["flush_interval"]
+        for name in ("dense", "lexical"):
+            if settings.get(f"hybrid_{name}_weight") is not None:
+                self.hybrid_weights[name] = settings[f"hybrid_{name}_weight"]
+        if settings.get("hybrid_num_candidates") is not None:
+            self.hybrid_num_candidates = settings["hybrid_num_candidates"]
+        
+        cache_size = settings.get("embedding_cache_size")
+        if cache_size is not None:
+            if (cache_size > 0) != (self.embedding_cache is not None):
+                logger.warning("Enabling or disabling the embedding cache takes effect when the vector database is next opened")
+            elif self.embedding_cache is not None:
+                self.embedding_cache.max_entries = cache_size
+        
+        if self._embedding_key is None:
+            # A caller-provided embedding function is never swapped
+            return False
+        old_settings = self._embedding_settings
+        new_settings = tuple(new if new is not None else old for new, old in zip(
+            (embedding_model_name, device, embedding_backend, embedding_quantize), old_settings))
+        max_tokens_per_batch = settings.get("embedding_max_tokens_per_batch") or self.embedding_model_fn.max_tokens_per_batch
+        if new_settings == old_settings:
+            self.embedding_model_fn.max_tokens_per_batch = max_tokens_per_batch
+            return False
+        
+        # Chunks still buffered are embedded with the model they were queued for
+        self.flush()
+        old_key = self._embedding_key
+        self._embedding_key, self.embedding_model_fn = self._acquire_embedding_model(*new_settings, max_tokens_per_batch)
+        self._embedding_settings = new_settings
+        self.embedding_model_name = new_settings[0]
+        self.collection = self.accumulator.collection = self.db.get_collection(name="file-content", embedding_function=self.embedding_model_fn)
+        if self.embedding_cache is not None:
+            # A new cache key clears the cache, its embeddings came from the old model
+            self.embedding_cache.close()
+            self.embedding_cache = EmbeddingCache(
+                path=os.path.join(self.vector_db_path, "embedding_cache.sqlite3"),
+                model_name=self._embedding_cache_key(new_settings[3]),
+                max_entries=self.embedding_cache.max_entries,
+            )
+        MODEL_REGISTRY.release(old_key)
+        logger.info(f"Swapped the embedding model to {self._embedding_key}")
+        return True
+    
+    def close(self):
+        """
+        Write buffered chunks, close the on-disk stores and release the embedding model.
+        """
+        self.flush()
+        self._query_pool.shutdown()
+        for store in (self.lexical_index, self.manifest, self.embedding_cache):
+            if store is not None:
+                store.close()
+        if self._embedding_key is not None:
+            MODEL_REGISTRY.release(self._embedding_key)
+            self._embedding_key = None
+    
+    def _get_or_create_collection(self, hnsw_config=None):
+        """
+        Open the "file-content" collection, creating it with the given HNSW settings if it does not exist yet.
+
+        Args:
+            hnsw_config (dict): HNSW index settings, see `__init__`.
+
+        Returns:
+            chromadb.Collection: The collection.
+        """
+        if not hnsw_config:
+            return self.db.get_or_create_collection(name="file-content", embedding_function=self.embedding_model_fn)
+        
+        metadata = {f"hnsw:{key}": value for key, value in hnsw_config.items()}
+        # get_or_create_collection would overwrite the metadata of an existing collection, but not rebuild its index
+        if "file-content" not in [getattr(collection, "name", collection) for collection in self.db.list_collections()]:
+            return self.db.create_collection(name="file-content", embedding_function=self.embedding_model_fn, metadata=metadata)
+        collection = self.db.get_collection(name="file-content", embedding_function=self.embedding_model_fn)
+        if any((collection.metadata or {}).get(key) != value for key, value in metadata.items()):
+            logger.warning(f"The vector database was created with other HNSW settings ({collection.metadata}), "
+                           f"hnsw_config only applies to new databases")
+        return collection
+    
+    def embed(self, documents):
+        """
+        Embed documents, reusing cached embeddings so only cache misses reach the embedding model.
+
+        Args:
+            documents (list): Documents to embed.
+
+        Returns:
+            list: Embedding of each document.
+        """
+        if self.embedding_cache is None:
+            with tracing.span("ingest.embed", chunks=len(documents)):
+                return self.embedding_model_fn(documents)
+        
+        with tracing.span("ingest.embedding_cache", chunks=len(documents)) as span:
+            embeddings = self.embedding_cache.get_many(documents)
+            misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            span.set(hits=len(documents) - len(misses))
+        if misses:
+            # Embed each distinct text once, even if it appears several times in the batch
+            texts = list(dict.fromkeys(documents[i] for i in misses))
+            with tracing.span("ingest.embed", chunks=len(texts)):
+                computed = dict(zip(texts, self.embedding_model_fn(texts)))
+            self.embedding_cache.put_many(texts, [computed[text] for text in texts])
+            for i in misses:
+                embeddings[i] = computed[documents[i]]
+        return embeddings
     
     @property
     def top_k(self):
@@ -300,43 +748,185 @@ class VectorDB:
             dict: Documents, metadata, and IDs.
             int: Number of documents created.
         """
-        content = parse_file_contents(file_path)
-        _, (_, ext) = os.path.basename(os.path.dirname(file_path)), os.path.splitext(os.path.basename(file_path))
-        if isinstance(content, str):
-            if pathlib.Path(file_path).suffix in constants.parsable_exts.get("mupdf"):
-                splitter = MarkdownTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
-            
-            elif pathlib.Path(file_path).suffix in constants.parsable_exts.get("text"):
-                splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
-            
-            docs = [doc.page_content for doc in splitter.create_documents([content])]
-            metadatas = [{"path": f"{file_path}", "fileext": f"{ext}", "date_modified": str(date_modified)} for _ in range(len(docs))]
-            ids = [f"{file_path}_{i+1}" for i in range(len(docs))]
-            return {"documents": docs, "metadatas": metadatas, "ids": ids}, len(docs)
-        else:
-            return None,None
+        data = create_chunks(file_path, date_modified, self.chunk_size, self.chunk_overlap)
+        if data is None:
+            return None, None
+        return data, len(data.get("documents"))
     
-    def add_to_collection(self, file_path=None,date_modified=None):
+    def _queue_change(self, change_type, file_path, data=None, date_modified=None):
         """
-        Add a file to the vector database collection.
+        Buffer a change in the chunk accumulator. Writes happen when a batch fills up or on `flush`.
 
         Args:
+            change_type (str): One of 'Added', 'Modified' or 'Deleted'.
+            file_path (str): Path to the file.
+            data (dict): Documents, metadata, and IDs for added/modified files.
+            date_modified (str): Date the file was last modified.
+
+        Returns:
+            int: Number of chunks buffered.
+        """
+        num_docs = 0
+        if change_type == 'Deleted':
+            self.accumulator.delete(file_path)
+        elif change_type == 'Added' and data is not None:
+            self.accumulator.add(file_path, data)
+            num_docs = len(data.get("documents"))
+        elif change_type == 'Modified' and data is not None:
+            num_docs = self._queue_chunk_diff(file_path, data)
+        self._queue_manifest_change(change_type, file_path, data, date_modified)
+        return num_docs
+    
+    def _queue_chunk_diff(self, file_path, data):
+        """
+        Buffer only the difference between the stored chunks of a file and its new chunks: new or changed
+        chunks are embedded and upserted, removed chunks are deleted, and unchanged chunks only get their
+        metadata (e.g., `date_modified`, `chunk_index`) refreshed.
+
+        Args:
+            file_path (str): Path to the file.
+            data (dict): Documents, metadata, and IDs of the new version of the file.
+
+        Returns:
+            int: Number of chunks that need to be embedded.
+        """
+        if self.accumulator.has_pending(file_path):
+            # Diff against what the collection will hold, not against a half-written file
+            self.accumulator.flush()
+        
+        stored = self.collection.get(where={"path": file_path}, include=["metadatas"])
+        stored_metadatas = dict(zip(stored.get("ids"), stored.get("metadatas")))
+        
+        new_idx = [i for i, id in enumerate(data.get("ids")) if id not in stored_metadatas]
+        kept_idx = [
+            i for i, id in enumerate(data.get("ids"))
+            if id in stored_metadatas and stored_metadatas[id] != data.get("metadatas")[i]
+        ]
+        removed_ids = list(stored_metadatas.keys() - set(data.get("ids")))
+        
+        if removed_ids:
+            self.accumulator.delete_ids(file_path, removed_ids)
+        if kept_idx:
+            self.accumulator.update_metadatas(
+                file_path, [data.get("ids")[i] for i in kept_idx], [data.get("metadatas")[i] for i in kept_idx]
+            )
+        if new_idx:
+            self.accumulator.add(file_path, {key: [values[i] for i in new_idx] for key, values in data.items()})
+        logger.debug(f"{file_path}: {len(new_idx)} chunks to embed, {len(removed_ids)} removed, {len(kept_idx)} metadata updates")
+        return len(new_idx)
+    
+    def _queue_manifest_change(self, change_type, file_path, data=None, date_modified=None):
+        """
+        Remember the manifest row of a changed file until its chunks have been flushed.
+
+        Args:
+            change_type (str): One of 'Added', 'Modified' or 'Deleted'.
+            file_path (str): Path to the file.
+            data (dict): Documents, metadata, and IDs for added/modified files.
+            date_modified (str): Date the file was last modified.
+        """
+        if change_type == 'Deleted':
+            self._manifest_pending[file_path] = None
+        elif change_type in ('Added', 'Modified'):
+            try:
+                size = os.path.getsize(file_path)
+            except OSError:
+                size = None
+            chunk_hashes = [metadata.get("chunk_hash", "") for metadata in data.get("metadatas")] if data else []
+            self._manifest_pending[file_path] = {
+                "path": file_path,
+                "date_modified": str(date_modified),
+                "size": size,
+                "chunk_count": len(chunk_hashes),
+                "content_hash": chunk_hash("".join(chunk_hashes)),
+            }
+    
+    def flush(self):
+        """
+        Write all buffered changes to the vector database collection, then record the files that were
+        written successfully in the manifest.
+
+        Returns:
+            set: Paths of files that failed to be written.
+        """
+        failed = self.accumulator.flush() | self.accumulator.failed_paths
+        self.accumulator.failed_paths.clear()
+        pending, self._manifest_pending = self._manifest_pending, {}
+        with tracing.span("ingest.manifest", files=len(pending)):
+            self.manifest.upsert_many(row for path, row in pending.items() if row is not None and path not in failed)
+            self.manifest.delete_many(path for path, row in pending.items() if row is None and path not in failed)
+        return failed
+    
+    def file_state(self):
+        """
+        Get the last modified date of every file in the vector database, as recorded in the manifest.
+        Collections created before the manifest existed are migrated once by reading their chunk metadata.
+
+        Returns:
+            dict: Path to date modified.
+        """
+        if len(self.manifest) == 0 and self.collection.count() > 0:
+            self._bootstrap_manifest()
+        return self.manifest.get_state()
+    
+    def _bootstrap_manifest(self, page_size: int = 10000):
+        """
+        Build the manifest from the chunk metadata already stored in the collection.
+
+        Args:
+            page_size (int): Number of chunks read per call.
+        """
+        logger.info("Building file manifest from the vector database, this only happens once...")
+        files = {}
+        for offset in range(0, self.collection.count(), page_size):
+            for metadata in self.collection.get(include=["metadatas"], limit=page_size, offset=offset).get("metadatas"):
+                row = files.setdefault(metadata.get("path"), {
+                    "path": metadata.get("path"), "date_modified": str(metadata.get("date_modified")),
+                    "size": None, "chunk_count": 0, "content_hash": None,
+                })
+                row["chunk_count"] += 1
+        self.manifest.upsert_many(files.values())
+    
+    def _bootstrap_lexical_index(self, page_size: int = 10000):
+        """
+        Build the keyword index from the chunks already stored in the collection.
+
+        Args:
+            page_size (int): Number of chunks read per call.
+        """
+        logger.info("Building keyword index from the vector database, this only happens once...")
+        for offset in range(0, self.collection.count(), page_size):
+            page = self.collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            self.lexical_index.upsert_many(
+                page.get("ids"), page.get("documents"), [metadata.get("path") for metadata in page.get("metadatas")]
+            )
+    
+    def _parse_and_queue(self, change_type, file_path=None, date_modified=None):
+        """
+        Parse a file and buffer its chunks, logging any failure against the file.
+
+        Args:
+            change_type (str): One of 'Added' or 'Modified'.
             file_path (str): Path to the file.
             date_modified (str): Date the file was last modified.
         """
         try:
-            data, num_docs = self._create_docs_for_db(file_path=file_path, date_modified=date_modified)
-            if num_docs:
-                for i in range(0, num_docs, self.batch_size):
-                    self.collection.add(
-                        documents=data.get("documents")[i:i+self.batch_size],
-                        metadatas=data.get("metadatas")[i:i+self.batch_size],
-                        ids=data.get("ids")[i:i+self.batch_size],
-                    )
+            data, _ = self._create_docs_for_db(file_path=file_path, date_modified=date_modified)
+            self._queue_change(change_type, file_path, data, date_modified=date_modified)
         except Exception as e:
             logger.error(f"File failed: {file_path}")
             logger.exception(e)
-            pass
+    
+    def add_to_collection(self, file_path=None,date_modified=None):
+        """
+        Add a file to the vector database collection.
+
+        Args:
+            file_path (str): Path to the file.
+            date_modified (str): Date the file was last modified.
+        """
+        self._parse_and_queue('Added', file_path=file_path, date_modified=date_modified)
+        self.flush()
     
     def update_to_collection(self, file_path=None, date_modified=None):
         """
@@ -346,19 +936,8 @@ class VectorDB:
             file_path (str): Path to the file.
             date_modified (str): Date the file was last modified.
         """
-        try:
-            data, num_docs = self._create_docs_for_db(file_path=file_path, date_modified=date_modified)
-            if num_docs:
-                for i in range(0, num_docs, self.batch_size):
-                    self.collection.update(
-                        documents=data.get("documents")[i:i+self.batch_size],
-                        metadatas=data.get("metadatas")[i:i+self.batch_size],
-                        ids=data.get("ids")[i:i+self.batch_size],
-                    )
-        except Exception as e:
-            logger.error(f"File failed: {file_path}")
-            logger.exception(e)
-            pass
+        self._parse_and_queue('Modified', file_path=file_path, date_modified=date_modified)
+        self.flush()
     
     def delete_from_collection(self, file_path=None):
         """
@@ -367,9 +946,8 @@ class VectorDB:
         Args:
             file_path (str): Path to the file.
         """
-        self.collection.delete(
-            where={"path": file_path}
-        )
+        self._queue_change('Deleted', file_path)
+        self.flush()
     
     def update_collection(self, change_list):
         """
@@ -378,49 +956,253 @@ class VectorDB:
         Args:
             change_list (list): List of changes detected.
         """
+        if self.num_parse_workers > 0 and len(change_list) > 1:
+            self._update_collection_pipelined(change_list)
+            return
+        
+        from tqdm import tqdm
         for change in tqdm(change_list):
             change_type, file_path, date_modified = itemgetter("ChangeType","path","date_modified")(change)
             if change_type == 'Deleted':
-                self.delete_from_collection(file_path=file_path)
-            elif change_type == 'Added':
-                self.add_to_collection(file_path=file_path, date_modified=date_modified)
-            elif change_type == 'Modified':
-                self.update_to_collection(file_path=file_path, date_modified=date_modified)
+                self._queue_change(change_type, file_path)
+            elif change_type in ('Added', 'Modified'):
+                self._parse_and_queue(change_type, file_path=file_path, date_modified=date_modified)
             else:
                 # Change type is not defined
                 pass
+        self.flush()
+    
+    def _produce_chunks(self, change_list, chunk_queue):
+        """
+        Parse and chunk files in a pool of worker processes, handing the results to the embedding consumer.
+        The number of files in flight is capped and `chunk_queue` is bounded, so parsing never runs far ahead of embedding.
+
+        Args:
+            change_list (list): List of changes detected.
+            chunk_queue (queue.Queue): Queue of (change, data, error) tuples consumed by `_update_collection_pipelined`.
+        """
+        max_in_flight = 2 * self.num_parse_workers
+        pending = {}
+        
+        def drain(futures):
+            for future in futures:
+                change = pending.pop(future)
+                try:
+                    chunk_queue.put(future.result())
+                except Exception as e:
+                    chunk_queue.put((change, None, repr(e)))
+        
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=self.num_parse_workers) as pool:
+                for change in change_list:
+                    if change.get("ChangeType") not in ("Added", "Modified"):
+                        # Nothing to parse, hand it straight to the consumer
+                        chunk_queue.put((change, None, None))
+                        continue
+                    if len(pending) >= max_in_flight:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        drain(done)
+                    future = pool.submit(parse_change, change, self.chunk_size, self.chunk_overlap)
+                    pending[future] = change
+                drain(list(wait(pending).done))
+        except Exception as e:
+            logger.error("Parse workers failed")
+            logger.exception(e)
+        finally:
+            chunk_queue.put(None)
+    
+    def _update_collection_pipelined(self, change_list):
+        """
+        Update the vector database collection with parsing running in worker processes, so the embedding model
+        only ever waits on the queue of parsed chunks. Failures are logged per file, as in `update_collection`.
+
+        Args:
+            change_list (list): List of changes detected.
+        """
+        from tqdm import tqdm
+        
+        chunk_queue = queue.Queue(maxsize=self.parse_queue_size)
+        producer = threading.Thread(target=self._produce_chunks, args=(change_list, chunk_queue), daemon=True)
+        
+        file_chunks = {}
+        start_time = time.perf_counter()
+        producer.start()
+        with tqdm(total=len(change_list)) as progress:
+            while True:
+                # Time spent here is time the embedding model sat idle waiting for the parse workers
+                with tracing.span("ingest.parse_wait"):
+                    item = chunk_queue.get()
+                if item is None:
+                    break
+                change, data, error = item
+                change_type, file_path = itemgetter("ChangeType","path")(change)
+                progress.update(1)
+                if error is not None:
+                    logger.error(f"File failed: {file_path}")
+                    logger.error(error)
+                    continue
+                num_docs = self._queue_change(change_type, file_path, data, date_modified=change.get("date_modified"))
+                if data is not None:
+                    file_chunks[file_path] = num_docs
+        producer.join()
+        
+        for file_path in self.flush():
+            file_chunks.pop(file_path, None)
+        num_files, num_chunks = len(file_chunks), sum(file_chunks.values())
+        
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        self.last_ingest_stats = {
+            "files": num_files,
+            "chunks": num_chunks,
+            "seconds": elapsed,
+            "files_per_sec": num_files / elapsed,
+            "chunks_per_sec": num_chunks / elapsed,
+        }
+        logger.info(f"Ingested {num_files} files ({num_chunks} chunks) in {elapsed:.1f}s: "
+                    f"{num_files / elapsed:.2f} files/s, {num_chunks / elapsed:.2f} chunks/s")
             
+    def _dense_search(self, query, n_results):
+        """
+        Rank chunks by embedding similarity to the query.
+
+        Returns:
+            tuple: Ranked chunk IDs, chunk ID to document, and the time taken (in seconds).
+        """
+        start = time.perf_counter()
+        (ids, docs), = self._dense_search_many([query], n_results)
+        return ids, docs, time.perf_counter() - start
+    
+    def _dense_search_many(self, queries, n_results):
+        """
+        Rank chunks by embedding similarity for several queries, embedded together in one collection query.
+
+        Returns:
+            list: Ranked chunk IDs and chunk ID to document, for each query.
+        """
+        result = self.collection.query(query_texts=list(queries), n_results=n_results, include=["documents"])
+        return [(ids, dict(zip(ids, docs))) for ids, docs in zip(result.get('ids'), result.get('documents'))]
+    
+    def _lexical_search(self, query, n_results):
+        """
+        Rank chunks by BM25 keyword score against the query.
+
+        Returns:
+            tuple: Ranked chunk IDs, chunk ID to document, and the time taken (in seconds).
+        """
+        start = time.perf_counter()
+        results = self.lexical_index.search(query, limit=n_results)
+        return [result['id'] for result in results], {result['id']: result['document'] for result in results}, time.perf_counter() - start
+    
     def query_collection(self, query):
         """
-        Query the vector database collection.
+        Query the vector database collection. Depending on `retrieval_mode`, chunks are ranked by embedding similarity,
+        by BM25 keyword score, or by both (run concurrently and fused with reciprocal-rank fusion).
+        Per-stage latencies (in seconds) are stored in `last_query_timings`.
 
         Args:
             query (str): Query text.
 
         Returns:
-            list: Query results.
+            str: The `top_k` retrieved chunks.
         """
-        docs = self.collection.query(
-            query_texts=[query],
-            n_results=self.top_k
-        ).get('documents')[0]
-        return "\n\n".join(str(x) for x in flatten(docs))
+        start = time.perf_counter()
+        timings = {}
+        if self.retrieval_mode == "dense":
+            ids, docs, timings["dense"] = self._dense_search(query, self.top_k)
+        elif self.retrieval_mode == "lexical":
+            ids, docs, timings["lexical"] = self._lexical_search(query, self.top_k)
+        else:
+            num_candidates = max(self.top_k, self.hybrid_num_candidates)
+            dense = self._query_pool.submit(self._dense_search, query, num_candidates)
+            lexical = self._query_pool.submit(self._lexical_search, query, num_candidates)
+            dense_ids, docs, timings["dense"] = dense.result()
+            lexical_ids, lexical_docs, timings["lexical"] = lexical.result()
+            docs.update(lexical_docs)
+            
+            fusion_start = time.perf_counter()
+            ids = self._fuse(dense_ids, lexical_ids)
+            timings["fusion"] = time.perf_counter() - fusion_start
+        timings["total"] = time.perf_counter() - start
+        self.last_query_timings = timings
+        tracing.record("vector_db.query", timings["total"], mode=self.retrieval_mode,
+                       **{f"{stage}_ms": elapsed * 1000 for stage, elapsed in timings.items() if stage != "total"})
+        logger.info("Retrieval timings (ms): " + ", ".join(f"{stage}={elapsed * 1000:.1f}" for stage, elapsed in timings.items()))
+        
+        return "\n\n".join(str(docs[id]) for id in ids)
+    
+    def query_collection_many(self, queries):
+        """
+        Query the vector database collection for several queries, with the same ranking as `query_collection`.
+        All queries are embedded in one batch and sent to Chroma in one query; keyword searches run meanwhile.
+
+        Args:
+            queries (List[str]): Query texts.
+
+        Returns:
+            List[str]: The `top_k` retrieved chunks of each query.
+        """
+        if not queries:
+            return []
+        start = time.perf_counter()
+        num_results = self.top_k if self.retrieval_mode != "hybrid" else max(self.top_k, self.hybrid_num_candidates)
+        dense = self._query_pool.submit(self._dense_search_many, queries, num_results) if self.retrieval_mode != "lexical" else None
+        lexical = [self._lexical_search(query, num_results)[:2] for query in queries] if self.retrieval_mode != "dense" else None
+        dense = dense.result() if dense is not None else None
+        
+        contexts = []
+        for i in range(len(queries)):
+            if lexical is None:
+                ids, docs = dense[i]
+            elif dense is None:
+                ids, docs = lexical[i]
+            else:
+                (dense_ids, docs), (lexical_ids, lexical_docs) = dense[i], lexical[i]
+                docs = {**docs, **lexical_docs}
+                ids = self._fuse(dense_ids, lexical_ids)
+            contexts.append("\n\n".join(str(docs[id]) for id in ids))
+        logger.info(f"Retrieved context for {len(queries)} queries in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return contexts
+    
+    def _fuse(self, dense_ids, lexical_ids):
+        """
+        Fuse the dense and keyword rankings with reciprocal-rank fusion.
+
+        Returns:
+            list: The `top_k` best chunk IDs.
+        """
+        fused = reciprocal_rank_fusion({"dense": dense_ids, "lexical": lexical_ids}, weights=self.hybrid_weights, k=RRF_K)
+        return [id for id, _ in fused[:self.top_k]]
         
 
 # WIP - Linux Search Indexer (custom) 
 class LinuxFileIndexer:
-    def __init__(self, db_name="better_search_index.db", vector_db_path="better_search_content.db",config_file="./config.json", log_file="indexer.log", **kwargs):
+    def __init__(self, db_name="better_search_index.db", vector_db_path="better_search_content.db",config_file="./config.json", log_file="indexer.log", debounce=0.5, crawl_workers=8, ingest_batch_size=1000, **kwargs):
         # Setup logging
         logging.basicConfig(filename=log_file,format="%(asctime)s %(message)s",filemode='a')
         
         if not os.path.isfile(db_name):
             logger.info("Index not found, creating...")
         
-        # Connect to database and enable foreign keys    
-        self.conn = sqlite3.connect(db_name)
+        # Connect to database and enable foreign keys. The watcher thread writes through the same connection.
+        self.conn = sqlite3.connect(db_name, check_same_thread=False, cached_statements=256)
         self.conn.execute("PRAGMA foreign_keys = 1")
+        # WAL with synchronous=NORMAL only syncs on checkpoints, instead of on every commit
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute("PRAGMA cache_size = -65536")
+        self.conn.execute("PRAGMA mmap_size = 268435456")
+        self.conn.execute("PRAGMA temp_store = MEMORY")
+        self._lock = threading.RLock()
+        self.ingest_batch_size = ingest_batch_size
         
         self.config_file = config_file
+        self.debounce = debounce
+        self.watcher = None
+        self.crawler = None
+        self.crawl_workers = crawl_workers
+        self.crawl_state_path = os.path.splitext(db_name)[0] + "_crawl_state.json"
+        self.callbacks = [self.update_index]
         
         self.load_config()
         self.__create_tables()
@@ -457,130 +1239,261 @@ class LinuxFileIndexer:
                 {constants.email_metadata_create};
                 {constants.application_metadata_create};
                 {constants.index_maintenance_create};
+                {constants.file_id_indexes_create};
             """)
+        self.__create_fts()
     
-    def add_file(self, file_path):
-        abs_file_path = os.path.abspath(file_path)
-        if not os.path.isfile(abs_file_path):
-            logger.error(f"File not found: {abs_file_path}")
-            return
-        
-        
-        file_stats = os.stat(abs_file_path)
-        file_name = os.path.basename(abs_file_path)
-        file_size = file_stats.st_size
-        date_created = file_stats.st_ctime
-        date_modified = file_stats.st_mtime
-        date_accessed=  file_stats.st_atime
-        
-        content = parse_file_contents(abs_file_path)
-        
+    def __create_fts(self):
+        """
+        Create the FTS5 index over content_index. Content that was indexed before the FTS table existed is added once.
+        """
+        self.fts_enabled = False
         with self.conn:
+            exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'content_fts'").fetchone()
+            try:
+                self.conn.executescript(f"""
+                    {constants.content_fts_create};
+                    {constants.content_fts_triggers_create};
+                """)
+            except sqlite3.OperationalError as e:
+                logger.error("SQLite was built without FTS5, keyword search is disabled")
+                logger.exception(e)
+                return
+            if not exists:
+                self.conn.execute("INSERT INTO content_fts(content_fts) VALUES ('rebuild')")
+        self.fts_enabled = True
+    
+    def search_content(self, query, limit=10, prefix=False, snippet_tokens=16):
+        """
+        Keyword search over the parsed file contents, ranked by BM25. Does not need the embedding model.
+
+        Args:
+            query (str): Words to search for. Every word must appear in the file; quotes and FTS5 operators in
+                the query are matched literally.
+            limit (int): Maximum number of results.
+            prefix (bool): Match words that start with the query words, e.g. "invoic" matches "invoices".
+            snippet_tokens (int): Approximate number of words in each snippet.
+
+        Returns:
+            list: Results in rank order, as dicts with 'file_id', 'path', 'score' (higher is better) and 'snippet' keys.
+                Matched words in the snippet are wrapped in square brackets.
+        """
+        if not self.fts_enabled:
+            return []
+        terms = [term for term in query.split() if term]
+        if not terms:
+            return []
+        match = " ".join('"{}"{}'.format(term.replace('"', '""'), "*" if prefix else "") for term in terms)
+        
+        with self._lock:
             cursor = self.conn.cursor()
-            # Update records
             cursor.execute(
                 """
-                INSERT OR IGNORE INTO file_metadata(
-                    file_path, file_name, file_size, date_created, date_modified, date_accessed   
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (abs_file_path, file_name, file_size, date_created, date_modified, date_accessed)
+                SELECT f.file_id, f.file_path, content_fts.rank, snippet(content_fts, 0, '[', ']', '...', ?)
+                FROM content_fts JOIN file_metadata f ON f.file_id = content_fts.rowid
+                WHERE content_fts MATCH ?
+                ORDER BY content_fts.rank
+                LIMIT ?
+                """, (snippet_tokens, match, limit)
             )
-            file_id = cursor.lastrowid
-            
-            if isinstance(content, str):
-                cursor.execute(
-                    """
-                    INSERT OR REPLACE INTO content_index (
-                        file_id, content
-                    ) VALUES (?, ?)
-                    """, (file_id, content)
-                )
-            elif isinstance(content, defaultdict):
-                cursor.execute(
-                    """
-                    INSERT OR REPLACE INTO image_metadata (
-                        file_id, dimensions, camera_model, date_taken, gps_coordinates 
-                    ) VALUES (?, ?, ?, ?, ?)
-                    """, (file_id, content.get('dimensions'), content.get('camera_model'), content.get('date_taken'), content.get('gps_coordinates'))
-                )
-            elif isinstance(content, tuple):
-                video_metadata, music_metadata = content
-                cursor.execute(
-                    """
-                    INSERT OR REPLACE INTO video_metadata (
-                        file_id, title, duration, frame_rate, dimensions, director
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                    """, (file_id, video_metadata.get('title'), video_metadata.get('duration'), video_metadata.get('frame_rate'), video_metadata.get('dimensions'), video_metadata.get('director'))
-                )
-                cursor.execute(
-                    """
-                    INSERT OR REPLACE INTO music_metadata (
-                        file_id, title, album, artist, genre, duration
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                    """, (file_id, music_metadata.get('title'), music_metadata.get('album'), music_metadata.get('artist'), music_metadata.get('genre'), music_metadata.get('duration'))
+            rows = cursor.fetchall()
+        # bm25() is lower for better matches
+        return [{'file_id': file_id, 'path': path, 'score': -rank, 'snippet': snippet} for file_id, path, rank, snippet in rows]
+    
+    def _stat_record(self, file):
+        """
+        Build the file_metadata row of a file. Stat records from `DirectoryCrawler` (or change records that
+        carry the same keys) are used as they are, otherwise the file is stat'ed.
+
+        Args:
+            file (Union[str, dict]): Path of the file, or a record with a 'path' key.
+
+        Returns:
+            tuple: Row values, or None if the file does not exist.
+        """
+        if isinstance(file, dict):
+            file_path = os.path.abspath(file['path'])
+            if 'file_size' in file:
+                return (
+                    file_path, file.get('file_name') or os.path.basename(file_path), file['file_size'],
+                    str(file['date_created']), str(file['date_modified']), str(file['date_accessed'])
                 )
-            elif isinstance(content, None):
-                # No content to parse
-                pass
-                
-            self.conn.commit()
+        else:
+            file_path = os.path.abspath(file)
+        try:
+            file_stats = os.stat(file_path)
+        except OSError:
+            logger.error(f"File not found: {file_path}")
+            return None
+        # Times are stored as text so the exact value survives, sqlite rounds floats to 15 digits in TEXT columns
+        return (
+            file_path, os.path.basename(file_path), file_stats.st_size,
+            str(file_stats.st_ctime), str(file_stats.st_mtime), str(file_stats.st_atime)
+        )
+    
+    def _parse_contents(self, file_path):
+        try:
+            with tracing.span("linux_index.parse"):
+                return parse_file_contents(file_path)
+        except Exception as e:
+            logger.error(f"File failed: {file_path}")
+            logger.exception(e)
+            return None
+    
+    def _file_ids(self, cursor, file_paths):
+        """
+        Look up the file_id of several files.
 
-    def update_file(self, file_path):
-        abs_file_path = os.path.abspath(file_path)
-        if not os.path.isfile(abs_file_path):
-            logger.error(f"File not found: {abs_file_path}")
-            return
-        
-        file_stat = os.stat(abs_file_path)
-        file_size = file_stat.st_size
-        date_modified = file_stat.st_mtime
-        date_accessed = file_stat.st_atime
+        Args:
+            cursor (sqlite3.Cursor): Cursor of the open transaction.
+            file_paths (list): Absolute paths of the files.
+
+        Returns:
+            dict: Path to file_id.
+        """
+        file_ids = {}
+        # Stay well under SQLite's bound parameter limit
+        for i in range(0, len(file_paths), 500):
+            batch = file_paths[i:i+500]
+            cursor.execute(f"SELECT file_path, file_id FROM file_metadata WHERE file_path IN ({','.join('?' * len(batch))})", batch)
+            file_ids.update(cursor.fetchall())
+        return file_ids
+    
+    def add_files(self, files, contents=None):
+        """
+        Add files to the index, or refresh them if they are already indexed. Files are written in batches of
+        `ingest_batch_size`, each batch in a single transaction with one `executemany` per table.
 
-        content = parse_file_contents(abs_file_path)
+        Args:
+            files (Iterable[Union[str, dict]]): Paths of the files, or stat records from `DirectoryCrawler`.
+            contents (Optional[Iterable]): Parsed contents of each file, as returned by `parse_file_contents`.
+                The files are parsed if None.
 
-        with self.conn:
+        Returns:
+            int: Number of files written.
+        """
+        files = list(files)
+        contents = list(contents) if contents is not None else None
+        num_written = 0
+        for i in range(0, len(files), self.ingest_batch_size):
+            batch = files[i:i+self.ingest_batch_size]
+            rows, parsed = [], []
+            for j, file in enumerate(batch):
+                row = self._stat_record(file)
+                if row is None:
+                    continue
+                rows.append(row)
+                parsed.append(contents[i + j] if contents is not None else self._parse_contents(row[0]))
+            with self._lock:
+                self._write_files(rows, parsed)
+            num_written += len(rows)
+        return num_written
+    
+    def update_files(self, files, contents=None):
+        """
+        Refresh files that are already indexed. Same as `add_files`, which replaces the rows of known files.
+
+        Args:
+            files (Iterable[Union[str, dict]]): Paths of the files, or stat records from `DirectoryCrawler`.
+            contents (Optional[Iterable]): Parsed contents of each file. The files are parsed if None.
+
+        Returns:
+            int: Number of files written.
+        """
+        return self.add_files(files, contents=contents)
+    
+    def _write_files(self, rows, contents):
+        """
+        Write the metadata and contents of a batch of files in one transaction.
+
+        Args:
+            rows (list): file_metadata rows from `_stat_record`.
+            contents (list): Parsed contents of each file.
+        """
+        # A file listed twice in a batch keeps its last version
+        latest = {row[0]: (row, content) for row, content in zip(rows, contents)}
+        rows, contents = [row for row, _ in latest.values()], [content for _, content in latest.values()]
+        with tracing.span("linux_index.write", files=len(rows)), self.conn:
             cursor = self.conn.cursor()
-            cursor.execute('''
-                UPDATE file_metadata
-                SET file_size = ?, date_modified = ?, date_accessed = ?
-                WHERE file_path = ?
-            ''', (file_size, date_modified, date_accessed, abs_file_path))
+            cursor.executemany(
+                """
+                INSERT INTO file_metadata(
+                    file_path, file_name, file_size, date_created, date_modified, date_accessed
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file_path) DO UPDATE SET
+                    file_name = excluded.file_name, file_size = excluded.file_size, date_created = excluded.date_created,
+                    date_modified = excluded.date_modified, date_accessed = excluded.date_accessed
+                """, rows
+            )
+            file_ids = self._file_ids(cursor, [row[0] for row in rows])
             
-            if isinstance(content, str):
-                cursor.execute('''
-                    UPDATE content_index
-                    SET content = ?
-                    WHERE file_id = (SELECT file_id FROM file_metadata WHERE file_path = ?)
-                ''', (content, abs_file_path))
-            elif isinstance(content, defaultdict):
-                cursor.execute(
-                    """
-                    UPDATE content_index
-                    SET dimensions = ?, camera_model = ?, date_taken = ?, gps_coordinates = ? 
-                    WHERE file_id = (SELECT file_id from file_metadata WHERE file_path = ?)
-                    """, (content.get('dimensions'), content.get('camera_model'), content.get('date_taken'), content.get('gps_coordinates'), abs_file_path)
-                )
-            elif isinstance(content, tuple):
-                video_metadata, music_metadata = content
-                cursor.execute(
-                    """
-                    UPDATE video_metadata
-                    SET title = ?, duration = ?, frame_rate = ?, dimensions = ?, director = ?
-                    WHERE file_id = (SELECT file_id from file_metadata WHERE file_path = ?)
-                    """, (video_metadata.get('title'), video_metadata.get('duration'), video_metadata.get('frame_rate'), video_metadata.get('dimensions'), video_metadata.get('director'), abs_file_path)
-                )
-                cursor.execute(
-                    """
-                    UPDATE music_metadata
-                    SET title = ?, album = ?, artist = ?, genre = ?, duration = ?
-                    WHERE file_id = (SELECT file_id from file_metadata WHERE file_path = ?)
-                    """, (music_metadata.get('title'), music_metadata.get('album'), music_metadata.get('artist'), music_metadata.get('genre'), music_metadata.get('duration'), abs_file_path)
-                )
-            elif isinstance(content, None):
-                # No content to update
-                pass
+            # Replace whatever was stored for the files before
+            stale = [(file_id,) for file_id in file_ids.values()]
+            for table in ("content_index", "image_metadata", "video_metadata", "music_metadata"):
+                cursor.executemany(f"DELETE FROM {table} WHERE file_id = ?", stale)
+            
+            content_rows, image_rows, video_rows, music_rows = [], [], [], []
+            for row, content in zip(rows, contents):
+                file_id = file_ids[row[0]]
+                if isinstance(content, str):
+                    content_rows.append((file_id, content))
+                elif isinstance(content, defaultdict):
+                    image_rows.append((file_id, content.get('dimensions'), content.get('camera_model'), content.get('date_taken'), content.get('gps_coordinates')))
+                elif isinstance(content, tuple):
+                    video_metadata, music_metadata = content
+                    if video_metadata is not None:
+                        video_rows.append((file_id, video_metadata.get('title'), video_metadata.get('duration'), video_metadata.get('frame_rate'), video_metadata.get('dimensions'), video_metadata.get('director')))
+                    if music_metadata is not None:
+                        music_rows.append((file_id, music_metadata.get('title'), music_metadata.get('album'), music_metadata.get('artist'), music_metadata.get('genre'), music_metadata.get('duration')))
+                # No content to store otherwise
+            
+            cursor.executemany("INSERT INTO content_index(file_id, content) VALUES (?, ?)", content_rows)
+            cursor.executemany(
+                """
+                INSERT INTO image_metadata (
+                    file_id, dimensions, camera_model, date_taken, gps_coordinates 
+                ) VALUES (?, ?, ?, ?, ?)
+                """, image_rows
+            )
+            cursor.executemany(
+                """
+                INSERT INTO video_metadata (
+                    file_id, title, duration, frame_rate, dimensions, director
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                """, video_rows
+            )
+            cursor.executemany(
+                """
+                INSERT INTO music_metadata (
+                    file_id, title, album, artist, genre, duration
+                ) VALUES (?, ?, ?, ?, ?, ?)
+                """, music_rows
+            )
+    
+    def delete_files(self, file_paths):
+        """
+        Remove files from the index, one transaction per batch. Rows in the other tables are removed by the cascade.
 
-            self.conn.commit()
+        Args:
+            file_paths (Iterable[str]): Paths of the files.
+
+        Returns:
+            int: Number of files removed.
+        """
+        file_paths = [(os.path.abspath(file_path),) for file_path in file_paths]
+        num_deleted = 0
+        for i in range(0, len(file_paths), self.ingest_batch_size):
+            with self._lock, self.conn:
+                cursor = self.conn.cursor()
+                cursor.executemany("DELETE FROM file_metadata WHERE file_path = ?", file_paths[i:i+self.ingest_batch_size])
+                num_deleted += cursor.rowcount
+        return num_deleted
+    
+    def add_file(self, file_path):
+        self.add_files([file_path])
+
+    def update_file(self, file_path):
+        self.update_files([file_path])
             
     def list_all_files(self):
         cursor = self.conn.cursor()
@@ -588,15 +1501,139 @@ class LinuxFileIndexer:
         return [row[0] for row in cursor.fetchall()]
                  
     def delete_file(self, file_path):
-        abs_file_path = os.path.abspath(file_path)
-        with self.conn:
-            self.conn.execute(
-                """
-                DELETE FROM file_metadata WHERE file_path = ?
-                """, (abs_file_path,)
-            )
+        self.delete_files([file_path])
+    
+    def register_callback(self, callback: Callable[[List[Dict]], None]):
+        """
+        Register callback function to be called when changes are detected.
+
+        Args:
+            callback (Callable[[List[Dict]], None]): Callback function that takes a list of changed rows as argument.
+        """
+        self.callbacks.append(callback)
+    
+    def _dispatch_changes(self, changes):
+        """
+        Call the registered callbacks with a list of changes.
+
+        Args:
+            changes (list): List of changes detected.
+        """
+        for callback in self.callbacks:
+            callback(changes)
+    
+    def update_index(self, changes):
+        """
+        Apply a list of changes to the index.
+
+        Args:
+            changes (list): Changes in the format {'ChangeType': ..., 'path': ..., 'date_modified': ...}.
+        """
+        with self._lock:
+            # Consecutive changes of the same kind are written as one batch, keeping the order of the changes
+            for is_deletion, group in groupby(changes, key=lambda change: change['ChangeType'] == 'Deleted'):
+                group = list(group)
+                if is_deletion:
+                    self.delete_files([change['path'] for change in group])
+                else:
+                    self.add_files(group)
+    
+    def _index_folders_config(self):
+        """
+        Get the folders to index and the folders to skip from the config.
+
+        Returns:
+            tuple: List of folders and list of exceptions.
+        """
+        folders = self.config.get('index_folders')
+        exceptions = self.config.get('index_folder_exceptions') or []
+        folders = [folders] if isinstance(folders, str) else folders
+        exceptions = [exceptions] if isinstance(exceptions, str) else exceptions
+        return folders, exceptions
+    
+    def _indexed_state(self):
+        """
+        Get the last modified time of every indexed file.
+
+        Returns:
+            dict: File path to last modified time.
+        """
+        with self._lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT file_path, date_modified FROM file_metadata')
+            return {path: float(date_modified) for path, date_modified in cursor.fetchall()}
+    
+    def index_folders(self, full=False):
+        """
+        Crawl the indexed folders and bring the index up to date. Directories whose modified time has not changed
+        since the last crawl are not listed again, see `DirectoryCrawler`. Changes are dispatched in batches as the
+        crawl progresses, deletions at the end.
+
+        Args:
+            full (bool): List every directory, so files modified in place are found as well.
+
+        Returns:
+            int: Number of changes dispatched.
+        """
+        folders, exceptions = self._index_folders_config()
+        if self.crawler is None:
+            self.crawler = DirectoryCrawler(folders, exclude=exceptions, state_path=self.crawl_state_path, max_workers=self.crawl_workers)
+        known = self._indexed_state()
+        # Nothing indexed yet, so the saved directory state cannot be trusted
+        full = full or not known
+        seen = set()
+        num_changes = 0
+        
+        for batch in self.crawler.crawl(full=full):
+            changes = []
+            for record in batch:
+                seen.add(record['path'])
+                known_mtime = known.get(record['path'])
+                if known_mtime is None:
+                    changes.append({'ChangeType': 'Added', **record})
+                elif known_mtime != record['date_modified']:
+                    changes.append({'ChangeType': 'Modified', **record})
+            if changes:
+                self._dispatch_changes(changes)
+                num_changes += len(changes)
+        
+        # Files can only have disappeared from directories that were listed or no longer exist
+        gone_dirs = self.crawler.scanned_dirs | self.crawler.removed_dirs
+        deleted = [
+            {'ChangeType': 'Deleted', 'path': path, 'date_modified': date_modified}
+            for path, date_modified in known.items()
+            if path not in seen and os.path.dirname(path) in gone_dirs
+        ]
+        if deleted:
+            self._dispatch_changes(deleted)
+            num_changes += len(deleted)
+        
+        self.crawler.save_state()
+        return num_changes
+    
+    def start_monitoring(self):
+        """
+        Start watching the indexed folders with inotify. Changes made since the index was last updated are
+        reported first, after that changes are reported as they happen (debounced by `debounce` seconds).
+        """
+        folders, exceptions = self._index_folders_config()
+        initial_state = self._indexed_state()
+        
+        self.watcher = InotifyWatcher(
+            folders, self._dispatch_changes, exts=PARSABLE_EXTS, exclude=exceptions, debounce=self.debounce
+        )
+        self.watcher.start(initial_state=initial_state)
+    
+    def stop_monitoring(self):
+        """
+        Stop watching the indexed folders.
+        """
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
     
     def close(self):
+        self.stop_monitoring()
         self.conn.close()
         for handler in logger.handlers[:]:
             logger.removeHandler(handler)
@@ -0,0 +1,109 @@
+import os
+import pathlib
+import hashlib
+import logging
+import traceback
+from collections import defaultdict
+from functools import lru_cache
+
+from . import constants
+from .. import tracing
+from .parse import parse_file_contents
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_splitter(kind, chunk_size, chunk_overlap):
+    """
+    Text splitter for a kind of content, created (and langchain_text_splitters imported) on first use.
+
+    Args:
+        kind (str): "markdown" or "text".
+        chunk_size (int): Size of chunks to split documents into.
+        chunk_overlap (int): Overlap between chunks.
+
+    Returns:
+        TextSplitter: The splitter, shared by all calls with the same arguments.
+    """
+    from langchain_text_splitters import MarkdownTextSplitter, RecursiveCharacterTextSplitter
+
+    splitter_class = MarkdownTextSplitter if kind == "markdown" else RecursiveCharacterTextSplitter
+    return splitter_class(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def create_chunks(file_path, date_modified, chunk_size, chunk_overlap):
+    """
+    Parse a file and split its contents into chunks for the vector database.
+
+    Args:
+        file_path (str): Path to the file.
+        date_modified (str): Date the file was last modified.
+        chunk_size (int): Size of chunks to split documents into.
+        chunk_overlap (int): Overlap between chunks.
+
+    Returns:
+        dict: Documents, metadata, and IDs, or None if the file has no text content.
+            IDs are derived from the chunk hash, so an unchanged chunk keeps its ID when text is inserted before it.
+    """
+    with tracing.span("ingest.parse"):
+        content = parse_file_contents(file_path)
+    _, ext = os.path.splitext(os.path.basename(file_path))
+    if not isinstance(content, str):
+        return None
+
+    suffix = pathlib.Path(file_path).suffix
+    if suffix in constants.parsable_exts.get("mupdf") or suffix in constants.markdown_exts:
+        splitter = get_splitter("markdown", chunk_size, chunk_overlap)
+    elif suffix in constants.parsable_exts.get("text"):
+        splitter = get_splitter("text", chunk_size, chunk_overlap)
+    else:
+        return None
+
+    with tracing.span("ingest.chunk", chars=len(content)) as span:
+        docs = [doc.page_content for doc in splitter.create_documents([content])]
+        hashes = [chunk_hash(doc) for doc in docs]
+        span.set(chunks=len(docs))
+    metadatas = [
+        {"path": f"{file_path}", "fileext": f"{ext}", "date_modified": str(date_modified), "chunk_hash": hashes[i], "chunk_index": i}
+        for i in range(len(docs))
+    ]
+    
+    # Repeated chunks within a file get an occurrence suffix to keep IDs unique
+    ids, occurrences = [], defaultdict(int)
+    for h in hashes:
+        ids.append(f"{file_path}_{h[:16]}" + (f"_{occurrences[h]}" if occurrences[h] else ""))
+        occurrences[h] += 1
+    return {"documents": docs, "metadatas": metadatas, "ids": ids}
+
+
+def chunk_hash(text):
+    """
+    Hash the text of a chunk.
+
+    Args:
+        text (str): Chunk text.
+
+    Returns:
+        str: Hex digest of the chunk text.
+    """
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def parse_change(change, chunk_size, chunk_overlap):
+    """
+    Parse and chunk the file referenced by a change record. Runs inside the parse worker processes,
+    so any exception is caught here and returned to the consumer instead of breaking the pool.
+
+    Args:
+        change (dict): Change record with 'ChangeType', 'path' and 'date_modified' keys.
+        chunk_size (int): Size of chunks to split documents into.
+        chunk_overlap (int): Overlap between chunks.
+
+    Returns:
+        tuple: The change record, the chunked documents (or None), and an error string (or None).
+    """
+    try:
+        return change, create_chunks(change.get("path"), change.get("date_modified"), chunk_size, chunk_overlap), None
+    except Exception:
+        return change, None, traceback.format_exc()
@@ -0,0 +1,146 @@
+import re
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"\w+")
+
+
+class LexicalIndex:
+    def __init__(self, path: str):
+        """
+        BM25 keyword index over the same chunks as the vector database, stored next to it.
+        Chunks live in a plain table (so they can be removed by ID or by file) and an external-content
+        FTS5 table over it is kept in sync by triggers.
+
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    rowid INTEGER PRIMARY KEY,
+                    id TEXT UNIQUE,
+                    path TEXT,
+                    document TEXT
+                );
+                CREATE INDEX IF NOT EXISTS chunks_path ON chunks(path);
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    document,
+                    content='chunks',
+                    content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts(rowid, document) VALUES (new.rowid, new.document);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts(chunks_fts, rowid, document) VALUES ('delete', old.rowid, old.document);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE ON chunks BEGIN
+                    INSERT INTO chunks_fts(chunks_fts, rowid, document) VALUES ('delete', old.rowid, old.document);
+                    INSERT INTO chunks_fts(rowid, document) VALUES (new.rowid, new.document);
+                END;
+            """)
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def upsert_many(self, ids: List[str], documents: List[str], paths: List[str]):
+        """
+        Insert or replace chunks.
+
+        Args:
+            ids (List[str]): Chunk IDs, the same as in the vector database.
+            documents (List[str]): Chunk texts.
+            paths (List[str]): Path of the file each chunk belongs to.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO chunks(id, path, document) VALUES (?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET path = excluded.path, document = excluded.document
+                """, list(zip(ids, paths, documents))
+            )
+
+    def delete_ids(self, ids: Iterable[str]):
+        """
+        Delete chunks by ID.
+
+        Args:
+            ids (Iterable[str]): Chunk IDs.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(id,) for id in ids])
+
+    def delete_paths(self, paths: Iterable[str]):
+        """
+        Delete all chunks of several files.
+
+        Args:
+            paths (Iterable[str]): Paths of the files.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM chunks WHERE path = ?", [(path,) for path in paths])
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Rank chunks against a query with BM25. Any query word may match, chunks containing more
+        (and rarer) query words rank higher.
+
+        Args:
+            query (str): Query text. Only its words are used, punctuation and FTS5 operators are ignored.
+            limit (int): Maximum number of results.
+
+        Returns:
+            List[Dict]: Results in rank order, as dicts with 'id', 'document' and 'score' (higher is better) keys.
+        """
+        words = list(dict.fromkeys(_WORD.findall(query)))
+        if not words:
+            return []
+        match = " OR ".join(f'"{word}"' for word in words)
+        with self._lock:
+            rows = self.conn.execute(
+                """
+                SELECT chunks.id, chunks.document, chunks_fts.rank
+                FROM chunks_fts JOIN chunks ON chunks.rowid = chunks_fts.rowid
+                WHERE chunks_fts MATCH ?
+                ORDER BY chunks_fts.rank
+                LIMIT ?
+                """, (match, limit)
+            ).fetchall()
+        # bm25() is lower for better matches
+        return [{'id': id, 'document': document, 'score': -rank} for id, document, rank in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[str]], weights: Dict[str, float] = None, k: int = 60) -> List[tuple]:
+    """
+    Fuse several rankings with weighted reciprocal-rank fusion: score(d) = sum of weight / (k + rank of d), ranks starting at 1.
+
+    Args:
+        rankings (Dict[str, List[str]]): Ranked IDs per retriever.
+        weights (Dict[str, float]): Weight of each retriever. Missing retrievers get a weight of 1.
+        k (int): Damping constant, larger values flatten the difference between top and lower ranks.
+
+    Returns:
+        List[tuple]: (ID, fused score) pairs, best first.
+    """
+    weights = weights or {}
+    scores = {}
+    for name, ranked_ids in rankings.items():
+        weight = weights.get(name, 1.0)
+        for rank, id in enumerate(ranked_ids, start=1):
+            scores[id] = scores.get(id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
@@ -0,0 +1,89 @@
+import sqlite3
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class FileManifest:
+    def __init__(self, path: str):
+        """
+        One row per indexed file, stored next to the vector database, so reconciliation does not need to read
+        the metadata of every chunk.
+
+        Args:
+            path (str): Path of the SQLite database file.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.conn:
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_manifest (
+                    path TEXT PRIMARY KEY,
+                    date_modified TEXT,
+                    size INTEGER,
+                    chunk_count INTEGER,
+                    content_hash TEXT
+                )
+            """)
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM file_manifest").fetchone()[0]
+
+    def upsert_many(self, rows: Iterable[Dict]):
+        """
+        Insert or replace manifest rows.
+
+        Args:
+            rows (Iterable[Dict]): Rows with 'path', 'date_modified', 'size', 'chunk_count' and 'content_hash' keys.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO file_manifest(path, date_modified, size, chunk_count, content_hash)
+                VALUES (:path, :date_modified, :size, :chunk_count, :content_hash)
+                """, list(rows)
+            )
+
+    def delete_many(self, paths: Iterable[str]):
+        """
+        Delete manifest rows.
+
+        Args:
+            paths (Iterable[str]): Paths of the files to remove.
+        """
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM file_manifest WHERE path = ?", [(path,) for path in paths])
+
+    def get(self, path: str) -> Optional[Dict]:
+        """
+        Get the manifest row of a file.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            Optional[Dict]: The manifest row, or None if the file is not indexed.
+        """
+        with self._lock:
+            cursor = self.conn.execute("SELECT * FROM file_manifest WHERE path = ?", (path,))
+            row = cursor.fetchone()
+            return dict(zip([desc[0] for desc in cursor.description], row)) if row else None
+
+    def get_state(self) -> Dict[str, str]:
+        """
+        Get the last modified date of every indexed file.
+
+        Returns:
+            Dict[str, str]: Path to date modified.
+        """
+        with self._lock:
+            return dict(self.conn.execute("SELECT path, date_modified FROM file_manifest"))
+
+    def close(self):
+        self.conn.close()
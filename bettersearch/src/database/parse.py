@@ -2,19 +2,15 @@
 import pathlib
 import logging
 import json
+from functools import lru_cache
 from operator import itemgetter
 from collections import defaultdict
-from itertools import chain
 
-# Installed libraries
-from ffmpeg import FFmpeg
-from PIL import Image, ExifTags
-import pymupdf4llm
-import pymupdf as fitz
+# Installed libraries (ffmpeg, PIL, pymupdf and pymupdf4llm) are imported by each parser on first use
 
 # Others
 from .constants import parsable_exts
-from .util import convert_gps_info_to_lat_lon_alt, get_all_exts
+from .util import convert_gps_info_to_lat_lon_alt, EXT_TO_PARSER
 
 logger = logging.getLogger(__name__)
 
@@ -31,26 +27,58 @@ def parse_file_contents(file_path: str):
     """
     try:
         ext = pathlib.Path(file_path).suffix
-        if pathlib.Path(file_path).suffix not in get_all_exts(parsable_exts):
+        if EXT_TO_PARSER.get(ext) is None:
             return None
-        else:
-            if ext in parsable_exts.get('mupdf'):
-                return _parse_pdf(file_path)
-            elif ext in chain(parsable_exts.get('ffmpeg_audio'), parsable_exts.get('ffmpeg_image'), parsable_exts.get('ffmpeg_video')):
-                return _parse_ffmpeg(file_path, ext)
-            elif ext in parsable_exts.get('text'):
-                return _parse_txt(file_path)
-            else:
-                logger.error(f"The given file is not supported for parsing. Try again: {file_path}")
+        parser = get_parser(ext)
+        if parser is None:
+            logger.error(f"The given file is not supported for parsing. Try again: {file_path}")
+            return None
+        return parser(file_path, ext)
     except:
         pass
 
-def _parse_txt(file_path):
+
+@lru_cache(maxsize=None)
+def get_parser(ext: str):
+    """
+    Resolve the parser of a file extension. The parser's libraries are imported the first time it is resolved, so only
+    the libraries of the file types actually seen are ever loaded.
+
+    Args:
+        ext (str): File extension, including the dot.
+
+    Returns:
+        Callable[[str, str], Any]: Function parsing a file given its path and extension, or None if the extension is
+            not supported or its parser's libraries are not installed.
+    """
+    name = EXT_TO_PARSER.get(ext)
+    if name is None:
+        return None
+    try:
+        if name == 'mupdf':
+            import pymupdf
+            import pymupdf4llm
+            return _parse_pdf
+        elif name in ('ffmpeg_audio', 'ffmpeg_video'):
+            import ffmpeg
+            return _parse_ffmpeg
+        elif name == 'ffmpeg_image':
+            import PIL.Image
+            return _parse_ffmpeg
+        elif name == 'text':
+            return _parse_txt
+    except ImportError as e:
+        logger.error(f"The libraries needed to parse '{ext}' files are not installed")
+        logger.exception(e)
+    return None
+
+def _parse_txt(file_path, ext=None):
     """
     Parse the contents of a text file.
 
     Args:
         file_path (str): Path to the text file.
+        ext (str): File extension, unused.
 
     Returns:
         str: Contents of the text file.
@@ -72,6 +100,7 @@ def _parse_ffmpeg(file_path, ext):
     """
     parsed = None
     if ext in (parsable_exts.get('ffmpeg_audio') + parsable_exts.get('ffmpeg_video')):
+        from ffmpeg import FFmpeg
         ffprobe = FFmpeg(executable="ffprobe").input(f'{file_path}',print_format="json",show_streams=None)
         ffprobe_out = json.loads(ffprobe.execute())
         
@@ -87,6 +116,8 @@ def _parse_ffmpeg(file_path, ext):
         parsed = (video_metadata, audio_metadata)
 
     elif ext in parsable_exts.get('ffmpeg_image'):
+        from PIL import Image, ExifTags
+        
         # Get Exif tags
         exif_tags = defaultdict(str,{ExifTags.TAGS[k]: v for k, v in Image.open(file_path)._getexif().items() if k in ExifTags.TAGS})
         
@@ -107,16 +138,20 @@ def _parse_ffmpeg(file_path, ext):
         
     return parsed
 
-def _parse_pdf(file_path):
+def _parse_pdf(file_path, ext=None):
     """
     Parse the contents of a PDF file using pymupdf4llm.
 
     Args:
         file_path (str): Path to the PDF file.
+        ext (str): File extension, unused.
 
     Returns:
         str: Parsed content of the PDF file in markdown format.
     """
+    import pymupdf as fitz
+    import pymupdf4llm
+    
     doc = fitz.open(file_path)
     if not doc.needs_pass:
         # Parse documents that are not password protected
@@ -37,12 +37,23 @@ def get_all_exts(exts):
     return all_exts
 
 
+# Precomputed once, instead of rebuilding the extension list for every file
+PARSABLE_EXTS = frozenset(get_all_exts(parsable_exts))
+
+# Extension -> parser type. When an extension is listed under several types, the first one wins,
+# in the same order as `parse_file_contents` checks them.
+EXT_TO_PARSER = {}
+for _parser in ('mupdf', 'ffmpeg_audio', 'ffmpeg_image', 'ffmpeg_video', 'text'):
+    for _ext in parsable_exts.get(_parser):
+        EXT_TO_PARSER.setdefault(_ext, _parser)
+
+
 def find_files_recursively(folders):
+        from .crawler import DirectoryCrawler
+        
         files = []
-        for dir in folders:
-            dir_path = Path(dir)
-            if dir_path.exists() and dir_path.is_dir():
-                files.extend([p for p in dir_path.rglob('*') if p.suffix in get_all_exts(parsable_exts)])
+        for batch in DirectoryCrawler([dir for dir in folders if Path(dir).is_dir()]).crawl(full=True):
+            files.extend(Path(record['path']) for record in batch)
         
         return files
 
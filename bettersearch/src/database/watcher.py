@@ -0,0 +1,339 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    def __init__(self, folders: Iterable[str], callback: Callable[[List[Dict]], None], exts: Optional[Iterable[str]] = None,
+                 exclude: Optional[Iterable[str]] = None, debounce: float = 0.5):
+        """
+        Watch folders recursively with inotify and report file changes in the same format as
+        `WindowsFileIndexer.detect_changes`: {'ChangeType': ..., 'path': ..., 'date_modified': ...}.
+
+        Events for a path are debounced, so a burst of writes to one file results in a single change.
+        If the kernel event queue overflows, the watched directories are rescanned and compared to the known state.
+
+        Args:
+            folders (Iterable[str]): Folders to watch recursively.
+            callback (Callable[[List[Dict]], None]): Function called with each list of changes.
+            exts (Optional[Iterable[str]]): File extensions to report, including the leading period. All files if None.
+            exclude (Optional[Iterable[str]]): Folders that are not watched.
+            debounce (float): Time (in seconds) a path must be quiet before its change is reported.
+        """
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.callback = callback
+        self.exts = frozenset(exts) if exts is not None else None
+        self.exclude = tuple(os.path.abspath(folder) for folder in (exclude or []))
+        self.debounce = debounce
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = None
+        self._wake_r, self._wake_w = None, None
+        self._watches = {}      # wd -> directory
+        self._dirs = {}         # directory -> wd
+        self._state = {}        # file path -> mtime
+        self._pending = {}      # file path -> time of last event
+        self._watch_limit_logged = False
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def state(self):
+        """
+        Get the known state of the watched files.
+
+        Returns:
+            dict: File path to last modified time.
+        """
+        return dict(self._state)
+
+    def start(self, initial_state: Optional[Dict[str, float]] = None):
+        """
+        Add the watches and start the event loop in a separate thread.
+
+        Args:
+            initial_state (Optional[Dict[str, float]]): Known file path to last modified time. Files found while adding
+                the watches are compared against it, so changes made while nothing was watching are reported too.
+        """
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self._wake_r, self._wake_w = os.pipe()
+        self._stop_event.clear()
+
+        self._state = dict(initial_state or {})
+        changes = []
+        for folder in self.folders:
+            changes.extend(self._watch_tree(folder))
+        seen = {change['path'] for change in changes}
+        for folder in self.folders:
+            changes.extend(self._scan_deleted(folder, seen))
+        if initial_state is not None and changes:
+            self._emit(changes)
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the event loop and release the inotify instance.
+        """
+        self._stop_event.set()
+        if self._wake_w is not None:
+            os.write(self._wake_w, b"\0")
+        if self._thread is not None:
+            self._thread.join()
+        for fd in (self._fd, self._wake_r, self._wake_w):
+            if fd is not None:
+                os.close(fd)
+        self._fd, self._wake_r, self._wake_w = None, None, None
+        self._watches.clear()
+        self._dirs.clear()
+
+    def _run(self):
+        """
+        Block on the inotify descriptor until events arrive, and report debounced changes. The loop only
+        wakes up on events, on pending debounce deadlines, or when `stop` is called.
+        """
+        while not self._stop_event.is_set():
+            timeout = None
+            if self._pending:
+                timeout = max(0.0, min(self._pending.values()) + self.debounce - time.monotonic())
+            readable, _, _ = select.select([self._fd, self._wake_r], [], [], timeout)
+            if self._wake_r in readable:
+                break
+            if self._fd in readable:
+                self._read_events()
+            self._flush_pending()
+
+    def _read_events(self):
+        """
+        Read and handle all queued inotify events.
+        """
+        try:
+            buffer = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        now = time.monotonic()
+        while offset < len(buffer):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(buffer, offset)
+            offset += _EVENT_HEADER.size
+            name = buffer[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning("inotify event queue overflowed, rescanning watched folders")
+                self._rescan()
+                continue
+
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED or mask & (IN_DELETE_SELF | IN_MOVE_SELF) and not name:
+                # The watched directory itself is gone
+                self._unwatch_tree(directory, now)
+                continue
+
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Files may have been created before the watch was added, so report everything inside
+                    for change in self._watch_tree(path, record_state=False):
+                        self._pending[change['path']] = now
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._unwatch_tree(path, now)
+            elif self._is_tracked(path):
+                self._pending[path] = now
+
+    def _flush_pending(self):
+        """
+        Report changes for paths that have been quiet for at least `debounce` seconds.
+        The change type is decided from the file's current state, so bursts of events collapse into one change.
+        """
+        deadline = time.monotonic() - self.debounce
+        ready = [path for path, last_event in self._pending.items() if last_event <= deadline]
+        changes = []
+        for path in ready:
+            del self._pending[path]
+            change = self._resolve(path)
+            if change is not None:
+                changes.append(change)
+        if changes:
+            self._emit(changes)
+
+    def _resolve(self, path):
+        """
+        Compare a file's current state with its known state.
+
+        Args:
+            path (str): Path of the file.
+
+        Returns:
+            Optional[dict]: Change record, or None if nothing changed.
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        known = self._state.get(path)
+        if mtime is None:
+            if path not in self._state:
+                return None
+            del self._state[path]
+            return {'ChangeType': 'Deleted', 'path': path, 'date_modified': known}
+        self._state[path] = mtime
+        if known is None:
+            return {'ChangeType': 'Added', 'path': path, 'date_modified': mtime}
+        if known != mtime:
+            return {'ChangeType': 'Modified', 'path': path, 'date_modified': mtime}
+        return None
+
+    def _emit(self, changes):
+        try:
+            self.callback(changes)
+        except Exception as e:
+            logger.error("Change callback failed")
+            logger.exception(e)
+
+    def _is_tracked(self, path):
+        return self.exts is None or os.path.splitext(path)[1] in self.exts
+
+    def _is_excluded(self, path):
+        return any(path == folder or path.startswith(folder + os.sep) for folder in self.exclude)
+
+    def _add_watch(self, directory):
+        """
+        Add a watch on a single directory.
+
+        Returns:
+            bool: True if the directory is watched.
+        """
+        if directory in self._dirs:
+            return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC and not self._watch_limit_logged:
+                logger.warning("inotify watch limit reached, raise fs.inotify.max_user_watches to watch all folders")
+                self._watch_limit_logged = True
+            return False
+        self._watches[wd] = directory
+        self._dirs[directory] = wd
+        return True
+
+    def _watch_tree(self, root, record_state=True):
+        """
+        Watch a directory tree and record the files in it.
+
+        Args:
+            root (str): Root of the tree.
+            record_state (bool): Update the known state with the files found.
+
+        Returns:
+            list: Changes for files that are new or modified compared to the known state.
+        """
+        changes = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            if self._is_excluded(directory) or not self._add_watch(directory):
+                continue
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif entry.is_file(follow_symlinks=False) and self._is_tracked(entry.path):
+                                mtime = entry.stat().st_mtime
+                                known = self._state.get(entry.path)
+                                if known is None:
+                                    changes.append({'ChangeType': 'Added', 'path': entry.path, 'date_modified': mtime})
+                                elif known != mtime:
+                                    changes.append({'ChangeType': 'Modified', 'path': entry.path, 'date_modified': mtime})
+                                if record_state:
+                                    self._state[entry.path] = mtime
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        return changes
+
+    def _scan_deleted(self, root, seen):
+        """
+        Find known files under a root that no longer exist.
+
+        Args:
+            root (str): Root of the tree.
+            seen (set): Paths already reported as added or modified.
+
+        Returns:
+            list: Changes for deleted files.
+        """
+        prefix = root + os.sep
+        changes = []
+        for path in [path for path in self._state if path.startswith(prefix) and path not in seen]:
+            if not os.path.isfile(path):
+                changes.append({'ChangeType': 'Deleted', 'path': path, 'date_modified': self._state.pop(path)})
+        return changes
+
+    def _unwatch_tree(self, root, now):
+        """
+        Drop the watches under a removed or moved directory and queue its known files for deletion.
+
+        Args:
+            root (str): Root of the removed tree.
+            now (float): Time of the event.
+        """
+        prefix = root + os.sep
+        for directory in [d for d in self._dirs if d == root or d.startswith(prefix)]:
+            wd = self._dirs.pop(directory)
+            self._watches.pop(wd, None)
+            self._libc.inotify_rm_watch(self._fd, wd)
+        for path in self._state:
+            if path.startswith(prefix):
+                self._pending[path] = now
+
+    def _rescan(self):
+        """
+        Recover from an event queue overflow by rescanning the watched folders against the known state.
+        Watches are re-added for directories that appeared while events were lost.
+        """
+        changes = []
+        for folder in self.folders:
+            found = self._watch_tree(folder)
+            changes.extend(found + self._scan_deleted(folder, {change['path'] for change in found}))
+        if changes:
+            self._emit(changes)
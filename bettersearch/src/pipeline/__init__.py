@@ -1 +1,20 @@
-from .pipeline import BetterSearchPipeline
\ No newline at end of file
+import importlib
+
+# Resolved on first access, so importing the package does not load torch and transformers
+_LAZY_ATTRS = {
+    "BetterSearchPipeline": ".pipeline",
+}
+
+__all__ = list(_LAZY_ATTRS)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,268 @@
+import re
+import logging
+import datetime
+
+from ..database.constants import parsable_exts, WIN_COLS_TO_SYSINDEX
+from ..database.util import format_sqlrows_to_text
+
+logger = logging.getLogger(__name__)
+
+# Extensions that are recognised as bare words ("pdfs", "epub files"). Any other extension must be written with its period.
+COMMON_EXTS = {
+    "pdf", "epub", "mobi", "xps", "cbz", "doc", "docx", "odt", "rtf", "txt", "md", "csv", "tsv", "xls", "xlsx", "ods",
+    "ppt", "pptx", "odp", "html", "xml", "json", "py", "jpg", "jpeg", "png", "gif", "heic", "tiff", "svg", "psd", "webp",
+    "mp3", "wav", "flac", "aac", "m4a", "ogg", "mp4", "mov", "avi", "mkv", "mpeg", "zip", "iso", "exe",
+}
+ALL_EXTS = {ext.lstrip(".").lower() for exts in parsable_exts.values() for ext in exts} | COMMON_EXTS
+
+# Broad file categories, matched against System.Kind
+KINDS = {
+    "picture": r"photos?|pictures?|images?|pics",
+    "video": r"videos?|movies?|clips?",
+    "music": r"music|songs?|audio(?: files)?|tracks?",
+    "document": r"documents?|docs",
+}
+
+ORDERS = {
+    ("size", "DESC"): r"largest|biggest|heaviest",
+    ("size", "ASC"): r"smallest|tiniest",
+    ("date_modified", "DESC"): r"newest|latest|most recent(?:ly (?:modified|changed|edited))?|recently (?:modified|changed|edited)",
+    ("date_modified", "ASC"): r"oldest|least recent(?:ly (?:modified|changed|edited))?",
+}
+
+SIZE_UNITS = {"b": 1, "bytes": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3, "tb": 1024 ** 4}
+
+DATE_COLUMNS = {
+    "date_modified": r"modif(?:y|ied)|chang(?:e|ed)|edit(?:ed)?|updated?|saved?",
+    "date_accessed": r"open(?:ed)?|access(?:ed)?|view(?:ed)?|used?",
+    "date": r"creat(?:e|ed)|made|added?|tak(?:e|en)|took",
+}
+
+PERIODS = r"today|yesterday|(?:this|last) (?:week|month|year)|(?:in the )?(?:last|past) \d+ (?:days?|weeks?|months?)|in \d{4}"
+
+# "did I", "were", "I have" and the like, only taken right before a date verb ("files did I open", "files were edited")
+AUXILIARIES = r"(?:(?:did|do|have|had) (?:i|we|you) |(?:i|we|you) (?:have )?|(?:was|were|is|are|has been|have been) )"
+
+# Words that may remain in a question once every recognised phrase is removed. Anything else means the question
+# asks for something the templates cannot express (e.g. file contents), so it goes to the LLM. Verbs and pronouns
+# are only accepted as part of the phrases above, so free-form questions ("what did I do last week") are not matched.
+FILLER_WORDS = set("""
+    a all an any are can could find for get give in is list me my of please show tell the total what which you your
+""".split())
+
+# Kinds that are not counted, so "my largest music" is not read as a single file
+MASS_KINDS = {"music", "audio"}
+
+DEFAULT_LIMIT = 10
+# Count questions have no TOP, but the number of rows read back is still capped
+MAX_COUNT_ROWS = 100000
+
+
+def _sysindex(column):
+    return WIN_COLS_TO_SYSINDEX[column]
+
+
+def _quote(value):
+    """
+    Quote a string literal for Windows Search SQL.
+    """
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def resolve_period(period, now):
+    """
+    Turn a period phrase into a date range.
+
+    Args:
+        period (str): Phrase such as "yesterday", "last week", "last 3 days" or "in 2023".
+        now (datetime.datetime): Current date and time.
+
+    Returns:
+        tuple: Start (inclusive) and end (exclusive) datetimes.
+    """
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "today":
+        return today, today + datetime.timedelta(days=1)
+    if period == "yesterday":
+        return today - datetime.timedelta(days=1), today
+    if period in ("this week", "last week"):
+        start = today - datetime.timedelta(days=today.weekday())
+        return (start, start + datetime.timedelta(days=7)) if period == "this week" else (start - datetime.timedelta(days=7), start)
+    if period in ("this month", "last month"):
+        start = today.replace(day=1)
+        if period == "this month":
+            return start, (start + datetime.timedelta(days=32)).replace(day=1)
+        return (start - datetime.timedelta(days=1)).replace(day=1), start
+    if period in ("this year", "last year"):
+        start = today.replace(month=1, day=1)
+        return (start, start.replace(year=start.year + 1)) if period == "this year" else (start.replace(year=start.year - 1), start)
+    match = re.fullmatch(r"(?:in the )?(?:last|past) (\d+) (day|week|month)s?", period)
+    if match:
+        days = int(match.group(1)) * {"day": 1, "week": 7, "month": 30}[match.group(2)]
+        return today - datetime.timedelta(days=days - 1), today + datetime.timedelta(days=1)
+    match = re.fullmatch(r"in (\d{4})", period)
+    if match:
+        start = datetime.datetime(int(match.group(1)), 1, 1)
+        return start, start.replace(year=start.year + 1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def match_intent(question):
+    """
+    Recognise questions that can be answered with a fixed query over file metadata: sorting by size or date,
+    a date range, a size threshold, an extension or kind of file, part of the file name, and counting.
+
+    Args:
+        question (str): Question posed by the user.
+
+    Returns:
+        dict: The recognised intent, or None if any part of the question is not understood.
+            Keys: 'intent' ('list' or 'count'), 'ext', 'kind', 'order', 'size', 'date', 'name' and 'limit'.
+    """
+    text = " " + question.lower().strip().rstrip("?.!") + " "
+    intent = {"intent": "list", "ext": None, "kind": None, "order": None, "size": None, "date": None, "name": None, "limit": None}
+
+    def take(pattern):
+        nonlocal text
+        match = re.search(pattern, text)
+        if match:
+            text = text[:match.start()] + " " + text[match.end():]
+        return match
+
+    # Name first, since the name itself may contain any word
+    match = take(r"""\b(?:named|called|with|containing|contains?|having)\s+(?:"([^"]+)"|'([^']+)'|(\S+))\s+in (?:the|their|its) (?:file ?)?names?\b""") \
+        or take(r"""\b(?:whose|where the|with) (?:file ?)?names? (?:contains?|includes?|has|have|with)\s+(?:"([^"]+)"|'([^']+)'|(\S+))""") \
+        or take(r"""\b(?:named|called)\s+(?:"([^"]+)"|'([^']+)'|(\S+))""")
+    if match:
+        intent["name"] = next(group for group in match.groups() if group)
+
+    # Content questions need the LLM and the vector database
+    if re.search(r"\b(?:about|mention\w*|discuss\w*|say|says|said|regarding|related|summar\w*|explain\w*|why|contents?|inside|text)\b", text):
+        return None
+
+    if take(r"\bhow many\b|\bnumber of\b|\bcount(?: of)?\b"):
+        intent["intent"] = "count"
+
+    match = take(r"\b(?:top|first)\s+(\d+)\b")
+    if match:
+        intent["limit"] = int(match.group(1))
+
+    for order, pattern in ORDERS.items():
+        match = take(r"(?:\b(\d+)\s+)?\b(?:" + pattern + r")\b")
+        if match:
+            intent["order"] = order
+            if match.group(1):
+                intent["limit"] = int(match.group(1))
+            break
+
+    match = take(r"\b(larger|bigger|more|greater|over|above|smaller|less|under|below)(?: than)?\s+(\d+(?:\.\d+)?)\s*(b|bytes|kb|mb|gb|tb)\b")
+    if match:
+        operator = ">" if match.group(1) in ("larger", "bigger", "more", "greater", "over", "above") else "<"
+        intent["size"] = (operator, int(float(match.group(2)) * SIZE_UNITS[match.group(3)]))
+
+    # "do I have", "are there"
+    take(r"\b(?:do|did) (?:i|we|you) (?:have|own)\b|\b(?:i|we) (?:have|own)\b|\b(?:are|is) there\b")
+
+    column, date_word = "date_modified", False
+    for name, pattern in DATE_COLUMNS.items():
+        if take(r"\b" + AUXILIARIES + r"?(?:" + pattern + r")\b"):
+            column, date_word = name, True
+            break
+    match = take(r"\b(" + PERIODS + r")\b")
+    if match:
+        intent["date"] = (column, match.group(1))
+    elif date_word and intent["order"] is None:
+        # "files I opened" without a period is not a metadata filter
+        return None
+
+    # Kinds before extensions, so "docs" is not read as ".doc". Whether the file noun is singular decides if a
+    # superlative asks for one file ("the largest photo") or several ("the largest photos")
+    singular = None
+    for kind, pattern in KINDS.items():
+        match = take(r"\b(?:" + pattern + r")\b")
+        if match:
+            intent["kind"] = kind
+            singular = not match.group(0).endswith("s") and match.group(0) not in MASS_KINDS
+            break
+    match = take(r"(?<![\w.])\.(\w+)\b") or take(r"\b(" + "|".join(sorted(COMMON_EXTS, key=len, reverse=True)) + r")(s?)\b")
+    if match:
+        ext = match.group(1).lower()
+        if ext not in ALL_EXTS:
+            return None
+        intent["ext"] = "." + ext
+        if match.lastindex == 2:
+            singular = not match.group(2)
+    noun = take(r"\bfiles?\b")
+    if noun:
+        singular = noun.group(0) == "file"
+
+    # A period or a name alone is not enough ("what did I do last week"): the question must be about files, a kind
+    # or extension of file, or sort or filter them by size
+    if not (noun or intent["ext"] or intent["kind"] or intent["order"] or intent["size"]):
+        return None
+    if any(word not in FILLER_WORDS for word in re.findall(r"[a-z0-9']+", text)):
+        return None
+    if intent["intent"] == "list" and intent["limit"] is None:
+        intent["limit"] = 1 if intent["order"] and singular else DEFAULT_LIMIT
+    return intent
+
+
+def build_query(intent, now=None):
+    """
+    Build the Windows Search SQL query of an intent. Values come from the fixed vocabularies above, or are
+    numbers, dates and the quoted file name fragment, so the query is always well formed.
+
+    Args:
+        intent (dict): Intent from `match_intent`.
+        now (datetime.datetime): Current date and time, used to resolve date ranges.
+
+    Returns:
+        str: Windows Search SQL query.
+    """
+    now = now or datetime.datetime.now()
+    conditions = ["scope='file:'"]
+    if intent["ext"]:
+        conditions.append(f"{_sysindex('fileext')} = {_quote(intent['ext'])}")
+    if intent["kind"]:
+        conditions.append(f"{_sysindex('kind')} = {_quote(intent['kind'])}")
+    if intent["name"]:
+        name = intent["name"].replace("%", "[%]").replace("_", "[_]")
+        conditions.append(f"{_sysindex('name')} LIKE {_quote('%' + name + '%')}")
+    if intent["size"]:
+        operator, size = intent["size"]
+        conditions.append(f"{_sysindex('size')} {operator} {int(size)}")
+    if intent["date"]:
+        column, period = intent["date"]
+        start, end = resolve_period(period, now)
+        conditions.append(f"{_sysindex(column)} >= {_quote(start.strftime('%Y-%m-%d %H:%M:%S'))}")
+        conditions.append(f"{_sysindex(column)} < {_quote(end.strftime('%Y-%m-%d %H:%M:%S'))}")
+
+    if intent["intent"] == "count":
+        columns, top = [_sysindex("path")], f"TOP {MAX_COUNT_ROWS} "
+    else:
+        columns, top = [_sysindex("path"), _sysindex("size"), _sysindex("date_modified")], f"TOP {int(intent['limit'])} "
+    query = f"SELECT {top}{', '.join(columns)} FROM SystemIndex WHERE {' AND '.join(conditions)}"
+    if intent["order"] and intent["intent"] == "list":
+        column, direction = intent["order"]
+        query += f" ORDER BY {_sysindex(column)} {direction}"
+    return query
+
+
+def format_answer(intent, rows, description):
+    """
+    Format the rows of a fast path query as the answer.
+
+    Args:
+        intent (dict): Intent from `match_intent`.
+        rows (list): Rows returned by the query.
+        description (list): Cursor description of the query.
+
+    Returns:
+        str: The answer.
+    """
+    if intent["intent"] == "count":
+        count = len(rows)
+        return f"I was able to query search index.\n\nYou have {count}{'+' if count >= MAX_COUNT_ROWS else ''} matching file{'s' if count != 1 else ''}."
+    if not rows:
+        return "I was able to query search index.\n\nNo matching files were found."
+    return "I was able to query search index.\n\n" + format_sqlrows_to_text(rows, description)
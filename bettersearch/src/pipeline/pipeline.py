@@ -1,17 +1,32 @@
-from transformers import BitsAndBytesConfig
+from transformers import BitsAndBytesConfig, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+import torch
+import time
+import inspect
 import datetime
-from .util import clean_sqlcoder_output, get_file_indexer, get_prompt_format, get_model_and_tokenizer, get_table_info, validate_correct_sql_query
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .util import clean_sqlcoder_output, extract_columns_from_metadata, get_file_indexer, get_prompt_format, get_model, get_tokenizer, get_table_info, validate_correct_sql_query
+from .prefix_cache import PromptPrefixCache, split_prompt_format
+from .fast_path import match_intent, build_query, format_answer
+from .sql_grammar import SqlGrammar, SqlGrammarLogitsProcessor
 from pathlib import Path
 import os
 from ..database.constants import parsable_exts
+from .. import tracing
+from ..registry import MODEL_REGISTRY, ModelKey, quantization_key
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+logger = logging.getLogger(__name__)
         
 class BetterSearchPipeline:
     def __init__(self, model_name: str = None, cache_dir: str = None, 
                  bnb_config: BitsAndBytesConfig = None, kv_cache_flag: bool = True, 
-                 num_beams: int = 4, db_path: str = "better_search_content_db", embd_model_device: str = "cuda", **kwargs) -> None:
+                 num_beams: int = 4, db_path: str = "better_search_content_db", embd_model_device: str = "cuda", 
+                 embd_model_backend: str = "torch", embd_model_int8: bool = False, fast_path: bool = True, 
+                 constrained_decoding: bool = False, tracing_enabled: bool = False, metrics_port: int = None, **kwargs) -> None:
         """
         Initialize the pipeline with the given parameters.
 
@@ -23,86 +38,572 @@ class BetterSearchPipeline:
             num_beams (int): Number of beams for beam search.
             db_path (str): Path to the vector database.
             embd_model_device (str): Device to run the embedding model on.
+            embd_model_backend (str): Inference backend for the embedding model ('torch', 'onnx' or 'openvino').
+            embd_model_int8 (bool): Quantize the embedding model to int8 (only for the 'onnx' and 'openvino' backends).
+            fast_path (bool): Answer simple questions about file metadata (size, dates, type, name, counts) with a fixed
+                query, without running the LLM.
+            constrained_decoding (bool): Generate the SQL query greedily (ignoring `num_beams`), only allowing statements
+                of the Windows Search SQL grammar over the known columns.
+            tracing_enabled (bool): Record the latency of every pipeline stage, see `bettersearch.src.tracing.summary`.
+            metrics_port (int): If set (and tracing is enabled), serve the stage statistics as JSON on
+                http://127.0.0.1:<metrics_port>/metrics.
             **kwargs: Additional keyword arguments.
+        
+        The LLM, its tokenizer, the search index and the vector database load concurrently. The pipeline is returned
+        once it can answer from the search index (fast path and generated SQL queries), which is usually before the
+        vector database has loaded; questions that need file contents wait for it. See `retrieval_ready` and
+        `load_times`.
+        
+        The LLM, tokenizer and embedding model come from the process-wide model registry, so pipelines with the same
+        model settings share them. Call `close` to release them, and `reconfigure` to switch settings in place.
         """
-        self.file_indexer = get_file_indexer(db_path=db_path, device=embd_model_device, cache_dir=cache_dir, **kwargs)
-        self.model, self.tokenizer = get_model_and_tokenizer(model_name, cache_dir, bnb_config, kv_cache_flag, **kwargs)
+        self.config = self._bind_config(
+            model_name=model_name, cache_dir=cache_dir, bnb_config=bnb_config, kv_cache_flag=kv_cache_flag,
+            num_beams=num_beams, db_path=db_path, embd_model_device=embd_model_device, embd_model_backend=embd_model_backend,
+            embd_model_int8=embd_model_int8, fast_path=fast_path, constrained_decoding=constrained_decoding,
+            tracing_enabled=tracing_enabled, metrics_port=metrics_port, **kwargs
+        )
+        self._apply_tracing_config(tracing_enabled, metrics_port)
+        self._load_start = time.perf_counter()
+        self._load_times = {}
+        self._llm_key = self._tokenizer_key = None
+        
+        # The file indexer returns once the search index is connected and loads the vector database on its own thread
+        with ThreadPoolExecutor(max_workers=2) as loader:
+            file_indexer = loader.submit(self._timed_load, "file_indexer", self._load_file_indexer, self.config)
+            tokenizer = loader.submit(self._timed_load, "tokenizer", self._acquire_tokenizer, model_name, cache_dir)
+            self.model = self._timed_load("llm", self._acquire_llm, model_name, cache_dir, bnb_config, kv_cache_flag, **kwargs)
+            self.tokenizer = tokenizer.result()
+            self.file_indexer = file_indexer.result()
         self.num_beams = num_beams
+        self.fast_path = fast_path
         self.sqlPrompt_format = get_prompt_format(Path(BASE_DIR,"sqlcoder_prompt.md"))
         self.llamaPrompt_format = get_prompt_format(Path(BASE_DIR,"llama_prompt.md"))
         self.table_metadata_string, self.table_name = get_table_info()
+        
+        # The instructions and DDL at the start of the SQL prompt never change, so they are prefilled once
+        self._sql_prompt_prefix, self.sqlPrompt_suffix_format = split_prompt_format(
+            self.sqlPrompt_format, ("user_question", "date_time"), table_metadata_string=self.table_metadata_string
+        )
+        # Greedy decoding within the SQL grammar replaces beam search
+        self.sql_grammar = SqlGrammar(extract_columns_from_metadata(self.table_metadata_string), self.table_name) if constrained_decoding else None
+        self.sql_prefix_cache = PromptPrefixCache(self.model, self.tokenizer, self._sql_prompt_prefix, enabled=kv_cache_flag)
         self.file_formats = {k: ", ".join(str(x) for x in v) for k,v in parsable_exts.items()}
         self.history = []
+        # Runs the vector database query while the SQL query is generated
+        self.retrieval_pool = ThreadPoolExecutor(max_workers=1)
+        self._load_times["sql_ready"] = time.perf_counter() - self._load_start
+        logger.info(f"Ready for search index queries after {self._load_times['sql_ready']:.1f}s")
+    
+    @classmethod
+    def _bind_config(cls, **config):
+        """
+        Complete a configuration with the defaults of `__init__`.
+
+        Returns:
+            dict: Every named argument of `__init__`, and the additional keyword arguments.
+        """
+        bound = inspect.signature(cls.__init__).bind(None, **config)
+        bound.apply_defaults()
+        arguments = dict(bound.arguments)
+        arguments.pop("self")
+        kwargs = arguments.pop("kwargs")
+        return {**arguments, **kwargs}
+    
+    @staticmethod
+    def _apply_tracing_config(tracing_enabled, metrics_port):
+        if tracing_enabled:
+            tracing.enable()
+            if metrics_port:
+                tracing.start_metrics_server(port=metrics_port)
+    
+    @staticmethod
+    def _split_config(config):
+        """
+        Returns:
+            tuple: Arguments of `__init__` and the additional keyword arguments (settings of the file indexer).
+        """
+        parameters = inspect.signature(BetterSearchPipeline.__init__).parameters
+        named = {name: value for name, value in config.items() if name in parameters}
+        return named, {name: value for name, value in config.items() if name not in parameters}
+    
+    def _load_file_indexer(self, config):
+        named, kwargs = self._split_config(config)
+        return get_file_indexer(db_path=named["db_path"], device=named["embd_model_device"], cache_dir=named["cache_dir"],
+                                embedding_backend=named["embd_model_backend"], embedding_quantize=named["embd_model_int8"], **kwargs)
+    
+    @staticmethod
+    def _llm_registry_key(model_name, bnb_config, kv_cache_flag):
+        # OpenVINO models run on CPU, the others are placed by device_map="auto"
+        return ModelKey("llm", model_name, quantization_key(bnb_config), "openvino" if "ov" in model_name else "auto",
+                        (("use_cache", kv_cache_flag),))
+    
+    def _acquire_llm(self, model_name, cache_dir, bnb_config, kv_cache_flag, **kwargs):
+        key = self._llm_registry_key(model_name, bnb_config, kv_cache_flag)
+        model = MODEL_REGISTRY.acquire(key, lambda: get_model(model_name, cache_dir, bnb_config, kv_cache_flag, **kwargs))
+        self._llm_key = key
+        return model
+    
+    def _acquire_tokenizer(self, model_name, cache_dir):
+        key = ModelKey("tokenizer", model_name, None, None)
+        tokenizer = MODEL_REGISTRY.acquire(key, lambda: get_tokenizer(model_name, cache_dir))
+        self._tokenizer_key = key
+        return tokenizer
+    
+    def reconfigure(self, **config):
+        """
+        Switch to a new configuration in place, reloading only the components it changes. Takes the same arguments as
+        `__init__`; arguments that are not given take their default values, as they would in a new pipeline.
+
+        - The LLM is swapped if `model_name`, `bnb_config` or `kv_cache_flag` changed, and the tokenizer if `model_name`
+          changed. The old one is released first, so two LLMs are never loaded at once by this pipeline.
+        - The file indexer is rebuilt if `db_path` changed. Otherwise it is kept, without a new start-up reconciliation,
+          and the vector database swaps its embedding model if `embd_model_*` changed and applies the other settings
+          (`top_k`, `retrieval_mode`, `chunk_size`, ...) in place.
+        - Generation settings (`num_beams`, `fast_path`, `constrained_decoding`) are applied directly.
+
+        Must not be called while a question is being answered.
+
+        Args:
+            **config: Pipeline configuration, as for `__init__`.
+
+        Returns:
+            dict: Names of the settings that changed ("changed"), components that were reloaded ("reloaded") and the
+                time it took in seconds ("seconds").
+        """
+        start = time.perf_counter()
+        old, new = self.config, self._bind_config(**config)
+        changed = sorted(name for name in set(old) | set(new) if old.get(name) != new.get(name))
+        reloaded = []
+        if not changed:
+            return {"changed": changed, "reloaded": reloaded, "seconds": time.perf_counter() - start}
+        
+        self._apply_tracing_config(new["tracing_enabled"], new["metrics_port"])
+        if old["tracing_enabled"] and not new["tracing_enabled"]:
+            tracing.enable(False)
+        
+        old_named, old_kwargs = self._split_config(old)
+        new_named, new_kwargs = self._split_config(new)
+        indexer_changed = any(old_named[name] != new_named[name] for name in ("db_path", "embd_model_device", "embd_model_backend", "embd_model_int8")) \
+            or old_kwargs != new_kwargs
+        rebuild_indexer = old["db_path"] != new["db_path"]
+        
+        with ThreadPoolExecutor(max_workers=1) as loader:
+            # The file indexer is updated while the LLM is swapped, both are independent
+            indexer_update = None
+            if rebuild_indexer:
+                reloaded.append("file_indexer")
+                
+                def rebuild():
+                    self.file_indexer.close()
+                    return self._timed_load("file_indexer", self._load_file_indexer, new)
+                
+                indexer_update = loader.submit(rebuild)
+            elif indexer_changed:
+                indexer_update = loader.submit(
+                    self.file_indexer.reconfigure, device=new["embd_model_device"], embedding_backend=new["embd_model_backend"],
+                    embedding_quantize=new["embd_model_int8"], **new_kwargs
+                )
+            
+            llm_key = self._llm_registry_key(new["model_name"], new["bnb_config"], new["kv_cache_flag"])
+            if llm_key != self._llm_key:
+                # Release first: the old and new LLM may not both fit in memory. The prefix cache holds it too.
+                self.model = self.sql_prefix_cache = None
+                MODEL_REGISTRY.release(self._llm_key)
+                self._llm_key = None
+                self.model = self._timed_load("llm", self._acquire_llm, new["model_name"], new["cache_dir"], new["bnb_config"],
+                                              new["kv_cache_flag"], **new_kwargs)
+                reloaded.append("llm")
+            if ModelKey("tokenizer", new["model_name"], None, None) != self._tokenizer_key:
+                self.tokenizer = None
+                MODEL_REGISTRY.release(self._tokenizer_key)
+                self._tokenizer_key = None
+                self.tokenizer = self._timed_load("tokenizer", self._acquire_tokenizer, new["model_name"], new["cache_dir"])
+                reloaded.append("tokenizer")
+            if self.sql_prefix_cache is None or "tokenizer" in reloaded or old["kv_cache_flag"] != new["kv_cache_flag"]:
+                self.sql_prefix_cache = PromptPrefixCache(self.model, self.tokenizer, self._sql_prompt_prefix, enabled=new["kv_cache_flag"])
+            
+            self.num_beams = new["num_beams"]
+            self.fast_path = new["fast_path"]
+            if old["constrained_decoding"] != new["constrained_decoding"]:
+                self.sql_grammar = SqlGrammar(extract_columns_from_metadata(self.table_metadata_string), self.table_name) if new["constrained_decoding"] else None
+            
+            if indexer_update is not None:
+                result = indexer_update.result()
+                if rebuild_indexer:
+                    self.file_indexer = result
+                elif result:
+                    reloaded.append("embedding_model")
+        
+        self.config = new
+        result = {"changed": changed, "reloaded": reloaded, "seconds": time.perf_counter() - start}
+        logger.info(f"Reconfigured the pipeline in {result['seconds']:.1f}s, changed: {changed}, reloaded: {reloaded}")
+        return result
+    
+    def close(self):
+        """
+        Stop the file indexer and release the models. Models that another pipeline still uses stay loaded.
+        """
+        self.retrieval_pool.shutdown()
+        self.file_indexer.close()
+        for key in (self._llm_key, self._tokenizer_key):
+            if key is not None:
+                MODEL_REGISTRY.release(key)
+        self._llm_key = self._tokenizer_key = None
+        self.model = self.tokenizer = self.sql_prefix_cache = None
+    
+    def _timed_load(self, name, load_fn, *args, **kwargs):
+        """
+        Load a component, recording how long it took in `load_times`.
+
+        Args:
+            name (str): Name of the component.
+            load_fn (Callable): Function that loads it.
+            *args, **kwargs: Arguments of `load_fn`.
+
+        Returns:
+            The loaded component.
+        """
+        start = time.perf_counter()
+        with tracing.span(f"load.{name}"):
+            component = load_fn(*args, **kwargs)
+        self._load_times[name] = time.perf_counter() - start
+        return component
+    
+    @property
+    def retrieval_ready(self):
+        """
+        Check if the vector database has finished loading, so questions about file contents are answered without waiting.
+
+        Returns:
+            bool: True if the vector database has loaded (or failed to), False otherwise.
+        """
+        return self.file_indexer.vector_db_ready
+    
+    def wait_until_retrieval_ready(self, timeout: float = None):
+        """
+        Wait for the vector database to finish loading.
+
+        Args:
+            timeout (float): Maximum time to wait, in seconds. Waits indefinitely if None.
+
+        Returns:
+            bool: True if the vector database has finished loading, False on timeout.
+        """
+        return self.file_indexer.wait_for_vector_db(timeout)
     
-    def answer(self, user_question):
+    @property
+    def load_times(self):
+        """
+        Seconds spent loading each component: "llm", "tokenizer", "file_indexer", "search_index", "vector_db",
+        "embedding_model" and "vector_store" (the last three once the vector database has loaded). "sql_ready" and
+        "retrieval_ready" are the seconds from the start of construction until search index and vector database
+        queries could be answered. Components load concurrently, so the times add up to more than the total.
+
+        Returns:
+            dict: Load time of each component and readiness milestone.
+        """
+        load_times = {**self._load_times, **self.file_indexer.load_times}
+        if self.file_indexer.vector_db_loaded_at is not None:
+            load_times["retrieval_ready"] = self.file_indexer.vector_db_loaded_at - self._load_start
+        return load_times
+    
+    def answer(self, user_question, cancel_event: threading.Event = None):
         """
         Generate an answer to the user's question using the LLM and the vector database.
 
         Args:
             user_question (str): The question posed by the user.
+            cancel_event (threading.Event): Stops generation when set, see `answer_stream`.
 
         Returns:
             str: The answer generated by the LLM.
         """
-        # First step: Initial prompt to LLM generates an SQL query
-        curr_prompt = self.sqlPrompt_format.format(
+        for event in self.answer_stream(user_question, cancel_event=cancel_event):
+            if event["type"] == "done":
+                return event["answer"]
+    
+    def answer_stream(self, user_question, cancel_event: threading.Event = None):
+        """
+        Generate an answer to the user's question, yielding progress and answer tokens as they are produced.
+
+        Events are dicts with a "type" key:
+            - {"type": "stage", "stage": "fast_path" | "sql" | "retrieval" | "answer"}: A pipeline step started.
+            - {"type": "token", "text": str}: The next piece of the answer.
+            - {"type": "done", "answer": str, "cancelled": bool}: The complete (cleaned) answer. Always the last event.
+
+        The SQL query is generated with beam search (or constrained greedy decoding) and is not streamed, so tokens are
+        only yielded for the answer.
+
+        Args:
+            user_question (str): The question posed by the user.
+            cancel_event (threading.Event): When set, generation stops after the current token and the
+                "done" event is yielded with whatever was generated so far. Closing the generator also cancels.
+
+        Yields:
+            dict: Pipeline events.
+        """
+        cancel_event = cancel_event or threading.Event()
+        stopping_criteria = StoppingCriteriaList([CancelCriteria(cancel_event)])
+        answer_start = time.perf_counter()
+        
+        # Simple metadata questions are answered with a fixed query; anything not recognised goes to the LLM
+        intent = match_intent(user_question) if self.fast_path else None
+        if intent is not None:
+            yield {"type": "stage", "stage": "fast_path"}
+            with tracing.span("pipeline.fast_path") as span:
+                output = self._fast_path_answer(user_question, intent)
+                span.set(answered=output is not None)
+            if output is not None:
+                tracing.record("pipeline.answer", time.perf_counter() - answer_start, branch="fast_path")
+                yield {"type": "token", "text": output}
+                yield {"type": "done", "answer": output, "cancelled": False}
+                return
+        
+        # The vector query only depends on the question, so it starts now and is used if the SQL path falls back to it
+        # The vector database is only looked up on the pool's thread, so a question the search index answers never
+        # waits for it to load
+        vector_context = self.retrieval_pool.submit(lambda: self.file_indexer.vector_db.query_collection(user_question))
+        
+        # First step: Initial prompt to LLM generates an SQL query. Only the question-specific suffix is prefilled.
+        yield {"type": "stage", "stage": "sql"}
+        curr_prompt_suffix = self.sqlPrompt_suffix_format.format(
             user_question=user_question, 
-            table_metadata_string=self.table_metadata_string, 
             date_time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             )
         
         # Generate the SQL query
-        output = self.tokenizer.batch_decode(
-            self.model.generate(
-                **self.tokenizer(
-                    curr_prompt, return_tensors="pt"
-                ).to(self.model.device),
+        num_beams, logits_processor = self._sql_decoding()
+        with tracing.span("pipeline.sql_generation", num_beams=num_beams, constrained=logits_processor is not None) as span:
+            inputs = self.sql_prefix_cache.generate_inputs(curr_prompt_suffix, num_copies=num_beams)
+            output_ids = self.model.generate(
+                **inputs,
                 num_return_sequences=1,
                 eos_token_id=self.tokenizer.eos_token_id,
                 pad_token_id=self.tokenizer.pad_token_id,
                 max_new_tokens=400,
                 do_sample=False,
-                num_beams=self.num_beams
-            ),
-            skip_special_tokens=True
-        )[0]
+                num_beams=num_beams,
+                logits_processor=logits_processor,
+                stopping_criteria=stopping_criteria,
+            )
+            span.set(tokens_in=inputs["input_ids"].shape[-1], tokens_out=output_ids.shape[-1] - inputs["input_ids"].shape[-1])
+        output = self.tokenizer.batch_decode(output_ids, skip_special_tokens=True)[0]
+        if cancel_event.is_set():
+            vector_context.cancel()
+            tracing.record("pipeline.answer", time.perf_counter() - answer_start, branch="cancelled")
+            yield {"type": "done", "answer": "", "cancelled": True}
+            return
         
         # Clean and validate the generated SQL query
-        output = clean_sqlcoder_output(output, self.table_metadata_string, self.table_name)
-        output = validate_correct_sql_query(output)
+        with tracing.span("pipeline.sql_cleanup"):
+            output = clean_sqlcoder_output(output, self.table_metadata_string, self.table_name)
+            output = validate_correct_sql_query(output)
         
         # Second step: Use user_context (SQL query output or content search) to get the final answer.
-        user_context, answer_preface = self.file_indexer.query(output, user_question)
+        yield {"type": "stage", "stage": "retrieval"}
+        user_context, answer_preface = self.file_indexer.query(output, user_question, vector_context=vector_context)
         curr_prompt = self.llamaPrompt_format.format(
             user_question=user_question,
             user_context=user_context
         )
+        if cancel_event.is_set():
+            tracing.record("pipeline.answer", time.perf_counter() - answer_start, branch="cancelled")
+            yield {"type": "done", "answer": "", "cancelled": True}
+            return
         
-        # Generate the final answer using the user context
-        output = self.tokenizer.batch_decode(
-            self.model.generate(
-                **self.tokenizer(
-                    curr_prompt, return_tensors="pt"
-                ),
-                num_return_sequences=1,
-                max_new_tokens=400,
-                eos_token_id=[self.tokenizer.eos_token_id, self.tokenizer.convert_tokens_to_ids("<|eot_id|>")],
-                pad_token_id=self.tokenizer.eos_token_id,
-                do_sample=True,
-                temperature=0.7,
-                top_p=0.9,
-            ),
-            skip_special_tokens=True
-        )[0].split("```Ans:")[-1].strip()
-        
-        # Clean the final output
-        # Probably should do comprehensive cleanup for assistant answers, we'll see how things go
-        output = answer_preface+output.replace('```','')
-        
-        return output
-        
+        # Generate the final answer using the user context, in a separate thread so tokens can be yielded as they arrive
+        yield {"type": "stage", "stage": "answer"}
+        if answer_preface:
+            yield {"type": "token", "text": answer_preface}
+        # The prompt ends with "```Ans:", so the generated text is the answer itself
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        generation_error = []
+        inputs = self.tokenizer(curr_prompt, return_tensors="pt")
         
+        def generate():
+            try:
+                self.model.generate(
+                    **inputs,
+                    num_return_sequences=1,
+                    max_new_tokens=400,
+                    eos_token_id=[self.tokenizer.eos_token_id, self.tokenizer.convert_tokens_to_ids("<|eot_id|>")],
+                    pad_token_id=self.tokenizer.eos_token_id,
+                    do_sample=True,
+                    temperature=0.7,
+                    top_p=0.9,
+                    stopping_criteria=stopping_criteria,
+                    streamer=streamer,
+                )
+            except Exception as e:
+                generation_error.append(e)
+                # Unblock the consumer
+                streamer.end()
         
+        generation_thread = threading.Thread(target=generate, daemon=True)
+        generation_start = time.perf_counter()
+        first_token_time = None
+        generation_thread.start()
+        pieces = []
+        try:
+            for text in streamer:
+                # Probably should do comprehensive cleanup for assistant answers, we'll see how things go
+                text = text.replace('```', '')
+                if not pieces:
+                    text = text.lstrip()
+                if text:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter() - generation_start
+                    pieces.append(text)
+                    yield {"type": "token", "text": text}
+        finally:
+            # Also reached when the consumer stops iterating early
+            if generation_thread.is_alive():
+                cancel_event.set()
+            generation_thread.join()
+        if generation_error:
+            raise generation_error[0]
         
+        output = answer_preface + "".join(pieces).strip()
+        if tracing.is_enabled():
+            # Includes the time the consumer takes for each token
+            tracing.record(
+                "pipeline.answer_generation", time.perf_counter() - generation_start,
+                tokens_in=inputs["input_ids"].shape[-1],
+                tokens_out=len(self.tokenizer("".join(pieces), add_special_tokens=False).input_ids),
+                time_to_first_token_ms=first_token_time * 1000 if first_token_time is not None else None,
+                cancelled=cancel_event.is_set(),
+            )
+            tracing.record("pipeline.answer", time.perf_counter() - answer_start, branch="llm")
+        yield {"type": "done", "answer": output, "cancelled": cancel_event.is_set()}
+    
+    def answer_many(self, user_questions, batch_size: int = 8):
+        """
+        Answer several questions, batching each LLM step across questions. The SQL queries of a batch are generated
+        together, questions the search index cannot answer get their vector database context in one query, and
+        the final answers are generated together. Questions the fast path answers never reach the LLM.
+
+        Args:
+            user_questions (List[str]): Questions posed by the user.
+            batch_size (int): Number of questions per generation batch.
+
+        Returns:
+            List[str]: The answer to each question, in order.
+        """
+        answers = [None] * len(user_questions)
+        pending = []
+        for i, user_question in enumerate(user_questions):
+            intent = match_intent(user_question) if self.fast_path else None
+            if intent is not None:
+                answers[i] = self._fast_path_answer(user_question, intent)
+            if answers[i] is None:
+                pending.append(i)
         
-        
\ No newline at end of file
+        for batch_start in range(0, len(pending), batch_size):
+            batch = pending[batch_start:batch_start + batch_size]
+            questions = [user_questions[i] for i in batch]
+            
+            # First step: SQL queries for the whole batch. The prefix cache holds one unpadded sequence, so full prompts are used.
+            date_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            num_beams, logits_processor = self._sql_decoding()
+            with tracing.span("pipeline.batch.sql_generation", batch_size=len(questions), num_beams=num_beams):
+                outputs = self._generate_many(
+                    [self.sqlPrompt_format.format(user_question=question, table_metadata_string=self.table_metadata_string, date_time=date_time)
+                     for question in questions],
+                    num_return_sequences=1,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    max_new_tokens=400,
+                    do_sample=False,
+                    num_beams=num_beams,
+                    logits_processor=logits_processor,
+                )
+            queries = []
+            for question, output in zip(questions, outputs):
+                try:
+                    queries.append(validate_correct_sql_query(clean_sqlcoder_output(output, self.table_metadata_string, self.table_name)))
+                except Exception as e:
+                    # One unusable query should not fail the batch, the vector database answers it instead
+                    logger.error(f"Generated SQL query could not be cleaned: {question}")
+                    logger.exception(e)
+                    queries.append("I do not know")
+            
+            # Second step: Search index, with the vector database fallbacks of the batch in one query
+            with tracing.span("pipeline.batch.retrieval", batch_size=len(questions)):
+                contexts = self.file_indexer.query_many(queries, questions)
+            
+            # Final answers for the whole batch
+            with tracing.span("pipeline.batch.answer_generation", batch_size=len(questions)):
+                outputs = self._generate_many(
+                    [self.llamaPrompt_format.format(user_question=question, user_context=user_context)
+                     for question, (user_context, _) in zip(questions, contexts)],
+                    num_return_sequences=1,
+                    max_new_tokens=400,
+                    eos_token_id=[self.tokenizer.eos_token_id, self.tokenizer.convert_tokens_to_ids("<|eot_id|>")],
+                    do_sample=True,
+                    temperature=0.7,
+                    top_p=0.9,
+                )
+            for i, (_, answer_preface), output in zip(batch, contexts, outputs):
+                answers[i] = answer_preface + output.replace('```', '').strip()
+        return answers
+    
+    def _fast_path_answer(self, user_question, intent):
+        """
+        Answer a question recognised by the fast path with its fixed query.
+
+        Returns:
+            str: The answer, or None if the query failed.
+        """
+        try:
+            return format_answer(intent, *self.file_indexer.execute_sql(build_query(intent)))
+        except Exception as e:
+            logger.error(f"Fast path query failed, falling back to the LLM: {user_question}")
+            logger.exception(e)
+            return None
+    
+    def _sql_decoding(self):
+        """
+        Returns:
+            tuple: Number of beams and logits processors for SQL generation.
+        """
+        if self.sql_grammar is not None:
+            # A new processor for every generate call, it keeps the parser state of each sequence
+            return 1, LogitsProcessorList([SqlGrammarLogitsProcessor(self.tokenizer, self.sql_grammar)])
+        return self.num_beams, None
+    
+    def _generate_many(self, prompts, **generate_kwargs):
+        """
+        Generate from several prompts in one batch. Prompts are left-padded, so every prompt ends where generation starts.
+
+        Args:
+            prompts (List[str]): Prompts.
+            **generate_kwargs: Arguments of `generate`.
+
+        Returns:
+            List[str]: Generated text of each prompt, without the prompt.
+        """
+        padding_side, pad_token = self.tokenizer.padding_side, self.tokenizer.pad_token
+        self.tokenizer.padding_side = "left"
+        if pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        try:
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True).to(self.model.device)
+            pad_token_id = self.tokenizer.pad_token_id
+        finally:
+            self.tokenizer.padding_side, self.tokenizer.pad_token = padding_side, pad_token
+        output_ids = self.model.generate(**inputs, pad_token_id=pad_token_id, **generate_kwargs)
+        return self.tokenizer.batch_decode(output_ids[:, inputs["input_ids"].shape[-1]:], skip_special_tokens=True)
+
+
+class CancelCriteria(StoppingCriteria):
+    def __init__(self, cancel_event: threading.Event):
+        """
+        Stopping criteria that ends generation once the cancel event is set.
+
+        Args:
+            cancel_event (threading.Event): Event set by the caller to cancel generation.
+        """
+        self.cancel_event = cancel_event
+    
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.cancel_event.is_set(), dtype=torch.bool, device=input_ids.device)
@@ -0,0 +1,115 @@
+import logging
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+
+def split_prompt_format(prompt_format, dynamic_fields, **static_fields):
+    """
+    Split a prompt format into a static prefix, filled in once, and the format of the rest.
+
+    Args:
+        prompt_format (str): Prompt with `str.format` placeholders.
+        dynamic_fields (Iterable[str]): Placeholders that change with every question. The prefix ends at the start of
+            the line holding the first of them, so no token is split across the prefix and the suffix.
+        **static_fields: Values of the placeholders that appear in the prefix.
+
+    Returns:
+        tuple: The filled-in prefix and the format string of the suffix.
+    """
+    split_at = min(
+        (prompt_format.find("{" + field + "}") for field in dynamic_fields if "{" + field + "}" in prompt_format),
+        default=len(prompt_format),
+    )
+    split_at = prompt_format.rfind("\n", 0, split_at) + 1
+    return prompt_format[:split_at].format(**static_fields), prompt_format[split_at:]
+
+
+class PromptPrefixCache:
+    def __init__(self, model, tokenizer, prefix: str, enabled: bool = True):
+        """
+        Key/value cache of a constant prompt prefix. The prefix is prefilled once, after that every prompt that starts
+        with it only needs its own suffix prefilled. The cache is copied for every beam so generation never modifies it.
+
+        Only Hugging Face models take a precomputed cache. OpenVINO models keep their key/values inside the compiled
+        model's state, so for them only the tokenized prefix is reused.
+
+        Args:
+            model: The causal language model.
+            tokenizer: Tokenizer of the model.
+            prefix (str): Constant start of every prompt.
+            enabled (bool): Compute the key/value cache. If False only the tokenized prefix is reused.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.prefix_ids = tokenizer(prefix, return_tensors="pt").input_ids
+        self.key_values = None
+
+        if enabled and self._supports_past_key_values():
+            self.key_values = self._prefill()
+        else:
+            logger.info("Prompt prefix key/value cache is not used for this model, only the tokenized prefix is reused")
+
+    def _supports_past_key_values(self):
+        # OVModelForCausalLM is not a transformers PreTrainedModel, and its stateful export hides the key/values
+        from transformers import PreTrainedModel
+        return isinstance(self.model, PreTrainedModel) and getattr(self.model.config, "use_cache", True)
+
+    @torch.no_grad()
+    def _prefill(self):
+        """
+        Run the model over the prefix once.
+
+        Returns:
+            list: Key and value tensors of each layer, or None if the model failed to return a cache.
+        """
+        try:
+            past_key_values = self.model(input_ids=self.prefix_ids.to(self.model.device), use_cache=True).past_key_values
+        except Exception as e:
+            logger.error("Failed to prefill the prompt prefix, the key/value cache is not used")
+            logger.exception(e)
+            return None
+        if hasattr(past_key_values, "to_legacy_cache"):
+            past_key_values = past_key_values.to_legacy_cache()
+        logger.info(f"Prefilled {self.prefix_ids.shape[-1]} prompt prefix tokens")
+        return [(key, value) for key, value in past_key_values]
+
+    def past_key_values(self, num_copies: int = 1):
+        """
+        Get a fresh copy of the prefix cache for one prompt.
+
+        Args:
+            num_copies (int): Number of sequences that are generated for the prompt (e.g. the number of beams).
+
+        Returns:
+            DynamicCache: Cache with `num_copies` rows, or None if the key/value cache is not used.
+        """
+        if self.key_values is None:
+            return None
+        from transformers import DynamicCache
+        cache = DynamicCache()
+        for layer_idx, (key, value) in enumerate(self.key_values):
+            # repeat_interleave allocates new tensors, so generation never writes to the stored prefix
+            cache.update(key.repeat_interleave(num_copies, dim=0), value.repeat_interleave(num_copies, dim=0), layer_idx)
+        return cache
+
+    def generate_inputs(self, suffix: str, num_copies: int = 1):
+        """
+        Build the `generate` inputs for a prompt that starts with the prefix.
+
+        Args:
+            suffix (str): Rest of the prompt after the prefix.
+            num_copies (int): Number of sequences that are generated for the prompt (e.g. the number of beams).
+
+        Returns:
+            dict: `input_ids` and `attention_mask` of the full prompt, and `past_key_values` if the cache is used.
+        """
+        suffix_ids = self.tokenizer(suffix, return_tensors="pt", add_special_tokens=False).input_ids
+        input_ids = torch.cat([self.prefix_ids, suffix_ids], dim=-1).to(self.model.device)
+        inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+        past_key_values = self.past_key_values(num_copies)
+        if past_key_values is not None:
+            inputs["past_key_values"] = past_key_values
+        return inputs
@@ -0,0 +1,343 @@
+import logging
+
+import torch
+from transformers import LogitsProcessor
+
+logger = logging.getLogger(__name__)
+
+DATEADD_UNITS = {"year", "quarter", "month", "week", "day", "hour", "minute", "second"}
+COMPARISONS = {"=", "<", ">", "<=", ">=", "<>", "!="}
+# Characters that are lexemes by themselves. '<', '>' and '!' may start a two-character operator.
+PUNCTUATION = set(",()*=;`-")
+OPERATOR_STARTS = set("<>!")
+
+
+def _state(words=None, column=None, table=None, number=None, string=None, punct=None, end=False):
+    return {"words": words or {}, "column": column, "table": table, "number": number, "string": string,
+            "punct": punct or {}, "end": end}
+
+
+# Windows Search SQL subset accepted by the grammar:
+#   SELECT [TOP n] <columns | *> FROM <table> [WHERE <condition>] [ORDER BY <column> [ASC | DESC], ...] [;]
+# where a condition combines (with AND, OR, NOT and parentheses) comparisons with a string, number or
+# DATEADD(unit, n, GETGMTDATE()), [NOT] LIKE, IS [NOT] NULL, CONTAINS/FREETEXT([column,] 'text') and SCOPE/DIRECTORY.
+# The model may also answer "I do not know". A statement ends at its last clause, ';' or the closing '```'.
+_END = {";": "complete", "`": "complete"}
+STATES = {
+    "start": _state(words={"select": "select", "i": "idk_do"}),
+    "idk_do": _state(words={"do": "idk_not"}),
+    "idk_not": _state(words={"not": "idk_know"}),
+    "idk_know": _state(words={"know": "complete", "know.": "complete"}),
+    "select": _state(words={"top": "top"}, column="select_column", punct={"*": "select_column"}),
+    "top": _state(number="top_n"),
+    "top_n": _state(column="select_column", punct={"*": "select_column"}),
+    "select_column": _state(words={"from": "from"}, punct={",": "select_next"}),
+    "select_next": _state(column="select_column"),
+    "from": _state(table="table"),
+    "table": _state(words={"where": "condition", "order": "order"}, punct=_END, end=True),
+    "condition": _state(words={"not": "condition", "contains": "function", "freetext": "function",
+                               "scope": "predicate", "directory": "predicate"},
+                        column="predicate", punct={"(": "condition"}),
+    "function": _state(punct={"(": "function_arg"}),
+    "function_arg": _state(column="function_column", string="function_text", punct={"*": "function_column"}),
+    "function_column": _state(punct={",": "function_text_arg"}),
+    "function_text_arg": _state(string="function_text"),
+    "function_text": _state(punct={")": "condition_end"}),
+    "predicate": _state(words={"like": "like", "not": "predicate_not", "is": "is"}, punct={op: "value" for op in COMPARISONS}),
+    "predicate_not": _state(words={"like": "like"}),
+    "like": _state(string="condition_end"),
+    "is": _state(words={"null": "condition_end", "not": "is_not"}),
+    "is_not": _state(words={"null": "condition_end"}),
+    "value": _state(words={"dateadd": "dateadd"}, number="condition_end", string="condition_end", punct={"-": "negative"}),
+    "negative": _state(number="condition_end"),
+    "dateadd": _state(punct={"(": "dateadd_unit"}),
+    "dateadd_unit": _state(words={unit: "dateadd_comma" for unit in DATEADD_UNITS}),
+    "dateadd_comma": _state(punct={",": "dateadd_amount"}),
+    "dateadd_amount": _state(number="dateadd_comma2", punct={"-": "dateadd_negative"}),
+    "dateadd_negative": _state(number="dateadd_comma2"),
+    "dateadd_comma2": _state(punct={",": "dateadd_date"}),
+    "dateadd_date": _state(words={"getgmtdate": "getgmtdate"}, string="dateadd_close"),
+    "getgmtdate": _state(punct={"(": "getgmtdate_close"}),
+    "getgmtdate_close": _state(punct={")": "dateadd_close"}),
+    "dateadd_close": _state(punct={")": "condition_end"}),
+    # Inside parentheses a condition can only continue or close, at the top level it can also end the statement
+    "condition_end": _state(words={"and": "condition", "or": "condition", "order": "order"}, punct=_END, end=True),
+    "condition_end_nested": _state(words={"and": "condition", "or": "condition"}, punct={")": "condition_end"}),
+    "order": _state(words={"by": "order_column"}),
+    "order_column": _state(column="order_after"),
+    "order_after": _state(words={"asc": "order_direction", "desc": "order_direction"}, punct={",": "order_column", **_END}, end=True),
+    "order_direction": _state(punct={",": "order_column", **_END}, end=True),
+    "complete": _state(punct={"`": "complete"}, end=True),
+}
+
+
+class SqlGrammar:
+    def __init__(self, columns, table_name):
+        """
+        Grammar of the Windows Search SQL statements the SQL generation step may produce, over the known columns.
+
+        Args:
+            columns (List[str]): Column names of the table, e.g. from `extract_columns_from_metadata`.
+            table_name (str): Name of the table.
+        """
+        self.columns = {column.lower() for column in columns}
+        self.table_name = table_name.lower()
+
+    def parser(self):
+        """
+        Returns:
+            SqlPrefixParser: Parser at the start of a statement.
+        """
+        return SqlPrefixParser(self)
+
+    def is_valid(self, text):
+        """
+        Check if a text is one complete statement of the grammar.
+
+        Args:
+            text (str): SQL query.
+
+        Returns:
+            bool: True if the text is a complete statement.
+        """
+        parser = self.parser()
+        return parser.feed(text) and parser.can_end()
+
+
+class SqlPrefixParser:
+    __slots__ = ("grammar", "state", "depth", "lexeme", "buffer", "failed")
+
+    def __init__(self, grammar):
+        """
+        Incremental parser that checks if the text fed so far is the start of a statement of the grammar.
+        Text is fed character by character, so it can be checked one token at a time while the model generates.
+
+        Args:
+            grammar (SqlGrammar): Grammar to parse.
+        """
+        self.grammar = grammar
+        self.state = "start"
+        self.depth = 0
+        # Lexeme being read: None between lexemes, or 'word', 'number', 'string', 'string_quote' or 'operator'
+        self.lexeme = None
+        self.buffer = ""
+        self.failed = False
+
+    def copy(self):
+        parser = SqlPrefixParser.__new__(SqlPrefixParser)
+        parser.grammar, parser.state, parser.depth = self.grammar, self.state, self.depth
+        parser.lexeme, parser.buffer, parser.failed = self.lexeme, self.buffer, self.failed
+        return parser
+
+    @property
+    def complete(self):
+        """
+        True once the statement has been terminated, after that only whitespace may follow.
+        """
+        return self.state == "complete" and self.lexeme is None
+
+    def _spec(self):
+        if self.state == "condition_end" and self.depth > 0:
+            return STATES["condition_end_nested"]
+        return STATES[self.state]
+
+    def _word_allowed(self, prefix):
+        spec = self._spec()
+        return any(word.startswith(prefix) for word in spec["words"]) \
+            or (spec["column"] is not None and any(column.startswith(prefix) for column in self.grammar.columns)) \
+            or (spec["table"] is not None and self.grammar.table_name.startswith(prefix))
+
+    def _accept(self, kind, text):
+        spec = self._spec()
+        if kind == "word":
+            word = text.lower()
+            if word in spec["words"]:
+                next_state = spec["words"][word]
+            elif spec["column"] is not None and word in self.grammar.columns:
+                next_state = spec["column"]
+            elif spec["table"] is not None and word == self.grammar.table_name:
+                next_state = spec["table"]
+            else:
+                return False
+        elif kind == "punct":
+            if text not in spec["punct"]:
+                return False
+            next_state = spec["punct"][text]
+            if text == "(" and self.state == "condition":
+                self.depth += 1
+            elif text == ")" and self.state == "condition_end":
+                self.depth -= 1
+        else:
+            next_state = spec[kind]
+            if next_state is None:
+                return False
+        self.state = next_state
+        return True
+
+    def _feed_char(self, char):
+        if self.lexeme == "string":
+            if char == "'":
+                self.lexeme = "string_quote"
+            return True
+        if self.lexeme == "string_quote":
+            # '' is an escaped quote inside the string
+            if char == "'":
+                self.lexeme = "string"
+                return True
+            self.lexeme = None
+            if not self._accept("string", ""):
+                return False
+        elif self.lexeme == "word":
+            if char.isalnum() or char in "_.":
+                self.buffer += char
+                return self._word_allowed(self.buffer.lower())
+            self.lexeme = None
+            if not self._accept("word", self.buffer):
+                return False
+        elif self.lexeme == "number":
+            if char.isdigit() or (char == "." and "." not in self.buffer):
+                self.buffer += char
+                return True
+            self.lexeme = None
+            if not self._accept("number", self.buffer):
+                return False
+        elif self.lexeme == "operator":
+            self.lexeme = None
+            if self.buffer + char in COMPARISONS:
+                return self._accept("punct", self.buffer + char)
+            if not self._accept("punct", self.buffer):
+                return False
+
+        # Between lexemes
+        spec = self._spec()
+        if char.isspace():
+            return True
+        if char.isalpha() or char == "_":
+            self.lexeme, self.buffer = "word", char
+            return self._word_allowed(char.lower())
+        if char.isdigit():
+            self.lexeme, self.buffer = "number", char
+            return spec["number"] is not None
+        if char == "'":
+            self.lexeme = "string"
+            return spec["string"] is not None
+        if char in OPERATOR_STARTS:
+            self.lexeme, self.buffer = "operator", char
+            return any(op.startswith(char) for op in spec["punct"])
+        if char in PUNCTUATION:
+            return self._accept("punct", char)
+        return False
+
+    def feed(self, text):
+        """
+        Feed more text to the parser.
+
+        Args:
+            text (str): Text that follows what was fed so far.
+
+        Returns:
+            bool: False if the text fed so far can no longer be the start of a statement. The parser stays failed.
+        """
+        if self.failed:
+            return False
+        for char in text:
+            if not self._feed_char(char):
+                self.failed = True
+                return False
+        return True
+
+    def can_end(self):
+        """
+        Returns:
+            bool: True if the text fed so far is a complete statement.
+        """
+        if self.failed:
+            return False
+        if self.lexeme == "string":
+            return False
+        parser = self.copy()
+        # Whitespace finishes the lexeme being read, the same way the end of the text does
+        return parser.feed(" ") and parser._spec()["end"]
+
+
+class SqlGrammarLogitsProcessor(LogitsProcessor):
+    def __init__(self, tokenizer, grammar: SqlGrammar, search_width: int = 200, num_allowed: int = 1):
+        """
+        Logits processor that only lets the model generate statements of a SQL grammar, and ends generation after the
+        first complete statement. Each step, the highest scoring tokens are checked in order against the grammar and
+        every other token is masked. A new processor must be used for every `generate` call.
+
+        If none of the `search_width` best tokens fits the grammar, the step is left unconstrained, and the sequence is
+        not constrained again (the usual cleanup of the generated query still applies).
+
+        Args:
+            tokenizer: Tokenizer of the model.
+            grammar (SqlGrammar): Grammar of the statements.
+            search_width (int): Number of highest scoring tokens checked each step.
+            num_allowed (int): Number of valid tokens kept each step. 1 is enough for greedy decoding; use the number
+                of beams for beam search.
+        """
+        self.tokenizer = tokenizer
+        self.grammar = grammar
+        self.search_width = search_width
+        self.num_allowed = num_allowed
+        self.eos_token_id = tokenizer.eos_token_id
+        self.special_ids = set(tokenizer.all_special_ids) - {self.eos_token_id}
+        self.prompt_length = None
+        # Row -> (generated token IDs, parser after them)
+        self._rows = {}
+        self._token_texts = {}
+
+    def _token_text(self, token_id):
+        text = self._token_texts.get(token_id)
+        if text is None:
+            text = self._token_texts[token_id] = self.tokenizer.decode([token_id], clean_up_tokenization_spaces=False)
+        return text
+
+    def _parser(self, row, generated):
+        token_ids, parser = self._rows.get(row, ((), None))
+        if parser is None or tuple(generated[:len(token_ids)]) != token_ids:
+            # New row, or beam search reordered the rows
+            token_ids, parser = (), self.grammar.parser()
+        for token_id in generated[len(token_ids):]:
+            if token_id != self.eos_token_id:
+                parser.feed(self._token_text(token_id))
+        self._rows[row] = (tuple(generated), parser)
+        return parser
+
+    def _allowed_tokens(self, parser, scores):
+        if parser.complete:
+            return [self.eos_token_id]
+        allowed = []
+        for token_id in torch.topk(scores, min(self.search_width, scores.shape[-1])).indices.tolist():
+            if token_id == self.eos_token_id:
+                valid = parser.can_end()
+            elif token_id in self.special_ids:
+                valid = False
+            else:
+                text = self._token_text(token_id)
+                valid = bool(text) and parser.copy().feed(text)
+            if valid:
+                allowed.append(token_id)
+                if len(allowed) >= self.num_allowed:
+                    break
+        if not allowed and parser.can_end():
+            allowed.append(self.eos_token_id)
+        return allowed
+
+    def __call__(self, input_ids, scores):
+        if self.prompt_length is None:
+            self.prompt_length = input_ids.shape[1]
+        for row in range(input_ids.shape[0]):
+            parser = self._parser(row, input_ids[row, self.prompt_length:].tolist())
+            if parser.failed:
+                continue
+            allowed = self._allowed_tokens(parser, scores[row])
+            if not allowed:
+                logger.debug("No token among the best candidates fits the SQL grammar, decoding is no longer constrained")
+                parser.failed = True
+                continue
+            mask = torch.full_like(scores[row], float("-inf"))
+            mask[allowed] = 0
+            scores[row] = scores[row] + mask
+        return scores
@@ -38,8 +38,8 @@ def remove_aliases_from_query(query, columns, table_name):
 
 # Extract fully qualified column names from the table metadata.
 def extract_columns_from_metadata(metadata):
-    # Match fully qualified column names
-    column_pattern = re.compile(r'\b(\w+\.\w+)\s+\w+', re.IGNORECASE)
+    # Match the column name at the start of each column definition (e.g. System.Search.Rank, MimeType)
+    column_pattern = re.compile(r'^[ \t]+(\w+(?:\.\w+)*)\s+\w+', re.IGNORECASE | re.MULTILINE)
     columns = column_pattern.findall(metadata)
     return columns
 
@@ -139,8 +139,16 @@ def validate_correct_sql_query(input_query):
 
 # Get model and tokenizer based on model type (OpenVINO vs Regular PyTorch/HuggingFace)
 def get_model_and_tokenizer(model_name, cache_dir, bnb_config, kv_cache_flag, **kwargs):
+    tokenizer = get_tokenizer(model_name, cache_dir)
+    model = get_model(model_name, cache_dir, bnb_config, kv_cache_flag, **kwargs)
+    return model, tokenizer
+
+# Separate methods for the tokenizer and the model, so they can be loaded concurrently
+def get_tokenizer(model_name, cache_dir):
     from transformers import AutoTokenizer
-    tokenizer = AutoTokenizer.from_pretrained(pretrained_model_name_or_path=model_name, cache_dir=cache_dir, use_fast=True)
+    return AutoTokenizer.from_pretrained(pretrained_model_name_or_path=model_name, cache_dir=cache_dir, use_fast=True)
+
+def get_model(model_name, cache_dir, bnb_config, kv_cache_flag, **kwargs):
     if "ov" in model_name:
         from optimum.intel.openvino import OVModelForCausalLM
         model = OVModelForCausalLM.from_pretrained(
@@ -150,6 +158,7 @@ def get_model_and_tokenizer(model_name, cache_dir, bnb_config, kv_cache_flag, **
             )
     else:
         from transformers import AutoModelForCausalLM
+        # With a device_map, safetensors checkpoints are memory-mapped and each weight is copied once to its device
         model = AutoModelForCausalLM.from_pretrained(
             pretrained_model_name_or_path=model_name, 
             cache_dir=cache_dir,
@@ -157,9 +166,10 @@ def get_model_and_tokenizer(model_name, cache_dir, bnb_config, kv_cache_flag, **
             quantization_config=bnb_config,
             trust_remote_code=True,
             device_map="auto", 
+            low_cpu_mem_usage=True,
             )
     
-    return model, tokenizer
+    return model
 
 # Separate method for getting prompt
 def get_prompt_format(file):
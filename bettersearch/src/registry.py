@@ -0,0 +1,147 @@
+"""
+Process-wide registry of loaded models, so pipelines and vector databases with the same model settings share one copy.
+
+Models are keyed by `ModelKey(kind, model_name, quantization, device, options)`. `acquire` returns the loaded model for a key,
+loading it on first use, and counts a reference; `release` drops the reference and unloads the model once nothing
+uses it anymore. Every `acquire` must be paired with one `release`.
+
+    key = ModelKey("llm", "defog/llama-3-sqlcoder-8b", '{"load_in_8bit": true}', "auto")
+    model = MODEL_REGISTRY.acquire(key, lambda: load_model(...))
+    ...
+    MODEL_REGISTRY.release(key)
+"""
+import gc
+import sys
+import json
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+# kind: what the model is used for ("llm", "tokenizer", "embedding_model"). quantization, device and options: any
+# hashable description of how it was loaded (None if not applicable), options being other loader arguments that
+# change the loaded model
+ModelKey = namedtuple("ModelKey", ["kind", "model_name", "quantization", "device", "options"], defaults=[None])
+
+
+def quantization_key(config):
+    """
+    Hashable description of a quantization config.
+
+    Args:
+        config (dict or BitsAndBytesConfig): Quantization config, or None.
+
+    Returns:
+        str: The config as sorted JSON, or None if there is no config.
+    """
+    if config is None:
+        return None
+    if hasattr(config, "to_dict"):
+        config = config.to_dict()
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+class ModelRegistry:
+    def __init__(self):
+        """
+        Reference-counted cache of loaded models. Thread-safe: a model that several threads acquire at once is
+        loaded once, and the other threads wait for it.
+        """
+        self._lock = threading.Lock()
+        # key -> Future of the model, and number of holders
+        self._models = {}
+        self._refcounts = {}
+
+    def acquire(self, key: ModelKey, load_fn):
+        """
+        Get the model for a key, loading it with `load_fn` if it is not loaded yet, and count a reference to it.
+
+        Args:
+            key (ModelKey): Key of the model.
+            load_fn (Callable[[], Any]): Loads the model. Only called if the model is not loaded.
+
+        Returns:
+            The model.
+        """
+        with self._lock:
+            future = self._models.get(key)
+            loader = future is None
+            if loader:
+                future = self._models[key] = Future()
+            self._refcounts[key] = self._refcounts.get(key, 0) + 1
+
+        if loader:
+            try:
+                future.set_result(load_fn())
+                logger.info(f"Loaded {key.kind} {key.model_name}")
+            except BaseException as e:
+                future.set_exception(e)
+                with self._lock:
+                    # Forget the failed load, so the next acquire tries again
+                    self._refcounts[key] -= 1
+                    if self._refcounts[key] == 0:
+                        del self._refcounts[key]
+                    if self._models.get(key) is future:
+                        del self._models[key]
+                raise
+        else:
+            logger.info(f"Reusing loaded {key.kind} {key.model_name}")
+        try:
+            return future.result()
+        except BaseException:
+            # Another thread's load failed; it already dropped the entry, only this reference is left to undo
+            with self._lock:
+                if key in self._refcounts:
+                    self._refcounts[key] -= 1
+                    if self._refcounts[key] == 0:
+                        del self._refcounts[key]
+            raise
+
+    def release(self, key: ModelKey):
+        """
+        Drop a reference to a model, unloading it once no reference is left.
+
+        Args:
+            key (ModelKey): Key the model was acquired with.
+        """
+        with self._lock:
+            if key not in self._refcounts:
+                logger.warning(f"Released {key.kind} {key.model_name}, which is not loaded")
+                return
+            self._refcounts[key] -= 1
+            if self._refcounts[key] > 0:
+                return
+            del self._refcounts[key]
+            self._models.pop(key, None)
+        logger.info(f"Unloaded {key.kind} {key.model_name}")
+        self._free_memory()
+
+    def refcount(self, key: ModelKey):
+        """
+        Returns:
+            int: Number of references to the model of a key, 0 if it is not loaded.
+        """
+        with self._lock:
+            return self._refcounts.get(key, 0)
+
+    def keys(self):
+        """
+        Returns:
+            list: Keys of the loaded models.
+        """
+        with self._lock:
+            return list(self._refcounts)
+
+    @staticmethod
+    def _free_memory():
+        # Collect the unloaded model now rather than at some later collection, and hand its GPU memory back
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+# Shared by every pipeline and vector database in the process
+MODEL_REGISTRY = ModelRegistry()
@@ -0,0 +1,2 @@
+from .server import QueryService
+from .client import QueryClient, ServiceError
@@ -0,0 +1,44 @@
+"""
+Run BetterSearch as a local HTTP/JSON service.
+
+Usage:
+    python -m bettersearch.src.service --config cpu_only.json
+    python -m bettersearch.src.service --config normal_gpu_config.json --port 8765 --max-batch-size 8 --batch-wait-ms 20
+"""
+import json
+import logging
+import argparse
+
+from .server import QueryService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default="cpu_only.json", help="BetterSearch config file.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on.")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Maximum number of questions answered together.")
+    parser.add_argument("--batch-wait-ms", type=float, default=20, help="Time to wait for more questions after the first one of a batch.")
+    parser.add_argument("--max-queue-size", type=int, default=64, help="Maximum number of waiting requests.")
+    parser.add_argument("--timeout", type=float, default=300, help="Default deadline of a request, in seconds.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    from ..pipeline import BetterSearchPipeline
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    pipeline = BetterSearchPipeline(**config)
+
+    QueryService(
+        pipeline,
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        batch_wait=args.batch_wait_ms / 1000,
+        max_queue_size=args.max_queue_size,
+        default_timeout=args.timeout,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import json
+import logging
+import threading
+import http.client
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        """
+        Error response of the BetterSearch service.
+
+        Args:
+            status (int): HTTP status code (503: queue full, 504: deadline exceeded, 500: pipeline error).
+            message (str): Error message of the service.
+        """
+        super().__init__(f"BetterSearch service error {status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class QueryClient:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8765, timeout: float = None):
+        """
+        Client of the BetterSearch service, with the same `answer` and `answer_stream` methods as
+        `BetterSearchPipeline`, so it can be used in place of a pipeline.
+
+        Args:
+            host (str): Address of the service.
+            port (int): Port of the service.
+            timeout (float): Deadline (in seconds) of every question. Defaults to the service's own default.
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _request(self, method, path, payload=None, connection_timeout=None):
+        connection = http.client.HTTPConnection(self.host, self.port, timeout=connection_timeout)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            try:
+                message = json.loads(response.read()).get("error", response.reason)
+            except ValueError:
+                message = response.reason
+            connection.close()
+            raise ServiceError(response.status, message)
+        return connection, response
+
+    def _call(self, method, path, payload=None, connection_timeout=None):
+        connection, response = self._request(method, path, payload, connection_timeout)
+        try:
+            return json.loads(response.read())
+        finally:
+            connection.close()
+
+    def health(self):
+        """
+        Returns:
+            dict: Status, whether the vector database has loaded, load times, queue depth and request counters of the service.
+        """
+        return self._call("GET", "/health", connection_timeout=10)
+
+    def cancel(self, request_id: int):
+        """
+        Cancel a queued or running request.
+
+        Args:
+            request_id (int): ID of the request.
+        """
+        self._call("POST", "/cancel", {"id": request_id}, connection_timeout=10)
+
+    def answer(self, user_question, cancel_event: threading.Event = None):
+        """
+        Answer a question. Non-streaming questions may be batched with other clients' questions.
+
+        Args:
+            user_question (str): The question posed by the user.
+            cancel_event (threading.Event): Not supported for non-streaming requests, use `answer_stream` to cancel.
+
+        Returns:
+            str: The answer.
+        """
+        return self._call("POST", "/answer", {"question": user_question, "timeout": self.timeout})["answer"]
+
+    def answer_stream(self, user_question, cancel_event: threading.Event = None):
+        """
+        Answer a question, yielding the pipeline events of `BetterSearchPipeline.answer_stream` as they arrive.
+
+        Args:
+            user_question (str): The question posed by the user.
+            cancel_event (threading.Event): When set, the service is asked to cancel the request; the "done" event
+                follows with whatever was generated so far.
+
+        Yields:
+            dict: Pipeline events.
+        """
+        connection, response = self._request("POST", "/answer", {"question": user_question, "timeout": self.timeout, "stream": True})
+        finished = threading.Event()
+        request_id = None
+
+        def watch_cancel():
+            # Tokens only arrive once the answer is generated, so cancellation cannot wait for the next event
+            while not finished.wait(0.1):
+                if cancel_event.is_set():
+                    try:
+                        self.cancel(request_id)
+                    except (OSError, ServiceError) as e:
+                        logger.error("Failed to cancel the request")
+                        logger.exception(e)
+                    return
+
+        try:
+            for line in response:
+                event = json.loads(line)
+                if event["type"] == "accepted":
+                    request_id = event["id"]
+                    if cancel_event is not None:
+                        threading.Thread(target=watch_cancel, daemon=True).start()
+                elif event["type"] == "error":
+                    raise ServiceError(500, event["error"])
+                else:
+                    yield event
+        finally:
+            finished.set()
+            connection.close()
@@ -0,0 +1,305 @@
+import json
+import time
+import asyncio
+import logging
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import tracing
+
+logger = logging.getLogger(__name__)
+
+HTTP_REASONS = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+    503: "Service Unavailable", 504: "Gateway Timeout",
+}
+
+
+class ServiceRequest:
+    def __init__(self, id: int, question: str, deadline: float, stream: bool = False):
+        """
+        A question waiting in the service queue.
+
+        Args:
+            id (int): Request ID, used to cancel the request.
+            question (str): Question posed by the user.
+            deadline (float): `time.monotonic()` time after which the answer is no longer wanted.
+            stream (bool): Stream pipeline events to the client instead of returning the answer at the end.
+        """
+        self.id = id
+        self.question = question
+        self.deadline = deadline
+        self.stream = stream
+        self.future = asyncio.get_running_loop().create_future()
+        # Pipeline events of a streaming request, ended by None
+        self.events = asyncio.Queue() if stream else None
+        self.cancel_event = threading.Event()
+
+
+class QueryService:
+    def __init__(self, pipeline, host: str = "127.0.0.1", port: int = 8765, max_batch_size: int = 8,
+                 batch_wait: float = 0.02, max_queue_size: int = 64, default_timeout: float = 300.0):
+        """
+        Local HTTP/JSON service that answers questions with one shared pipeline. Requests are queued, and questions
+        that arrive close together are answered as one micro-batch with `BetterSearchPipeline.answer_many`, so SQL
+        generation, the vector database query and answer generation all run batched.
+
+        Endpoints:
+            - POST /answer {"question": str, "timeout": float, "stream": bool}: Answer a question. Returns
+              {"id", "answer", "cancelled"}, or with "stream" newline-delimited JSON pipeline events (the first one is
+              {"type": "accepted", "id"}). Streaming requests are answered one at a time with `answer_stream`.
+            - POST /cancel {"id": int}: Cancel a queued or running request.
+            - GET /health: Whether the vector database has loaded, the load time of each component, queue depth and
+              request counters.
+            - GET /metrics: Pipeline stage latencies (empty unless the pipeline config enables "tracing_enabled").
+
+        Args:
+            pipeline (BetterSearchPipeline): Pipeline that answers the questions. Only used from one worker thread.
+            host (str): Address to listen on. The service has no authentication, keep it on localhost.
+            port (int): Port to listen on.
+            max_batch_size (int): Maximum number of questions answered together.
+            batch_wait (float): Time (in seconds) to wait for more questions after the first one of a batch.
+            max_queue_size (int): Maximum number of waiting requests, further requests get HTTP 503.
+            default_timeout (float): Deadline (in seconds) of requests that do not set a "timeout". Requests that are
+                not answered in time get HTTP 504 and are dropped from the queue.
+        """
+        self.pipeline = pipeline
+        self.host = host
+        self.port = port
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        self.max_queue_size = max_queue_size
+        self.default_timeout = default_timeout
+
+        # The pipeline is not thread-safe, every call goes through this one thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bettersearch-pipeline")
+        self.queue = None
+        self.requests = {}
+        self._ids = itertools.count(1)
+        self.stats = {"requests": 0, "answered": 0, "batches": 0, "rejected": 0, "timed_out": 0, "cancelled": 0, "failed": 0}
+
+    def run(self):
+        """
+        Run the service until interrupted.
+        """
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            logger.info("Service stopped")
+
+    async def serve(self):
+        """
+        Start listening and answering queued requests.
+        """
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        batcher = asyncio.create_task(self._batcher())
+        logger.info(f"BetterSearch service listening on http://{self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
+
+    async def _batcher(self):
+        """
+        Take requests off the queue and answer them. After the first request of a batch, more requests are collected
+        for up to `batch_wait` seconds; requests that arrive while a batch runs form the next batch.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            wait_until = loop.time() + self.batch_wait
+            while len(batch) < self.max_batch_size:
+                remaining = wait_until - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} requests failed")
+                logger.exception(e)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        questions, streams = [], []
+        for request in batch:
+            if request.cancel_event.is_set() or request.deadline <= now:
+                # Timed out or cancelled while queued
+                self._finish(request, "", cancelled=True)
+            elif request.stream:
+                streams.append(request)
+            else:
+                questions.append(request)
+
+        if questions:
+            self.stats["batches"] += 1
+            logger.info(f"Answering a batch of {len(questions)} questions")
+            try:
+                answers = await loop.run_in_executor(
+                    self.executor, self.pipeline.answer_many, [request.question for request in questions], len(questions)
+                )
+                for request, answer in zip(questions, answers):
+                    self._finish(request, answer)
+            except Exception as e:
+                logger.error(f"Failed to answer a batch of {len(questions)} questions")
+                logger.exception(e)
+                for request in questions:
+                    self._fail(request, e)
+
+        for request in streams:
+            await loop.run_in_executor(self.executor, self._stream, request, loop)
+
+    def _stream(self, request, loop):
+        """
+        Answer a streaming request on the pipeline thread, forwarding its events to the event loop.
+        """
+        def put(event):
+            loop.call_soon_threadsafe(request.events.put_nowait, event)
+
+        try:
+            for event in self.pipeline.answer_stream(request.question, cancel_event=request.cancel_event):
+                put(event)
+        except Exception as e:
+            logger.error(f"Failed to answer: {request.question}")
+            logger.exception(e)
+            put({"type": "error", "error": str(e)})
+        finally:
+            put(None)
+
+    def _finish(self, request, answer, cancelled=False):
+        if request.stream:
+            request.events.put_nowait({"type": "done", "answer": answer, "cancelled": cancelled})
+            request.events.put_nowait(None)
+        elif not request.future.done():
+            request.future.set_result((answer, cancelled))
+
+    def _fail(self, request, error):
+        if not request.future.done():
+            request.future.set_exception(error)
+
+    async def _handle_connection(self, reader, writer):
+        """
+        Read one HTTP request and write its response. Connections are closed after every response.
+        """
+        try:
+            request_line = (await reader.readline()).decode("latin-1")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            payload = json.loads(body) if body else {}
+
+            if method == "GET" and path == "/health":
+                await self._respond(writer, 200, {
+                    "status": "ok",
+                    "retrieval_ready": getattr(self.pipeline, "retrieval_ready", True),
+                    "load_times": getattr(self.pipeline, "load_times", {}),
+                    "queue_depth": self.queue.qsize(),
+                    **self.stats,
+                })
+            elif method == "GET" and path == "/metrics":
+                await self._respond(writer, 200, tracing.summary())
+            elif method == "POST" and path == "/answer":
+                await self._answer(payload, writer)
+            elif method == "POST" and path == "/cancel":
+                request = self.requests.get(payload.get("id"))
+                if request is not None:
+                    request.cancel_event.set()
+                await self._respond(writer, 200, {"cancelled": request is not None})
+            else:
+                await self._respond(writer, 404, {"error": f"Unknown endpoint: {method} {path}"})
+        except (ValueError, AttributeError, asyncio.IncompleteReadError) as e:
+            await self._respond(writer, 400, {"error": f"Malformed request: {e}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _answer(self, payload, writer):
+        question = payload.get("question")
+        if not isinstance(question, str) or not question.strip():
+            await self._respond(writer, 400, {"error": "'question' must be a non-empty string"})
+            return
+        timeout = float(payload.get("timeout") or self.default_timeout)
+        request = ServiceRequest(next(self._ids), question, time.monotonic() + timeout, stream=bool(payload.get("stream")))
+        try:
+            self.queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            await self._respond(writer, 503, {"error": f"Too many queued requests ({self.max_queue_size})"})
+            return
+        self.stats["requests"] += 1
+        self.requests[request.id] = request
+        try:
+            if request.stream:
+                await self._stream_response(request, timeout, writer)
+            else:
+                await self._answer_response(request, timeout, writer)
+        finally:
+            del self.requests[request.id]
+
+    async def _answer_response(self, request, timeout, writer):
+        try:
+            answer, cancelled = await asyncio.wait_for(asyncio.shield(request.future), timeout)
+        except asyncio.TimeoutError:
+            request.cancel_event.set()
+            self.stats["timed_out"] += 1
+            await self._respond(writer, 504, {"id": request.id, "error": f"No answer within {timeout:.1f}s"})
+            return
+        except Exception as e:
+            self.stats["failed"] += 1
+            await self._respond(writer, 500, {"id": request.id, "error": str(e)})
+            return
+        cancelled = cancelled or request.cancel_event.is_set()
+        self.stats["cancelled" if cancelled else "answered"] += 1
+        await self._respond(writer, 200, {"id": request.id, "answer": answer, "cancelled": cancelled})
+
+    async def _stream_response(self, request, timeout, writer):
+        writer.write(self._headers(200, "application/x-ndjson"))
+        writer.write(json.dumps({"type": "accepted", "id": request.id}).encode("utf-8") + b"\n")
+        try:
+            while True:
+                remaining = request.deadline - time.monotonic()
+                try:
+                    event = await asyncio.wait_for(request.events.get(), remaining) if not request.cancel_event.is_set() \
+                        else await request.events.get()
+                except asyncio.TimeoutError:
+                    # Past the deadline generation is cancelled, the "done" event still follows
+                    request.cancel_event.set()
+                    self.stats["timed_out"] += 1
+                    continue
+                if event is None:
+                    break
+                if event["type"] == "done":
+                    self.stats["cancelled" if event["cancelled"] else "answered"] += 1
+                elif event["type"] == "error":
+                    self.stats["failed"] += 1
+                writer.write(json.dumps(event).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            # The client went away
+            request.cancel_event.set()
+
+    def _headers(self, status, content_type, content_length=None):
+        headers = f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Type: {content_type}\r\nConnection: close\r\n"
+        if content_length is not None:
+            headers += f"Content-Length: {content_length}\r\n"
+        return (headers + "\r\n").encode("latin-1")
+
+    async def _respond(self, writer, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        writer.write(self._headers(status, "application/json", len(body)) + body)
+        await writer.drain()
@@ -0,0 +1,209 @@
+import json
+import time
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+# Number of most recent values kept per stage and attribute for the percentiles
+RESERVOIR_SIZE = 10000
+
+_enabled = False
+_lock = threading.Lock()
+# Stage -> recent durations (in seconds)
+_durations = defaultdict(lambda: deque(maxlen=RESERVOIR_SIZE))
+_counts = defaultdict(int)
+# Stage -> sum of all durations (in seconds), not limited to the reservoir
+_totals = defaultdict(float)
+# (stage, attribute) -> recent numeric values
+_values = defaultdict(lambda: deque(maxlen=RESERVOIR_SIZE))
+# (stage, attribute) -> value -> count, for text and boolean attributes such as the branch taken
+_labels = defaultdict(lambda: defaultdict(int))
+_metrics_server = None
+
+
+def enable(enabled: bool = True):
+    """
+    Turn tracing on or off. While it is off, `span` returns a shared no-op span and nothing is recorded.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+class Span:
+    __slots__ = ("name", "attributes", "start")
+
+    def __init__(self, name, attributes):
+        """
+        Timed pipeline stage. Its duration and attributes are recorded when it ends.
+
+        Args:
+            name (str): Stage name, e.g. "pipeline.sql_generation".
+            attributes (dict): Initial attributes. Numbers (e.g. token or row counts) get percentiles, other values
+                (e.g. the branch taken) are counted. A "tokens_out" attribute also adds "tokens_per_s".
+        """
+        self.name = name
+        self.attributes = attributes
+        self.start = None
+
+    def set(self, **attributes):
+        """
+        Add or update attributes of the span.
+        """
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _record(self.name, duration, self.attributes)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, **attributes):
+    """
+    Time a pipeline stage:
+
+        with tracing.span("index.sql_query") as s:
+            ...
+            s.set(branch="sql", rows=len(rows))
+
+    Args:
+        name (str): Stage name.
+        **attributes: Initial attributes of the span.
+
+    Returns:
+        Span: The span, or a no-op span if tracing is disabled.
+    """
+    if not _enabled:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def record(name: str, duration: float, **attributes):
+    """
+    Record a stage whose duration was measured elsewhere. Does nothing if tracing is disabled.
+
+    Args:
+        name (str): Stage name.
+        duration (float): Duration in seconds.
+        **attributes: Attributes of the stage.
+    """
+    if _enabled:
+        _record(name, duration, attributes)
+
+
+def _record(name, duration, attributes):
+    if attributes.get("tokens_out") and duration > 0:
+        attributes["tokens_per_s"] = attributes["tokens_out"] / duration
+    with _lock:
+        _durations[name].append(duration)
+        _counts[name] += 1
+        _totals[name] += duration
+        for key, value in attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                _values[(name, key)].append(value)
+            elif value is not None:
+                _labels[(name, key)][str(value)] += 1
+    logger.debug(f"{name}: {duration * 1000:.1f} ms {attributes}")
+
+
+def _percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    def percentile(q):
+        return values[min(len(values) - 1, int(q * len(values)))]
+    return {"mean": sum(values) / len(values), "p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99), "max": values[-1]}
+
+
+def summary():
+    """
+    Get the recorded statistics of every stage.
+
+    Returns:
+        dict: Stage name -> {"count", "total_ms", "duration_ms": {"mean", "p50", "p95", "p99", "max"}, "values":
+            {attribute: percentiles}, "labels": {attribute: {value: count}}}. Percentiles are over the last
+            `RESERVOIR_SIZE` spans, "count" and "total_ms" over all of them.
+    """
+    with _lock:
+        stages = {}
+        for name, durations in _durations.items():
+            stages[name] = {
+                "count": _counts[name],
+                "total_ms": _totals[name] * 1000,
+                "duration_ms": {key: value * 1000 for key, value in _percentiles(durations).items()},
+                "values": {key: _percentiles(values) for (stage, key), values in _values.items() if stage == name},
+                "labels": {key: dict(counts) for (stage, key), counts in _labels.items() if stage == name},
+            }
+        return stages
+
+
+def reset():
+    """
+    Clear all recorded statistics.
+    """
+    with _lock:
+        _durations.clear()
+        _counts.clear()
+        _totals.clear()
+        _values.clear()
+        _labels.clear()
+
+
+def start_metrics_server(host: str = "127.0.0.1", port: int = 9464):
+    """
+    Serve `summary()` as JSON on http://host:port/metrics from a background thread. Calling it again does nothing.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+    """
+    global _metrics_server
+    if _metrics_server is not None:
+        return
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = json.dumps(summary(), indent=2).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+    logger.info(f"Pipeline metrics available on http://{host}:{port}/metrics")